@@ -0,0 +1,111 @@
+"""
+Measures the throughput of the KISS deframing and AX.25 parsing that is applied to the direwolf output.
+
+Compares the previous byte-by-byte path (one recv(1) and one deframer call per byte) with the bulk path (one call
+per 4096 byte chunk). A capture of the direwolf KISS port can be replayed, e.g. one recorded with
+
+    nc localhost <kiss port> > capture.kiss
+
+If no capture is given, one is generated from a few typical APRS packets.
+
+    python3 -m benchmark.kiss [capture] [iterations]
+"""
+
+from owrx.kiss import KissDeframer, FEND, FESC, TFEND, TFESC
+from owrx.aprs import Ax25Parser
+import time
+import sys
+
+
+class ByteDeframer(object):
+    """
+    the previous per-byte state machine, for comparison
+    """
+
+    def __init__(self):
+        self.escaped = False
+        self.buf = bytearray()
+
+    def parse(self, input):
+        frames = []
+        for b in input:
+            if b == FESC:
+                self.escaped = True
+            elif self.escaped:
+                if b == TFEND:
+                    self.buf.append(FEND)
+                elif b == TFESC:
+                    self.buf.append(FESC)
+                self.escaped = False
+            elif b == FEND:
+                if len(self.buf) > 1 and self.buf[0] == 0x00:
+                    frames += [self.buf[1:]]
+                self.buf = bytearray()
+            else:
+                self.buf.append(b)
+        return frames
+
+
+def encodeCallsign(callsign, last=False):
+    (call, _, ssid) = callsign.partition("-")
+    ssid = int(ssid) if ssid else 0
+    return bytes([ord(c) << 1 for c in call.ljust(6)]) + bytes([0x60 | ssid << 1 | (1 if last else 0)])
+
+
+def encodeFrame(source, destination, path, info):
+    calls = [destination, source] + path
+    ax25 = b"".join(encodeCallsign(c, i == len(calls) - 1) for i, c in enumerate(calls))
+    ax25 += bytes([0x03, 0xF0]) + info
+    escaped = ax25.replace(bytes([FESC]), bytes([FESC, TFESC])).replace(bytes([FEND]), bytes([FESC, TFEND]))
+    return bytes([FEND, 0x00]) + escaped + bytes([FEND])
+
+
+def generateCapture(count=5000):
+    packets = [
+        ("DD5JFK-9", "APRS", ["WIDE1-1", "WIDE2-1"], b"!4903.50N/07201.75W-Test 001234"),
+        ("N0CALL-7", "T2QT4Y", ["WIDE1-1"], b"`(_fn\"Oj/]\"4-}=\r"),
+        ("WX0STN", "APRS", ["TCPIP"], b"_10090556c220s004g005t077r000p000P000h50b09900wRSW"),
+        # contains bytes that need escaping
+        ("ESC-1", "APRS", [], bytes([FEND, FESC]) * 8 + b"escaped"),
+    ]
+    frames = [encodeFrame(*p) for p in packets]
+    return b"".join(frames[i % len(frames)] for i in range(count))
+
+
+def run(deframer, capture, chunk_size, parser):
+    frames = 0
+    start = time.perf_counter()
+    for i in range(0, len(capture), chunk_size):
+        for frame in deframer.parse(capture[i : i + chunk_size]):
+            parser.parse(frame)
+            frames += 1
+    return frames, time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    if args and not args[0].isdigit():
+        with open(args.pop(0), "rb") as f:
+            capture = f.read()
+    else:
+        capture = generateCapture()
+    iterations = int(args[0]) if args else 5
+    parser = Ax25Parser()
+
+    print("capture: {0} bytes".format(len(capture)))
+    for (name, deframer_cls, chunk_size) in [
+        ("per byte (previous)", ByteDeframer, 1),
+        ("bulk", KissDeframer, 4096),
+    ]:
+        results = [run(deframer_cls(), capture, chunk_size, parser) for _ in range(iterations)]
+        frames = results[0][0]
+        best = min(r[1] for r in results)
+        print(
+            "{name:20s} {frames} frames, best of {n}: {t:.1f} ms ({rate:.1f} MB/s)".format(
+                name=name, frames=frames, n=iterations, t=best * 1000, rate=len(capture) / best / 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures how long it takes until audio flows again after the demodulator has been switched.
+
+Compares a full restart of the csdr chain (the way mode switches used to be handled) with replacing only the
+demodulator part of the chain. Requires csdr and nmux to be installed; random data is used as IQ input.
+
+    python3 -m benchmark.mode_switch [iterations]
+"""
+
+from csdr import csdr
+from owrx.socket import getAvailablePort
+import subprocess
+import threading
+import signal
+import time
+import sys
+import os
+
+
+class AudioWatcher(csdr.output):
+    def __init__(self):
+        self.event = threading.Event()
+        self.generation = 0
+
+    def supports_type(self, t):
+        return t in ["audio", "smeter"]
+
+    def receive_output(self, t, read_fn):
+        if t == "audio":
+            # only audio from the most recently started demodulator counts
+            self.generation += 1
+        generation = self.generation
+
+        def write(data):
+            if t == "audio" and generation == self.generation:
+                self.event.set()
+
+        self.pump(read_fn, write)
+
+    def wait(self):
+        self.event.clear()
+        start = time.monotonic()
+        if not self.event.wait(10):
+            raise TimeoutError("no audio after switching demodulator")
+        return time.monotonic() - start
+
+
+def measure(dsp, watcher, switch, iterations):
+    results = []
+    modes = ["am", "nfm"]
+    for i in range(0, iterations):
+        watcher.event.clear()
+        start = time.monotonic()
+        switch(modes[i % 2])
+        watcher.event.wait(10)
+        results.append(time.monotonic() - start)
+    return results
+
+
+def report(name, results):
+    results = sorted(results)
+    print(
+        "{name}: median {median:.1f} ms, min {min:.1f} ms, max {max:.1f} ms".format(
+            name=name,
+            median=results[len(results) // 2] * 1000,
+            min=results[0] * 1000,
+            max=results[-1] * 1000,
+        )
+    )
+
+
+def main(iterations):
+    port = getAvailablePort()
+    source = subprocess.Popen(
+        "cat /dev/urandom | csdr convert_u8_f | nmux --bufsize 65536 --bufcnt 100 --port {port} --address 127.0.0.1".format(
+            port=port
+        ),
+        shell=True,
+        start_new_session=True,
+    )
+    time.sleep(1)
+
+    watcher = AudioWatcher()
+    dsp = csdr.dsp(watcher)
+    dsp.nc_port = port
+    dsp.set_samp_rate(2400000)
+    dsp.set_output_rate(12000)
+    dsp.start()
+    watcher.wait()
+
+    def full_restart(mode):
+        dsp.demodulator = mode
+        dsp.calculate_decimation()
+        dsp.restart()
+
+    try:
+        report("full restart", measure(dsp, watcher, full_restart, iterations))
+        report("demodulator swap", measure(dsp, watcher, dsp.set_demodulator, iterations))
+    finally:
+        dsp.stop()
+        os.killpg(os.getpgid(source.pid), signal.SIGTERM)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,124 @@
+"""
+Compares the audio resampling stages at the end of the demodulator chains: the previous sox stage, the csdr rational
+resampler followed by convert_f_s16 and the numpy worker's resampler (if numpy is available).
+
+For every stage, a minute of float audio is pushed through the process as fast as possible to measure the CPU time
+(user + system of the child processes), and then fed in real time in 20ms chunks to measure the latency until the
+first output arrives.
+
+    python3 -m benchmark.resampler [input rate] [output rate]
+"""
+
+from fractions import Fraction
+import subprocess
+import resource
+import struct
+import select
+import math
+import time
+import sys
+import os
+
+
+def sox(input_rate, output_rate):
+    return (
+        "sox -t raw -r {0} -e floating-point -b 32 -c 1 --buffer 32 - "
+        "-t raw -r {1} -e signed-integer -b 16 -c 1 -".format(input_rate, output_rate)
+    )
+
+
+def rational(input_rate, output_rate):
+    ratio = Fraction(output_rate, input_rate)
+    return (
+        "CSDR_FIXED_BUFSIZE=128 csdr rational_resampler_ff {0} {1} {2} | "
+        "CSDR_FIXED_BUFSIZE=32 csdr convert_f_s16".format(
+            ratio.numerator, ratio.denominator, 0.15 / max(ratio.numerator, ratio.denominator)
+        )
+    )
+
+
+def generate(samp_rate, duration):
+    count = int(samp_rate * duration)
+    return struct.pack("<{0}f".format(count), *(0.5 * math.sin(2 * math.pi * 440 * i / samp_rate) for i in range(count)))
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure_cpu(command, data):
+    before = children_cpu()
+    start = time.perf_counter()
+    output = subprocess.run(command, shell=True, input=data, stdout=subprocess.PIPE).stdout
+    return children_cpu() - before, time.perf_counter() - start, len(output)
+
+
+def measure_latency(command, input_rate):
+    process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+    chunk = generate(input_rate, 0.02)
+    start = time.perf_counter()
+    latency = None
+    try:
+        for i in range(100):
+            process.stdin.write(chunk)
+            (readable, _, _) = select.select([process.stdout], [], [], 0.02)
+            if readable:
+                os.read(process.stdout.fileno(), 65536)
+                latency = time.perf_counter() - start
+                break
+            time.sleep(max(0, start + (i + 1) * 0.02 - time.perf_counter()))
+    finally:
+        process.stdin.close()
+        process.kill()
+        process.wait()
+    return latency
+
+
+def measure_numpy(input_rate, output_rate, data):
+    import numpy as np
+    from csdr.numpy_dsp import RationalResampler
+
+    resampler = RationalResampler.fromRates(input_rate, output_rate)
+    samples = np.frombuffer(data, dtype="<f4").astype(np.float64)
+    start = time.process_time()
+    length = sum(len(resampler.process(samples[i : i + 8192])) for i in range(0, len(samples), 8192))
+    return time.process_time() - start, length
+
+
+def main():
+    input_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    output_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 12000
+    duration = 60
+    data = generate(input_rate, duration)
+
+    print("{0} Hz -> {1} Hz, {2} seconds of audio".format(input_rate, output_rate, duration))
+    for (name, command) in [("sox (previous)", sox), ("csdr rational", rational)]:
+        cmd = command(input_rate, output_rate)
+        (cpu, wall, length) = measure_cpu(cmd, data)
+        if not length:
+            print("{0:16s} failed, is it installed?".format(name))
+            continue
+        latency = measure_latency(cmd, input_rate)
+        print(
+            "{name:16s} cpu {cpu:.3f}s ({load:.2f}% of realtime), {samples} samples, first output after {latency}".format(
+                name=name,
+                cpu=cpu,
+                load=cpu / duration * 100,
+                samples=length // 2,
+                latency="{0:.1f}ms".format(latency * 1000) if latency is not None else "> 2s",
+            )
+        )
+    try:
+        (cpu, length) = measure_numpy(input_rate, output_rate, data)
+        print(
+            "{name:16s} cpu {cpu:.3f}s ({load:.2f}% of realtime), {samples} samples".format(
+                name="numpy rational", cpu=cpu, load=cpu / duration * 100, samples=length
+            )
+        )
+    except ImportError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -76,6 +76,14 @@ fft_voverlap_factor = (
 audio_compression = "adpcm"  # valid values: "adpcm", "none"
 fft_compression = "adpcm"  # valid values: "adpcm", "none"
 
+# compression of websocket messages (permessage-deflate) for browsers that support it. the zlib level from 1 (fastest)
+# to 9 (smallest), or None to disable it.
+websocket_compression_level = 6
+# message types that are sent uncompressed. valid values: "audio", "control", "secondary_fft", "waterfall"
+# adpcm compressed audio and waterfall data does not get any smaller; consider compressing the waterfall (and the
+# secondary fft) if fft_compression is "none".
+websocket_compression_exclude = ["audio", "secondary_fft", "waterfall"]
+
 digimodes_enable = True  # Decoding digimodes come with higher CPU usage.
 digimodes_fft_size = 1024
 
@@ -103,7 +111,8 @@ Note: if you experience audio underruns while CPU usage is 100%, you can:
 
 # Currently supported types of sdr receivers:
 # "rtl_sdr", "rtl_sdr_soapy", "sdrplay", "hackrf", "airspy", "airspyhf", "fifi_sdr",
-# "perseussdr", "lime_sdr", "pluto_sdr", "soapy_remote"
+# "perseussdr", "lime_sdr", "pluto_sdr", "soapy_remote", "signal_generator",
+# "file"
 #
 # In order to use rtl_sdr, you will need to install librtlsdr-dev and the connector.
 # In order to use sdrplay, airspy or airspyhf, you will need to install soapysdr, the corresponding driver, and the
@@ -118,6 +127,49 @@ Note: if you experience audio underruns while CPU usage is 100%, you can:
 # and do the proper changes to the sdrs object below
 # (see also Wiki in https://github.com/jketterl/openwebrx/wiki/Sample-configuration-for-Perseus-HF-receiver).
 #
+# The "signal_generator" type does not need any hardware. It generates test signals and noise (requires numpy) and can
+# be used to try out or load test a setup. Signals are "carrier", "nfm", "am", "usb", "lsb" or "file" (a 16 bit wave
+# file that is played back with the given modulation, optionally every "interval" seconds):
+#
+#    "generator": {
+#        "name": "Signal generator",
+#        "type": "signal_generator",
+#        "profiles": {
+#            "2m": {
+#                "name": "2m test signals",
+#                "center_freq": 145000000,
+#                "samp_rate": 2400000,
+#                "start_freq": 145500000,
+#                "start_mod": "nfm",
+#                "noise_level": -90,
+#                "signals": [
+#                    {"type": "nfm", "frequency": 145500000, "level": -40, "tone": 1000},
+#                    {"type": "am", "frequency": 144800000, "level": -50},
+#                    {"type": "file", "frequency": 144174000, "mod": "usb", "file": "ft8.wav", "interval": 15},
+#                ],
+#            },
+#        },
+#    },
+#
+# The "file" type plays back IQ recordings. SigMF recordings (cu8, ci8, ci16_le and cf32_le) bring their sample rate,
+# center frequency and format along; for raw files, "samp_rate", "center_freq" and "format" ("cu8", "cs8", "cs16" or
+# "cf32") have to be set. "seek" starts the playback at a position in seconds, "playback_speed" plays faster than
+# real time (0 for as fast as possible), and "loop" starts over at the end of the recording:
+#
+#    "recording": {
+#        "name": "Recording",
+#        "type": "file",
+#        "file": "/path/to/recording.sigmf-meta",
+#        "loop": True,
+#        "profiles": {
+#            "default": {
+#                "name": "Recording",
+#                "start_freq": 144800000,
+#                "start_mod": "nfm",
+#            },
+#        },
+#    },
+#
 
 sdrs = {
     "rtlsdr": {
@@ -275,8 +327,34 @@ waterfall_auto_level_margin = {"min": 5, "max": 40}
 csdr_dynamic_bufsize = False  # This allows you to change the buffering mode of csdr.
 csdr_print_bufsizes = False  # This prints the buffer sizes used for csdr processes.
 csdr_through = False  # Setting this True will print out how much data is going into the DSP chains.
+# Setting this True will run csdr's FFT-based fastddc once per SDR and let every client only run the inverse
+# stage at its decimated rate instead of a full-rate shift and decimation. This saves a lot of CPU with many users.
+channelizer_enabled = False
+# Setting this to "numpy" will process the analog modes (nfm, am, ssb) in a single numpy worker process per user
+# instead of a chain of csdr processes. Requires numpy; all other modes are still processed by csdr.
+dsp_backend = "csdr"  # valid values: "csdr", "numpy"
+# Number of DSP chains that are kept running per SDR while it is in use, so new users get audio without waiting for
+# the chain to start up. This is opt-in: every chain in the pool uses about as much CPU as a listening user, even when
+# nobody new connects. 0 (the default) disables the pool.
+dsp_pool_size = 0
+# Part of the total CPU capacity (all cores) that the DSP chains may use, e.g. 0.9. New listeners and background
+# services are rejected, and the secondary FFT and waterfall frame rates are reduced, when their estimated cost would
+# exceed it. The estimates are based on the measured usage of the running chains. None (the default) disables the
+# admission control.
+cpu_budget = None
 
 nmux_memory = 50  # in megabytes. This sets the approximate size of the circular buffer used by nmux.
+# How the IQ data is distributed to the DSP chains. "nmux" gives every chain its own TCP connection, "shm" feeds a
+# ring buffer in shared memory (/dev/shm) once and lets all chains read from there. Uses the nmux_memory size.
+# "shm" is experimental: csdr chains still read through one relay process each, only the numpy backend (see
+# dsp_backend) maps the ring directly.
+iq_transport = "nmux"  # valid values: "nmux", "shm"
+# Keeps the last minutes of the IQ data of every running SDR in a ring file on disk, so that signals can be saved as
+# narrowband SigMF recordings after the fact (POST to /admin/timeshift/snapshot, see /admin/timeshift.json for what is
+# available). Takes 8 bytes per sample, i.e. about 1.2 GB per minute at 2.4 MS/s. Can also be set per SDR.
+time_shift = None  # in minutes. None disables the time shift.
+# where the ring files and the snapshots go. defaults to the temporary_directory
+time_shift_directory = None
 
 google_maps_api_key = ""
 
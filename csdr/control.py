@@ -0,0 +1,57 @@
+"""
+Framing for the control socket between a dsp and its worker process
+
+    Every frame is a one byte type, a two byte payload length (network byte order) and the payload. Commands (dsp to
+    worker) and s-meter events carry a list of doubles.
+"""
+
+import struct
+
+SHIFT = 0x01
+BPF = 0x02
+SQUELCH = 0x03
+
+SMETER = 0x81
+
+header = struct.Struct("!BH")
+
+# the names of the control pipes that each command replaces
+commands = {
+    "shift_pipe": SHIFT,
+    "bpf_pipe": BPF,
+    "squelch_pipe": SQUELCH,
+}
+
+
+def encode(frame_type, payload):
+    return header.pack(frame_type, len(payload)) + payload
+
+
+def encode_values(frame_type, values):
+    return encode(frame_type, struct.pack("!{0}d".format(len(values)), *values))
+
+
+def decode_values(payload):
+    return list(struct.unpack("!{0}d".format(len(payload) // 8), payload))
+
+
+class FrameDecoder(object):
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        returns a list of (type, payload) for all frames that are complete
+        """
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= header.size:
+            (frame_type, length) = header.unpack_from(self.buffer, offset)
+            end = offset + header.size + length
+            if end > len(self.buffer):
+                break
+            frames.append((frame_type, bytes(self.buffer[offset + header.size : end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
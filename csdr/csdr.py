@@ -22,13 +22,22 @@ OpenWebRX csdr plugin: do the signal processing with csdr
 """
 
 import subprocess
+import socket
 import os
 import signal
 import threading
 import math
-from functools import partial
+import time
+import sys
+from fractions import Fraction
+from csdr.decimation import DecimationPlanner
+from csdr import control
 
 from owrx.kiss import KissClient, DirewolfConfig
+from csdr.ringbuffer import RingBuffer
+from owrx.reactor import Reactor, Reader, FixedSizeReader, LineReader, ChunkReader, BatchingReader
+from owrx.metrics import Metrics, LatencyMetric, CounterMetric
+from owrx.supervisor import Supervisor
 from owrx.wsjt import Ft8Chopper, WsprChopper, Jt9Chopper, Jt65Chopper, Ft4Chopper
 
 import logging
@@ -41,7 +50,7 @@ class output(object):
         if not self.supports_type(t):
             # TODO rewrite the output mechanism in a way that avoids producing unnecessary data
             logger.warning("dumping output of type %s since it is not supported.", t)
-            threading.Thread(target=self.pump(read_fn, lambda x: None)).start()
+            self.pump(read_fn, lambda x: None)
             return
         self.receive_output(t, read_fn)
 
@@ -49,6 +58,14 @@ class output(object):
         pass
 
     def pump(self, read, write):
+        """
+        forward everything from read to write. Readers are handled by the shared reactor; plain read functions (i.e.
+        sources that don't have a file descriptor that could be polled) still get a thread of their own.
+        """
+        if isinstance(read, Reader):
+            Reactor.getSharedInstance().register(read, write)
+            return
+
         def copy():
             run = True
             while run:
@@ -58,7 +75,7 @@ class output(object):
                 else:
                     write(data)
 
-        return copy
+        threading.Thread(target=copy).start()
 
     def supports_type(self, t):
         return True
@@ -76,7 +93,7 @@ class Pipe(object):
         elif t == Pipe.WRITE:
             return WritingPipe(path, encoding=encoding)
         elif t == Pipe.NONE:
-            return Pipe(path, None, encoding=encoding)
+            return AnchoredPipe(path, encoding=encoding)
 
     def __init__(self, path, direction, encoding=None):
         self.path = path
@@ -97,9 +114,9 @@ class Pipe(object):
             return
         try:
             self.file.close()
+            self.file = None
             os.unlink(self.path)
         except FileNotFoundError:
-            # it seems like we keep calling this twice. no idea why, but we don't need the resulting error.
             pass
         except Exception:
             logger.exception("Pipe.close()")
@@ -109,54 +126,196 @@ class Pipe(object):
 
 
 class WritingPipe(Pipe):
+    """
+    opened read-write, which never blocks on a fifo (no need to wait for the reading process in a separate thread).
+    whatever is written before the reading process is up stays in the pipe buffer until it opens its end; we never
+    read from it ourselves.
+    """
+
     def __init__(self, path, encoding=None):
-        self.queue = []
-        self.queueLock = threading.Lock()
         super().__init__(path, "w", encoding=encoding)
+        self.fd = None
         self.open()
 
-    def open_and_dequeue(self):
-        super().open()
-        with self.queueLock:
-            for i in self.queue:
-                self.file.write(i)
-            self.file.flush()
-            self.queue = None
-
     def open(self):
-        threading.Thread(target=self.open_and_dequeue).start()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
 
     def write(self, data):
-        if self.file is None:
-            with self.queueLock:
-                self.queue.append(data)
+        if self.fd is None:
             return
-        r = self.file.write(data)
-        self.file.flush()
-        return r
+        if isinstance(data, str):
+            data = data.encode(self.encoding or "utf-8")
+        try:
+            return os.write(self.fd, data)
+        except BlockingIOError:
+            logger.warning("control pipe %s is full, dropping data", self.path)
 
     def close(self):
-        if self.file is None:
-            logger.warning("queue %s never successfully opened - thread leak!", self.path)
-        super().close()
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AnchoredPipe(Pipe):
+    """
+    a pipe between two external processes. we keep a reading end open without ever reading from it, so the reading
+    process can be replaced without the writing process receiving a SIGPIPE in between.
+    """
+
+    def __init__(self, path, encoding=None):
+        super().__init__(path, None, encoding=encoding)
+        self.anchor = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def close(self):
+        if self.anchor is None:
+            return
+        os.close(self.anchor)
+        self.anchor = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
 
 
 class ReadingPipe(Pipe):
+    """
+    the reading end is opened non-blocking, so it can be handed to the reactor before the writing process is up.
+    """
+
     def __init__(self, path, encoding=None):
         super().__init__(path, "r", encoding=encoding)
+        self.fd = None
 
-    def read(self):
-        if self.file is None:
-            self.open()
-        return self.file.read()
+    def open(self):
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
 
-    def readline(self):
-        if self.file is None:
+    def fileno(self):
+        if self.fd is None:
             self.open()
-        return self.file.readline()
+        return self.fd
+
+    def close(self):
+        if self.fd is None:
+            return
+        Reactor.getSharedInstance().unregister(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ControlSocketReader(Reader):
+    """
+    reads the events a worker sends back over its control socket, and passes on the values of one event type
+    """
+
+    def __init__(self, source, frame_type=control.SMETER):
+        self.frame_type = frame_type
+        self.decoder = control.FrameDecoder()
+        super().__init__(source)
+
+    def frames(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        values = []
+        for (frame_type, payload) in self.decoder.feed(data):
+            if frame_type != self.frame_type:
+                continue
+            values += control.decode_values(payload)
+        return values
+
+
+class ControlChannel(object):
+    """
+    coalesces the writes to the control pipes of a dsp: only the latest value per pipe is kept, and pending values are
+    written at most once per control period, on the reactor thread. a pending write never waits for a restart of the
+    chain; it is retried after the restart instead.
+    """
+
+    creationLock = threading.Lock()
+    latency = None
+    coalesced = None
+
+    @staticmethod
+    def getMetrics():
+        with ControlChannel.creationLock:
+            if ControlChannel.latency is None:
+                ControlChannel.latency = LatencyMetric()
+                ControlChannel.coalesced = CounterMetric()
+                metrics = Metrics.getSharedInstance()
+                metrics.addMetric("csdr.control.latency", ControlChannel.latency)
+                metrics.addMetric("csdr.control.coalesced", ControlChannel.coalesced)
+        return ControlChannel.latency, ControlChannel.coalesced
+
+    def __init__(self, dsp):
+        self.dsp = dsp
+        self.lock = threading.Lock()
+        self.pending = {}
+        # the dsp couldn't write everything during the last flush
+        self.backlogged = False
+        # when the oldest pending value came in
+        self.since = None
+        self.timer = None
+        self.lastFlush = 0
+        (self.latency, self.coalesced) = ControlChannel.getMetrics()
+
+    def write(self, pipe_name, *values):
+        with self.lock:
+            if pipe_name in self.pending:
+                self.coalesced.inc()
+            self.pending[pipe_name] = values
+            if self.since is None:
+                self.since = time.monotonic()
+            if self.timer is not None:
+                return
+            delay = max(0, self.lastFlush + self.dsp.get_control_period() - time.monotonic())
+            self.timer = Reactor.getSharedInstance().callLater(delay, self.flush)
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending and not self.backlogged:
+                return
+            if not self.dsp.modification_lock.acquire(blocking=False):
+                # the chain is being (re)started; try again afterwards
+                self.timer = Reactor.getSharedInstance().callLater(self.dsp.get_control_period(), self.flush)
+                return
+            (pending, self.pending) = (self.pending, {})
+            (since, self.since) = (self.since, None)
+            self.lastFlush = time.monotonic()
+        backlogged = False
+        try:
+            for (pipe_name, values) in pending.items():
+                if self.dsp.running:
+                    self.dsp.send_control(pipe_name, values)
+            backlogged = self.dsp.running and not self.dsp.flush_control()
+        except Exception:
+            logger.exception("error while writing to control pipe")
+        finally:
+            self.dsp.modification_lock.release()
+        with self.lock:
+            self.backlogged = backlogged
+            if backlogged and self.timer is None:
+                # the worker hasn't read its commands yet, try again without waiting for the next write
+                self.timer = Reactor.getSharedInstance().callLater(self.dsp.get_control_period(), self.flush)
+        if since is not None:
+            self.latency.add(time.monotonic() - since)
 
 
 class dsp(object):
+    # upper limit for the interpolation and decimation factors of the rational resampler (the filter length grows
+    # linearly with them)
+    max_resampler_factor = 1024
+
     def __init__(self, output):
         self.samp_rate = 250000
         self.output_rate = 11025
@@ -169,6 +328,8 @@ class dsp(object):
         self.bpf_transition_bw = 320  # Hz, and this is a constant
         self.ddc_transition_bw_rate = 0.15  # of the IF sample rate
         self.running = False
+        # number of full restarts, e.g. to tell whether a pooled chain could be reused as it was
+        self.restarts = 0
         self.secondary_processes_running = False
         self.audio_compression = "none"
         self.fft_compression = "none"
@@ -177,7 +338,12 @@ class dsp(object):
         self.base_bufsize = 512
         self.decimation = None
         self.last_decimation = None
+        self.decimation_plan = None
         self.nc_port = None
+        self.ringbuffer_path = None
+        self.fastddc_port = None
+        self.fastddc_decimation = None
+        self.fastddc_offset = 0
         self.csdr_dynamic_bufsize = False
         self.csdr_print_bufsizes = False
         self.csdr_through = False
@@ -194,9 +360,11 @@ class dsp(object):
             "shift_pipe": Pipe.WRITE,
             "squelch_pipe": Pipe.WRITE,
             "smeter_pipe": Pipe.READ,
-            "meta_pipe": Pipe.READ,
             "iqtee_pipe": Pipe.NONE,
             "iqtee2_pipe": Pipe.NONE,
+        }
+        self.demodulator_pipe_names = {
+            "meta_pipe": Pipe.READ,
             "dmr_control_pipe": Pipe.WRITE,
         }
         self.pipes = {}
@@ -204,6 +372,15 @@ class dsp(object):
         self.secondary_offset_freq = 1000
         self.unvoiced_quality = 1
         self.modification_lock = threading.Lock()
+        self.control = ControlChannel(self)
+        self.control_socket = None
+        # what the control socket didn't take yet; it is sent ahead of the next command
+        self.control_backlog = b""
+        self.control_congested = False
+        self.supervision = Supervisor.getSharedInstance().supervise("dsp")
+        self.secondary_supervision = Supervisor.getSharedInstance().supervise("secondary")
+        self.owner = "dsp"
+        self.restart_timer = None
         self.output = output
 
         self.temporary_directory = None
@@ -214,6 +391,11 @@ class dsp(object):
         self.direwolf_config = None
         self.direwolf_port = None
         self.process = None
+        self.front_command = None
+        self.demodulator_process = None
+        self.demodulator_command = None
+        self.demodulator_input = None
+        self.backend = "csdr"
 
     def set_service(self, flag=True):
         self.is_service = flag
@@ -222,13 +404,22 @@ class dsp(object):
         self.temporary_directory = what
         self.pipe_base_path = "{tmp_dir}/openwebrx_pipe_{myid}_".format(tmp_dir=self.temporary_directory, myid=id(self))
 
-    def chain(self, which):
-        chain = ["nc -v 127.0.0.1 {nc_port}"]
+    def input_chain(self, which):
+        if self.fastddc_decimation is not None and which != "fft":
+            chain = ["nc -v 127.0.0.1 {fastddc_port}"]
+        elif self.ringbuffer_path is not None:
+            chain = [RingBuffer.getReaderCommand("{ringbuffer_path}")]
+        else:
+            chain = ["nc -v 127.0.0.1 {nc_port}"]
         if self.csdr_dynamic_bufsize:
             chain += ["csdr setbuf {start_bufsize}"]
         if self.csdr_through:
             chain += ["csdr through"]
+        return chain
+
+    def chain(self, which):
         if which == "fft":
+            chain = self.input_chain(which)
             chain += [
                 "csdr fft_cc {fft_size} {fft_block_size}",
                 "csdr logpower_cf -70"
@@ -239,9 +430,24 @@ class dsp(object):
             if self.fft_compression == "adpcm":
                 chain += ["csdr compress_fft_adpcm_f_u8 {fft_size}"]
             return chain
-        chain += ["csdr shift_addition_cc --fifo {shift_pipe}"]
-        if self.decimation > 1:
-            chain += ["csdr fir_decimate_cc {decimation} {ddc_transition_bw} HAMMING"]
+        demodulator_chain = self.demodulator_chain(which)
+        return self.front_chain() + (demodulator_chain if demodulator_chain is not None else [])
+
+    def front_chain(self):
+        """
+        the part of the chain that does not depend on the demodulator (ddc, bandpass, squelch). it keeps running when
+        the demodulator is switched, and feeds its IF signal to the demodulator chain.
+        """
+        chain = self.input_chain("iq")
+        if self.fastddc_decimation is not None:
+            # coarse tuning and decimation happen in the inverse fastddc stage, the shift only covers the residual
+            chain += [
+                "csdr fastddc_inv_cc {fastddc_shift} {decimation} {ddc_transition_bw}",
+                "csdr shift_addition_cc --fifo {shift_pipe}",
+            ]
+        else:
+            chain += ["csdr shift_addition_cc --fifo {shift_pipe}"]
+            chain += self.decimation_plan.get_commands()
         chain += ["csdr bandpass_fir_fft_cc --fifo {bpf_pipe} {bpf_transition_bw} HAMMING"]
         if self.output.supports_type("smeter"):
             chain += [
@@ -251,23 +457,36 @@ class dsp(object):
             if self.output.supports_type("secondary_fft"):
                 chain += ["csdr tee {iqtee_pipe}"]
             chain += ["csdr tee {iqtee2_pipe}"]
-            # early exit if we don't want audio
-            if not self.output.supports_type("audio"):
-                return chain
+        return chain
+
+    def demodulator_chain(self, which):
+        """
+        the demodulator-specific tail of the chain, reading the IF signal from the front chain.
+        returns None if there is nothing to demodulate since no audio is required.
+        """
+        if self.secondary_demodulator and not self.output.supports_type("audio"):
+            return None
+        chain = []
         # safe some cpu cycles... no need to decimate if decimation factor is 1
         last_decimation_block = (
             ["csdr fractional_decimator_ff {last_decimation}"] if self.last_decimation != 1.0 else []
         )
+        # one resampling step from the IF straight to the output rate, if the ratio allows it
+        resampler_block = self.get_resampler(self.get_if_rate_fraction(), self.get_output_rate())
         if which == "nfm":
             chain += ["csdr fmdemod_quadri_cf", "csdr limit_ff"]
-            chain += last_decimation_block
-            chain += ["csdr deemphasis_nfm_ff {audio_rate}"]
-            if self.get_audio_rate() != self.get_output_rate():
-                chain += [
-                    "sox -t raw -r {audio_rate} -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - "
-                ]
+            if resampler_block is not None:
+                chain += resampler_block
+                chain += ["csdr deemphasis_nfm_ff {output_rate}", "csdr convert_f_s16"]
             else:
-                chain += ["csdr convert_f_s16"]
+                chain += last_decimation_block
+                chain += ["csdr deemphasis_nfm_ff {audio_rate}"]
+                if self.get_audio_rate() != self.get_output_rate():
+                    chain += [
+                        "sox -t raw -r {audio_rate} -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - "
+                    ]
+                else:
+                    chain += ["csdr convert_f_s16"]
         elif self.isDigitalVoice(which):
             chain += ["csdr fmdemod_quadri_cf", "dc_block "]
             chain += last_decimation_block
@@ -294,28 +513,104 @@ class dsp(object):
             chain += [
                 "digitalvoice_filter -f",
                 "CSDR_FIXED_BUFSIZE=32 csdr agc_ff 160000 0.8 1 0.0000001 {max_gain}".format(max_gain=max_gain),
-                "sox -t raw -r 8000 -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - ",
             ]
+            # the vocoders run at 8 kHz; small buffers keep the latency at the level of sox' 32 sample buffer
+            voice_resampler_block = self.get_resampler(8000, self.get_output_rate(), bufsize=128)
+            if voice_resampler_block is not None:
+                chain += voice_resampler_block + ["CSDR_FIXED_BUFSIZE=32 csdr convert_f_s16"]
+            else:
+                chain += [
+                    "sox -t raw -r 8000 -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - ",
+                ]
         elif which == "am":
             chain += ["csdr amdemod_cf", "csdr fastdcblock_ff"]
-            chain += last_decimation_block
+            chain += resampler_block if resampler_block is not None else last_decimation_block
             chain += ["csdr agc_ff", "csdr limit_ff", "csdr convert_f_s16"]
         elif which == "ssb":
             chain += ["csdr realpart_cf"]
-            chain += last_decimation_block
-            chain += ["csdr agc_ff", "csdr limit_ff"]
-            # fixed sample rate necessary for the wsjt-x tools. fix with sox...
-            if self.get_audio_rate() != self.get_output_rate():
-                chain += [
-                    "sox -t raw -r {audio_rate} -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - "
-                ]
+            if resampler_block is not None:
+                chain += resampler_block
+                chain += ["csdr agc_ff", "csdr limit_ff", "csdr convert_f_s16"]
             else:
-                chain += ["csdr convert_f_s16"]
+                chain += last_decimation_block
+                chain += ["csdr agc_ff", "csdr limit_ff"]
+                # fixed sample rate necessary for the wsjt-x tools. fix with sox...
+                if self.get_audio_rate() != self.get_output_rate():
+                    chain += [
+                        "sox -t raw -r {audio_rate} -e floating-point -b 32 -c 1 --buffer 32 - -t raw -r {output_rate} -e signed-integer -b 16 -c 1 - "
+                    ]
+                else:
+                    chain += ["csdr convert_f_s16"]
 
         if self.audio_compression == "adpcm":
             chain += ["csdr encode_ima_adpcm_i16_u8"]
+        if not chain:
+            # unknown demodulator; pass the IF signal on unchanged like the single-process chain used to
+            chain += ["cat"]
         return chain
 
+    def get_resampler(self, input_rate, output_rate, bufsize=None):
+        """
+        a polyphase rational resampler stage, sized from the reduced ratio of the two rates. returns an empty list if
+        no resampling is required, and None if the ratio would require an unreasonably long filter.
+        """
+        ratio = Fraction(output_rate) / Fraction(input_rate)
+        if ratio == 1:
+            return []
+        factor = max(ratio.numerator, ratio.denominator)
+        if factor > dsp.max_resampler_factor:
+            return None
+        command = "csdr rational_resampler_ff {interpolation} {decimation} {transition_bw}".format(
+            interpolation=ratio.numerator,
+            decimation=ratio.denominator,
+            transition_bw=self.ddc_transition_bw_rate / factor,
+        )
+        if bufsize is not None:
+            command = "CSDR_FIXED_BUFSIZE={0} {1}".format(bufsize, command)
+        return [command]
+
+    def get_if_rate_fraction(self):
+        return Fraction(self.samp_rate) / self.decimation
+
+    def numpy_chain(self):
+        """
+        the complete chain for the numpy backend: a single worker process takes care of everything after the input.
+        with the shm transport, the worker maps the ring itself.
+        """
+        chain = [] if self.ringbuffer_path is not None else self.input_chain("iq")
+        command = (
+            "{python} -m csdr.numpy_dsp {demodulator} --decimation {{decimation}} "
+            + "--ddc-transition-bw {{ddc_transition_bw}} --bpf-transition-bw {{bpf_transition_bw}} "
+            + "--if-rate {if_samp_rate} --output-rate {{output_rate}} --control-fd {{control_fd}}"
+        ).format(python=sys.executable, demodulator=self.demodulator, if_samp_rate=self.if_samp_rate())
+        if self.output.supports_type("smeter"):
+            command += " --smeter-report-every {smeter_report_every}"
+        if self.audio_compression == "adpcm":
+            command += " --adpcm"
+        if self.ringbuffer_path is not None:
+            command += " --ringbuffer {ringbuffer_path}"
+        return chain + [command]
+
+    def set_backend(self, backend):
+        if self.backend == backend:
+            return
+        self.backend = backend
+        self.restart()
+
+    def use_numpy_backend(self):
+        """
+        the numpy backend only covers the analog demodulators without any secondary demodulation
+        """
+        return (
+            self.backend == "numpy"
+            and self.demodulator in ["nfm", "am", "ssb"]
+            and not self.secondary_demodulator
+            and self.fastddc_decimation is None
+            and self.get_audio_rate() == self.get_output_rate()
+            and not self.csdr_dynamic_bufsize
+            and not self.csdr_through
+        )
+
     def secondary_chain(self, which):
         chain = ["cat {input_pipe}"]
         if which == "fft":
@@ -357,7 +652,14 @@ class dsp(object):
             return
         self.secondary_demodulator = what
         self.calculate_decimation()
-        self.restart()
+        if not self.can_swap_demodulator():
+            self.restart()
+            return
+        # the tees for the secondary chain stay in place, so only the secondary processes need to be replaced
+        with self.modification_lock:
+            self.stop_secondary_demodulator()
+            self.start_secondary_demodulator()
+        self.update_demodulator()
 
     def secondary_fft_block_size(self):
         return (self.samp_rate / self.decimation) / (
@@ -435,7 +737,7 @@ class dsp(object):
             )
             self.output.send_output(
                 "secondary_fft",
-                partial(self.secondary_process_fft.stdout.read, int(self.get_secondary_fft_bytes_to_read())),
+                FixedSizeReader(self.secondary_process_fft.stdout, int(self.get_secondary_fft_bytes_to_read())),
             )
 
         # direwolf does not provide any meaningful data on stdout
@@ -446,6 +748,10 @@ class dsp(object):
             secondary_command_demod, stdout=secondary_output, shell=True, start_new_session=True, env=my_env
         )
         self.secondary_processes_running = True
+        self.secondary_supervision.onStart()
+        if self.secondary_process_fft:
+            self.watch_secondary_process(self.secondary_process_fft, "secondary_fft")
+        self.watch_secondary_process(self.secondary_process_demod, "secondary")
 
         if self.isWsjtMode():
             smd = self.get_secondary_demodulator()
@@ -467,11 +773,11 @@ class dsp(object):
         elif self.isPacket():
             # we best get the ax25 packets from the kiss socket
             kiss = KissClient(self.direwolf_port)
-            self.output.send_output("packet_demod", kiss.read)
+            self.output.send_output("packet_demod", ChunkReader(kiss))
         elif self.isPocsag():
-            self.output.send_output("pocsag_demod", self.secondary_process_demod.stdout.readline)
+            self.output.send_output("pocsag_demod", LineReader(self.secondary_process_demod.stdout))
         else:
-            self.output.send_output("secondary_demod", partial(self.secondary_process_demod.stdout.read, 1))
+            self.output.send_output("secondary_demod", BatchingReader(self.secondary_process_demod.stdout))
 
         # open control pipes for csdr and send initialization data
         if self.has_pipe("secondary_shift_pipe"):  # TODO digimodes
@@ -480,7 +786,7 @@ class dsp(object):
     def set_secondary_offset_freq(self, value):
         self.secondary_offset_freq = value
         if self.secondary_processes_running and self.has_pipe("secondary_shift_pipe"):
-            self.pipes["secondary_shift_pipe"].write("%g\n" % (-float(self.secondary_offset_freq) / self.if_samp_rate()))
+            self.control.write("secondary_shift_pipe", -float(self.secondary_offset_freq) / self.if_samp_rate())
 
     def stop_secondary_demodulator(self):
         if not self.secondary_processes_running:
@@ -499,7 +805,20 @@ class dsp(object):
             except ProcessLookupError:
                 # been killed by something else, ignore
                 pass
+        self.secondary_process_fft = None
+        self.secondary_process_demod = None
         self.secondary_processes_running = False
+        self.secondary_supervision.onStop()
+
+    def restart_secondary_demodulator(self, crashed):
+        with self.modification_lock:
+            # replaced or stopped in the meantime
+            current = [self.secondary_process_fft, self.secondary_process_demod]
+            if not self.running or not any(crashed is p for p in current):
+                return
+            # the tees for the secondary chain stay in place, so the front chain keeps running
+            self.stop_secondary_demodulator()
+            self.start_secondary_demodulator()
 
     def get_secondary_demodulator(self):
         return self.secondary_demodulator
@@ -542,19 +861,38 @@ class dsp(object):
             self.restart()
 
     def calculate_decimation(self):
-        (self.decimation, self.last_decimation, _) = self.get_decimation(self.samp_rate, self.get_audio_rate())
+        if self.fastddc_decimation is not None:
+            self.decimation = self.fastddc_decimation
+            self.last_decimation = float(self.if_samp_rate()) / self.get_audio_rate()
+        else:
+            self.decimation_plan = DecimationPlanner.plan(self.samp_rate, self.get_audio_rate())
+            self.decimation = self.decimation_plan.get_decimation()
+            self.last_decimation = self.decimation_plan.get_fraction()
+
+    def set_fastddc(self, port, decimation):
+        """
+        attach this dsp to the output of a shared fastddc_fwd_cc stage (or detach from it by passing None).
+        """
+        if self.fastddc_port == port and self.fastddc_decimation == decimation:
+            return
+        self.fastddc_port = port
+        self.fastddc_decimation = decimation
+        self.calculate_decimation()
+        self.restart()
 
     def get_decimation(self, input_rate, output_rate):
-        decimation = 1
-        while input_rate / (decimation + 1) >= output_rate:
-            decimation += 1
-        fraction = float(input_rate / decimation) / output_rate
-        intermediate_rate = input_rate / decimation
-        return decimation, fraction, intermediate_rate
+        plan = DecimationPlanner.plan(input_rate, output_rate)
+        return plan.get_decimation(), plan.get_fraction(), plan.get_intermediate_rate()
 
     def if_samp_rate(self):
         return self.samp_rate / self.decimation
 
+    def get_control_period(self):
+        """
+        the csdr tools check their control fifos once per buffer, so there is no point in writing more often
+        """
+        return self.base_bufsize / self.if_samp_rate()
+
     def get_name(self):
         return self.name
 
@@ -593,14 +931,14 @@ class dsp(object):
             return
         self.output_rate = output_rate
         self.calculate_decimation()
-        self.restart()
+        self.update_demodulator()
 
     def set_demodulator(self, demodulator):
         if self.demodulator == demodulator:
             return
         self.demodulator = demodulator
         self.calculate_decimation()
-        self.restart()
+        self.update_demodulator()
 
     def get_demodulator(self):
         return self.demodulator
@@ -626,8 +964,26 @@ class dsp(object):
     def set_offset_freq(self, offset_freq):
         self.offset_freq = offset_freq
         if self.running:
-            with self.modification_lock:
-                self.pipes["shift_pipe"].write("%g\n" % (-float(self.offset_freq) / self.samp_rate))
+            if not self.fastddc_covers_offset():
+                logger.debug("offset left the current fastddc channel, restarting")
+                self.restart()
+                return
+            self.control.write("shift_pipe", self.get_shift_rate())
+
+    def get_shift_rate(self):
+        if self.fastddc_decimation is not None:
+            return -float(self.offset_freq - self.fastddc_offset) / self.if_samp_rate()
+        return -float(self.offset_freq) / self.samp_rate
+
+    def fastddc_covers_offset(self):
+        if self.fastddc_decimation is None:
+            return True
+        residual = abs(self.offset_freq - self.fastddc_offset)
+        if residual == 0:
+            return True
+        # keep the passband clear of the fastddc transition band
+        usable = self.if_samp_rate() * (0.5 - self.ddc_transition_bw_rate)
+        return residual + max(abs(self.low_cut), abs(self.high_cut)) <= usable
 
     def set_center_freq(self, center_freq):
         # dsp only needs to know this to be able to pass it to decoders in the form of get_operating_freq()
@@ -640,10 +996,9 @@ class dsp(object):
         self.low_cut = low_cut
         self.high_cut = high_cut
         if self.running:
-            with self.modification_lock:
-                self.pipes["bpf_pipe"].write(
-                    "%g %g\n" % (float(self.low_cut) / self.if_samp_rate(), float(self.high_cut) / self.if_samp_rate())
-                )
+            self.control.write(
+                "bpf_pipe", float(self.low_cut) / self.if_samp_rate(), float(self.high_cut) / self.if_samp_rate()
+            )
 
     def get_bpf(self):
         return [self.low_cut, self.high_cut]
@@ -656,19 +1011,18 @@ class dsp(object):
         # no squelch required on digital voice modes
         actual_squelch = -150 if self.isDigitalVoice() or self.isPacket() or self.isPocsag() else self.squelch_level
         if self.running:
-            with self.modification_lock:
-                self.pipes["squelch_pipe"].write("%g\n" % (self.convertToLinear(actual_squelch)))
+            self.control.write("squelch_pipe", self.convertToLinear(actual_squelch))
 
     def set_unvoiced_quality(self, q):
         self.unvoiced_quality = q
-        self.restart()
+        self.update_demodulator()
 
     def get_unvoiced_quality(self):
         return self.unvoiced_quality
 
     def set_dmr_filter(self, filter):
-        if self.has_pipe("dmr_control_pipe"):
-            self.pipes["dmr_control_pipe"].write("{0}\n".format(filter))
+        if self.has_control("dmr_control_pipe"):
+            self.send_control("dmr_control_pipe", [filter])
 
     def ddc_transition_bw(self):
         return self.ddc_transition_bw_rate * (self.if_samp_rate() / float(self.samp_rate))
@@ -689,6 +1043,48 @@ class dsp(object):
     def has_pipe(self, name):
         return name in self.pipes and self.pipes[name] is not None
 
+    def has_control(self, name):
+        """
+        True if the running chain accepts the command that the control pipe of this name would carry
+        """
+        if self.control_socket is not None:
+            return name in control.commands
+        return self.has_pipe(name)
+
+    def send_control(self, name, values):
+        if self.control_socket is not None:
+            if name not in control.commands:
+                return
+            self.control_backlog += control.encode_values(control.commands[name], values)
+            self.flush_control()
+        elif self.has_pipe(name):
+            self.pipes[name].write(" ".join("%g" % v for v in values) + "\n")
+
+    def flush_control(self):
+        """
+        send what is left over on the (non-blocking) control socket. returns True if nothing is left. partial frames
+        stay in the backlog, so the framing is never broken.
+        """
+        if self.control_socket is None or not self.control_backlog:
+            self.control_backlog = b""
+            return True
+        try:
+            sent = self.control_socket.send(self.control_backlog)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            logger.warning("could not send %i bytes to the control socket", len(self.control_backlog))
+            self.control_backlog = b""
+            return True
+        self.control_backlog = self.control_backlog[sent:]
+        if not self.control_backlog:
+            self.control_congested = False
+            return True
+        if not self.control_congested:
+            logger.warning("control socket is full, %i bytes are waiting to be sent", len(self.control_backlog))
+            self.control_congested = True
+        return False
+
     def try_delete_pipes(self, pipe_names):
         for pipe_name in pipe_names:
             if self.has_pipe(pipe_name):
@@ -719,123 +1115,299 @@ class dsp(object):
                 logger.exception("try_delete_configs()")
             self.direwolf_config = None
 
+    def get_chain_parameters(self):
+        pipe_names = list(self.pipe_names.keys()) + list(self.demodulator_pipe_names.keys())
+        params = {name: self.pipe_base_path + name for name in pipe_names}
+        params.update(
+            decimation=self.decimation,
+            last_decimation=self.last_decimation,
+            fft_size=self.fft_size,
+            fft_block_size=self.fft_block_size(),
+            fft_averages=self.fft_averages,
+            bpf_transition_bw=float(self.bpf_transition_bw) / self.if_samp_rate(),
+            ddc_transition_bw=self.ddc_transition_bw(),
+            flowcontrol=int(self.samp_rate * 2),
+            start_bufsize=self.base_bufsize * self.decimation,
+            nc_port=self.nc_port,
+            ringbuffer_path=self.ringbuffer_path,
+            fastddc_port=self.fastddc_port,
+            fastddc_shift=-float(self.fastddc_offset) / self.samp_rate,
+            output_rate=self.get_output_rate(),
+            smeter_report_every=int(self.if_samp_rate() / 6000),
+            unvoiced_quality=self.get_unvoiced_quality(),
+            audio_rate=self.get_audio_rate(),
+        )
+        return params
+
+    def get_environment(self):
+        my_env = os.environ.copy()
+        if self.csdr_dynamic_bufsize:
+            my_env["CSDR_DYNAMIC_BUFSIZE_ON"] = "1"
+        if self.csdr_print_bufsizes:
+            my_env["CSDR_PRINT_BUFSIZES"] = "1"
+        return my_env
+
+    def set_owner(self, owner):
+        """
+        :param owner: name (or a callable returning the name) that the resource usage of this dsp is accounted to
+        """
+        self.owner = owner
+
+    def get_owner(self):
+        if callable(self.owner):
+            return self.owner()
+        return self.owner
+
+    def is_current_process(self, process):
+        current = [self.process, self.demodulator_process, self.secondary_process_fft, self.secondary_process_demod]
+        return any(process is p for p in current)
+
+    def supervise_process(self, process, kind, onCrash):
+        """
+        calls onCrash if the process ends by itself while the chain is running, with whatever code or signal. processes
+        that are stopped on purpose have either been replaced or are stopped with the modification_lock held.
+        """
+
+        def onExit(rc):
+            if not self.is_current_process(process) or not self.running or self.modification_lock.locked():
+                logger.debug("%s process ended with rc=%d", kind, rc)
+                return
+            if rc < 0:
+                logger.warning("%s process was killed by signal %d", kind, -rc)
+            elif rc > 0:
+                logger.warning("%s process failed with rc=%d", kind, rc)
+            else:
+                logger.debug("%s process ended", kind)
+            onCrash()
+
+        Supervisor.getSharedInstance().watch(process, self.get_owner, kind).onExit(onExit)
+
+    def watch_process(self, process, kind):
+        def onCrash():
+            delay = self.supervision.onCrash()
+            logger.debug("restarting dsp chain in %.1fs", delay)
+            reactor = Reactor.getSharedInstance()
+            self.restart_timer = reactor.callLater(delay, lambda: reactor.submit(self.restart))
+
+        self.supervise_process(process, kind, onCrash)
+
+    def watch_secondary_process(self, process, kind):
+        def onCrash():
+            delay = self.secondary_supervision.onCrash()
+            logger.debug("restarting secondary demodulator in %.1fs", delay)
+            reactor = Reactor.getSharedInstance()
+            reactor.callLater(delay, lambda: reactor.submit(lambda: self.restart_secondary_demodulator(process)))
+
+        self.supervise_process(process, kind, onCrash)
+
+    def get_output_reader(self, process, size):
+        skip = 0
+        if self.csdr_dynamic_bufsize:
+            # skip bufsize & preamble
+            skip = 8
+            logger.debug("Note: CSDR_DYNAMIC_BUFSIZE_ON = 1")
+        return FixedSizeReader(process.stdout, size, skip=skip)
+
+    def kill_process(self, process):
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+        except ProcessLookupError:
+            # been killed by something else, ignore
+            pass
+
     def start(self):
         with self.modification_lock:
             if self.running:
                 return
             self.running = True
+            self.supervision.onStart()
 
-            command_base = " | ".join(self.chain(self.demodulator))
-
-            # create control pipes for csdr
-            self.try_create_pipes(self.pipe_names, command_base)
-
-            # run the command
-            command = command_base.format(
-                bpf_pipe=self.pipes["bpf_pipe"],
-                shift_pipe=self.pipes["shift_pipe"],
-                squelch_pipe=self.pipes["squelch_pipe"],
-                smeter_pipe=self.pipes["smeter_pipe"],
-                meta_pipe=self.pipes["meta_pipe"],
-                iqtee_pipe=self.pipes["iqtee_pipe"],
-                iqtee2_pipe=self.pipes["iqtee2_pipe"],
-                dmr_control_pipe=self.pipes["dmr_control_pipe"],
-                decimation=self.decimation,
-                last_decimation=self.last_decimation,
-                fft_size=self.fft_size,
-                fft_block_size=self.fft_block_size(),
-                fft_averages=self.fft_averages,
-                bpf_transition_bw=float(self.bpf_transition_bw) / self.if_samp_rate(),
-                ddc_transition_bw=self.ddc_transition_bw(),
-                flowcontrol=int(self.samp_rate * 2),
-                start_bufsize=self.base_bufsize * self.decimation,
-                nc_port=self.nc_port,
-                output_rate=self.get_output_rate(),
-                smeter_report_every=int(self.if_samp_rate() / 6000),
-                unvoiced_quality=self.get_unvoiced_quality(),
-                audio_rate=self.get_audio_rate(),
-            )
+            self.fastddc_offset = self.offset_freq
+
+            if self.demodulator == "fft":
+                command = " | ".join(self.chain("fft")).format(**self.get_chain_parameters())
+                logger.debug("Command = %s", command)
+                out = subprocess.PIPE if self.output.supports_type("audio") else subprocess.DEVNULL
+                self.process = subprocess.Popen(
+                    command, stdout=out, shell=True, start_new_session=True, env=self.get_environment()
+                )
+                if self.output.supports_type("audio"):
+                    self.output.send_output("audio", self.get_output_reader(self.process, self.get_fft_bytes_to_read()))
+            elif self.use_numpy_backend():
+                # one socket for all control commands and s-meter events instead of the fifos
+                (self.control_socket, worker_socket) = socket.socketpair()
+                self.control_backlog = b""
+                self.control_congested = False
+                self.front_command = " | ".join(self.numpy_chain()).format(
+                    control_fd=worker_socket.fileno(), **self.get_chain_parameters()
+                )
+                logger.debug("Command = %s", self.front_command)
+
+                out = subprocess.PIPE if self.output.supports_type("audio") else subprocess.DEVNULL
+                self.process = subprocess.Popen(
+                    self.front_command,
+                    stdout=out,
+                    shell=True,
+                    start_new_session=True,
+                    env=self.get_environment(),
+                    pass_fds=[worker_socket.fileno()],
+                )
+                worker_socket.close()
+                if self.output.supports_type("audio"):
+                    self.output.send_output(
+                        "audio", self.get_output_reader(self.process, self.get_audio_bytes_to_read())
+                    )
+                if self.output.supports_type("smeter"):
+                    self.output.send_output("smeter", ControlSocketReader(self.control_socket))
+            else:
+                command_base = " | ".join(self.front_chain())
+
+                # create control pipes for csdr
+                self.try_create_pipes(self.pipe_names, command_base)
+
+                self.front_command = command_base.format(**self.get_chain_parameters())
+                logger.debug("Command = %s", self.front_command)
 
-            logger.debug("Command = %s", command)
-            my_env = os.environ.copy()
-            if self.csdr_dynamic_bufsize:
-                my_env["CSDR_DYNAMIC_BUFSIZE_ON"] = "1"
-            if self.csdr_print_bufsizes:
-                my_env["CSDR_PRINT_BUFSIZES"] = "1"
-
-            out = subprocess.PIPE if self.output.supports_type("audio") else subprocess.DEVNULL
-            self.process = subprocess.Popen(command, stdout=out, shell=True, start_new_session=True, env=my_env)
-
-            def watch_thread():
-                rc = self.process.wait()
-                logger.debug("dsp thread ended with rc=%d", rc)
-                if rc == 0 and self.running and not self.modification_lock.locked():
-                    logger.debug("restarting since rc = 0, self.running = true, and no modification")
-                    self.restart()
-
-            threading.Thread(target=watch_thread).start()
-
-            if self.output.supports_type("audio"):
-                self.output.send_output(
-                    "audio",
-                    partial(
-                        self.process.stdout.read,
-                        self.get_fft_bytes_to_read() if self.demodulator == "fft" else self.get_audio_bytes_to_read(),
-                    ),
+                front_output = subprocess.DEVNULL
+                if self.demodulator_chain(self.demodulator) is not None:
+                    # we keep the reading end open on our side, so the demodulator can be replaced without breaking
+                    # the pipe. csdr reads and writes whole samples, so a new demodulator starts at a sample boundary.
+                    (self.demodulator_input, front_output) = os.pipe()
+
+                self.process = subprocess.Popen(
+                    self.front_command, stdout=front_output, shell=True, start_new_session=True, env=self.get_environment()
                 )
+                if front_output != subprocess.DEVNULL:
+                    os.close(front_output)
+                    self.start_demodulator()
+
+            self.watch_process(self.process, "dsp")
 
             self.start_secondary_demodulator()
 
         # send initial config through the pipes
-        if self.has_pipe("bpf_pipe"):
+        if self.has_control("bpf_pipe"):
             self.set_bpf(self.low_cut, self.high_cut)
-        if self.has_pipe("shift_pipe"):
+        if self.has_control("shift_pipe"):
             self.set_offset_freq(self.offset_freq)
-        if self.has_pipe("squelch_pipe"):
+        if self.has_control("squelch_pipe"):
             self.set_squelch_level(self.squelch_level)
-        if self.has_pipe("dmr_control_pipe"):
-            self.set_dmr_filter(3)
+        # no need to wait for the control period with the initial values
+        self.control.flush()
 
         if self.has_pipe("smeter_pipe"):
-            def read_smeter():
-                raw = self.pipes["smeter_pipe"].readline()
-                if len(raw) == 0:
-                    return None
-                else:
-                    return float(raw.rstrip("\n"))
+            self.output.send_output("smeter", LineReader(self.pipes["smeter_pipe"], parse=float))
+
+        self.start_demodulator_outputs()
+
+    def start_demodulator(self):
+        # must be called with the modification_lock held
+        command_base = " | ".join(self.demodulator_chain(self.demodulator))
+        self.try_create_pipes(self.demodulator_pipe_names, command_base)
+        self.demodulator_command = command_base.format(**self.get_chain_parameters())
+        logger.debug("Demodulator command = %s", self.demodulator_command)
+
+        out = subprocess.PIPE if self.output.supports_type("audio") else subprocess.DEVNULL
+        self.demodulator_process = subprocess.Popen(
+            self.demodulator_command,
+            stdin=self.demodulator_input,
+            stdout=out,
+            shell=True,
+            start_new_session=True,
+            env=self.get_environment(),
+        )
+        self.watch_process(self.demodulator_process, "demodulator")
 
-            self.output.send_output("smeter", read_smeter)
-        if self.has_pipe("meta_pipe"):
-            def read_meta():
-                raw = self.pipes["meta_pipe"].readline()
-                if len(raw) == 0:
-                    return None
-                else:
-                    return raw.rstrip("\n")
+        if self.output.supports_type("audio"):
+            self.output.send_output(
+                "audio", self.get_output_reader(self.demodulator_process, self.get_audio_bytes_to_read())
+            )
 
-            self.output.send_output("meta", read_meta)
+    def start_demodulator_outputs(self):
+        if self.has_pipe("dmr_control_pipe"):
+            self.set_dmr_filter(3)
+        if self.has_pipe("meta_pipe"):
+            meta_pipe = self.pipes["meta_pipe"]
+            self.output.send_output(
+                "meta", LineReader(meta_pipe, encoding=meta_pipe.encoding, parse=lambda line: line.rstrip("\n"))
+            )
 
+    def stop_demodulator(self):
+        # must be called with the modification_lock held
+        if self.demodulator_process is not None:
+            self.kill_process(self.demodulator_process)
+            self.demodulator_process = None
+        self.try_delete_pipes(self.demodulator_pipe_names)
+
+    def can_swap_demodulator(self):
+        """
+        the demodulator can be replaced on its own as long as the front chain would stay exactly the same
+        """
+        if not self.running or self.demodulator == "fft" or self.demodulator_input is None:
+            return False
+        # the numpy backend runs as a single process that has to be restarted
+        if self.use_numpy_backend():
+            return False
+        # with dynamic buffer sizes, the buffer size preamble is only sent once at the start of the stream
         if self.csdr_dynamic_bufsize:
-            self.process.stdout.read(8)  # dummy read to skip bufsize & preamble
-            logger.debug("Note: CSDR_DYNAMIC_BUFSIZE_ON = 1")
+            return False
+        if self.demodulator_chain(self.demodulator) is None:
+            return False
+        return " | ".join(self.front_chain()).format(**self.get_chain_parameters()) == self.front_command
+
+    def demodulator_changed(self):
+        demodulator_chain = self.demodulator_chain(self.demodulator)
+        if demodulator_chain is None:
+            return True
+        return " | ".join(demodulator_chain).format(**self.get_chain_parameters()) != self.demodulator_command
+
+    def update_demodulator(self):
+        """
+        apply a change to the demodulation parameters: replaces only the demodulator if possible, restarts otherwise
+        """
+        if not self.running:
+            return
+        if not self.can_swap_demodulator():
+            self.restart()
+            return
+        if not self.demodulator_changed():
+            return
+        logger.debug("swapping demodulator, front chain stays up")
+        with self.modification_lock:
+            if not self.running:
+                return
+            self.stop_demodulator()
+            self.start_demodulator()
+        # squelch depends on the demodulator
+        self.set_squelch_level(self.squelch_level)
+        self.start_demodulator_outputs()
 
     def stop(self):
         with self.modification_lock:
             self.running = False
+            self.supervision.onStop()
+            if self.restart_timer is not None:
+                self.restart_timer.cancel()
+                self.restart_timer = None
             if self.process is not None:
-                try:
-                    os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-                    self.process = None
-                except ProcessLookupError:
-                    # been killed by something else, ignore
-                    pass
+                self.kill_process(self.process)
+                self.process = None
+            self.stop_demodulator()
+            if self.demodulator_input is not None:
+                os.close(self.demodulator_input)
+                self.demodulator_input = None
             self.stop_secondary_demodulator()
 
             self.try_delete_pipes(self.pipe_names)
+            if self.control_socket is not None:
+                Reactor.getSharedInstance().unregister(self.control_socket.fileno())
+                self.control_socket.close()
+                self.control_socket = None
 
     def restart(self):
         if not self.running:
             return
+        self.restarts += 1
         self.stop()
         self.start()
 
@@ -0,0 +1,178 @@
+"""
+Decimation planning for the ddc
+
+The integer part of a decimation can be done by one long fir_decimate_cc, or by a cascade of shorter ones. Only the
+last stage of a cascade needs the narrow transition band; the stages before it only have to keep their aliases out of
+the final passband, so they get away with very few taps. The planner factors the integer decimation, estimates the
+cost of every possible cascade and picks the cheapest one. Whatever cannot be done by integer decimation is left to
+the fractional resampler at the end of the demodulator chain.
+
+A prime decimation can't be split up, so the planner also tries slightly smaller decimations. They leave a bit more
+for the resampler and the rest of the chain, which is taken into account as a cost per intermediate sample.
+"""
+
+from functools import lru_cache
+
+
+def filter_length(transition_bw):
+    # same as csdr's firdes_filter_len()
+    length = int(4.0 / transition_bw)
+    if length % 2 == 0:
+        length += 1
+    return max(length, 3)
+
+
+class DecimationStage(object):
+    def __init__(self, input_rate, decimation, transition_bw):
+        """
+        :param input_rate: sample rate at the input of this stage
+        :param decimation: integer decimation factor
+        :param transition_bw: transition bandwidth relative to the input rate
+        """
+        self.input_rate = input_rate
+        self.decimation = decimation
+        self.transition_bw = transition_bw
+
+    def get_output_rate(self):
+        return self.input_rate / self.decimation
+
+    def get_taps(self):
+        return filter_length(self.transition_bw)
+
+    def get_cost(self):
+        """
+        complex multiply-accumulate operations per second. fir_decimate_cc only calculates the samples it outputs.
+        """
+        return self.get_taps() * self.get_output_rate()
+
+    def get_command(self):
+        return "csdr fir_decimate_cc {0} {1} HAMMING".format(self.decimation, self.transition_bw)
+
+    def __repr__(self):
+        return "DecimationStage({0}, {1}, {2})".format(self.input_rate, self.decimation, self.transition_bw)
+
+
+class DecimationPlan(object):
+    def __init__(self, input_rate, output_rate, stages):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.stages = stages
+
+    def get_decimation(self):
+        decimation = 1
+        for stage in self.stages:
+            decimation *= stage.decimation
+        return decimation
+
+    def get_intermediate_rate(self):
+        return self.input_rate / self.get_decimation()
+
+    def get_fraction(self):
+        """
+        the decimation that is left for the fractional resampler
+        """
+        return float(self.get_intermediate_rate()) / self.output_rate
+
+    def get_cost(self):
+        """
+        estimated cost in multiply-accumulate operations per second, including the per-process overhead of every stage
+        and the work that the intermediate rate causes further down the chain
+        """
+        cost = sum(stage.get_cost() + DecimationPlanner.stage_overhead * stage.input_rate for stage in self.stages)
+        downstream = DecimationPlanner.downstream_cost
+        if self.get_intermediate_rate() != self.output_rate:
+            downstream += DecimationPlanner.resampler_cost
+        return cost + downstream * self.get_intermediate_rate()
+
+    def get_commands(self):
+        return [stage.get_command() for stage in self.stages]
+
+    def __repr__(self):
+        return "DecimationPlan({0})".format(self.stages)
+
+
+class DecimationPlanner(object):
+    """
+    finds the cheapest cascade of fir_decimate_cc stages for a given integer decimation
+    """
+
+    # relative to the intermediate rate, same as the previous single stage filter
+    transition_bw_rate = 0.15
+    max_stages = 4
+    # cost of one additional process in the chain (copying through the pipes), in operations per input sample
+    stage_overhead = 4
+    # rough cost of the bandpass, squelch and demodulator per intermediate sample, and of the resampler if one is
+    # needed. only matters when comparing different decimations.
+    downstream_cost = 40
+    resampler_cost = 30
+    # smaller decimations that are tried in addition to the integer decimation, relative to it
+    search_range = 0.1
+
+    @staticmethod
+    def get_integer_decimation(input_rate, output_rate):
+        decimation = 1
+        while input_rate / (decimation + 1) >= output_rate:
+            decimation += 1
+        return decimation
+
+    @staticmethod
+    def factorizations(decimation, max_stages):
+        """
+        all ordered ways to write decimation as a product of at most max_stages factors > 1
+        """
+        if decimation == 1:
+            return [[]]
+        if max_stages == 0:
+            return []
+        result = []
+        for factor in range(2, decimation + 1):
+            if decimation % factor == 0:
+                result += [[factor] + rest for rest in DecimationPlanner.factorizations(decimation // factor, max_stages - 1)]
+        return result
+
+    @staticmethod
+    def build(input_rate, factors, intermediate_rate):
+        # the final passband (everything left of the last stage's transition band) needs to stay free of aliases
+        passband = intermediate_rate * (0.5 - DecimationPlanner.transition_bw_rate / 2)
+        stages = []
+        rate = input_rate
+        for factor in factors:
+            output_rate = rate / factor
+            # the transition band is centered around the output nyquist frequency, and it may extend until its alias
+            # reaches the passband
+            transition_bw = (output_rate - 2 * passband) / rate
+            stages.append(DecimationStage(rate, factor, transition_bw))
+            rate = output_rate
+        return stages
+
+    @staticmethod
+    def get_candidates(decimation):
+        """
+        the integer decimation, and a few smaller ones
+        """
+        lowest = max(int(decimation * (1 - DecimationPlanner.search_range)), 1)
+        return range(decimation, lowest - 1, -1)
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def plan(input_rate, output_rate):
+        plans = []
+        for decimation in DecimationPlanner.get_candidates(
+            DecimationPlanner.get_integer_decimation(input_rate, output_rate)
+        ):
+            intermediate_rate = input_rate / decimation
+            plans += [
+                DecimationPlan(input_rate, output_rate, DecimationPlanner.build(input_rate, factors, intermediate_rate))
+                for factors in DecimationPlanner.factorizations(decimation, DecimationPlanner.max_stages)
+            ]
+        return min(plans, key=lambda p: p.get_cost())
+
+    @staticmethod
+    def single_stage(input_rate, output_rate):
+        """
+        the plan with only one stage, for comparison
+        """
+        decimation = DecimationPlanner.get_integer_decimation(input_rate, output_rate)
+        intermediate_rate = input_rate / decimation
+        factors = [decimation] if decimation > 1 else []
+        return DecimationPlan(input_rate, output_rate, DecimationPlanner.build(input_rate, factors, intermediate_rate))
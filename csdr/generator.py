@@ -0,0 +1,226 @@
+"""
+Synthetic IQ signal generator
+
+    Writes complex float32 IQ data to stdout, paced to real time, so it can take the place of an SDR in front of nmux.
+    The spectrum is described by a list of signals in JSON:
+
+        {"type": "carrier", "frequency": 145500000, "level": -40}
+        {"type": "nfm", "frequency": 145600000, "level": -40, "tone": 1000, "deviation": 2500}
+        {"type": "am", "frequency": 145700000, "level": -40, "tone": 1000, "depth": 0.5}
+        {"type": "usb", "frequency": 145800000, "level": -40, "tone": 1000}   (also "lsb")
+        {"type": "file", "frequency": 14074000, "level": -40, "file": "ft8.wav", "mod": "usb", "interval": 15}
+
+    Levels are in dB relative to full scale. File signals play back mono wave files (e.g. recordings of FT8, WSPR or
+    APRS transmissions) modulated as usb, lsb, am or nfm. With an interval, playback starts at every multiple of the
+    interval in UTC, which is what the WSJT decoders expect; without, the file is looped.
+
+        python3 -m csdr.generator --samp-rate 2400000 --center-freq 145000000 --signals '[...]' [options]
+"""
+
+import numpy as np
+import argparse
+import json
+import wave
+import time
+import sys
+
+
+def level_to_amplitude(level):
+    return 10 ** (level / 20)
+
+
+class Signal(object):
+    def __init__(self, offset, level, samp_rate):
+        """
+        :param offset: frequency relative to the center frequency in Hz
+        """
+        self.rate = offset / samp_rate
+        self.amplitude = level_to_amplitude(level)
+        self.samp_rate = samp_rate
+        self.phase = 0.0
+
+    def mix(self, baseband):
+        """
+        shifts the complex baseband to the offset frequency, keeping the phase continuous across blocks
+        """
+        phases = self.phase + 2 * np.pi * self.rate * np.arange(len(baseband))
+        self.phase = (self.phase + 2 * np.pi * self.rate * len(baseband)) % (2 * np.pi)
+        return (baseband * np.exp(1j * phases) * self.amplitude).astype(np.complex64)
+
+    def baseband(self, start, count):
+        """
+        the complex baseband signal for samples start to start + count
+        """
+        return np.ones(count, dtype=np.complex64)
+
+    def generate(self, start, count):
+        return self.mix(self.baseband(start, count))
+
+
+class Modulator(object):
+    @staticmethod
+    def modulate(mod, audio, samp_rate, deviation=2500, depth=0.5):
+        """
+        turns real audio (-1..1) into a complex baseband
+        """
+        if mod == "am":
+            return (1 + depth * audio).astype(np.complex64)
+        if mod == "nfm":
+            phase = np.cumsum(audio) * 2 * np.pi * deviation / samp_rate
+            return np.exp(1j * phase).astype(np.complex64)
+        if mod in ["usb", "lsb"]:
+            analytic = Modulator.analytic(audio)
+            return analytic if mod == "usb" else np.conj(analytic)
+        raise ValueError("unsupported modulation: {0}".format(mod))
+
+    @staticmethod
+    def analytic(audio):
+        spectrum = np.fft.fft(audio)
+        n = len(audio)
+        h = np.zeros(n)
+        h[0] = 1
+        if n % 2 == 0:
+            h[n // 2] = 1
+            h[1 : n // 2] = 2
+        else:
+            h[1 : (n + 1) // 2] = 2
+        return np.fft.ifft(spectrum * h).astype(np.complex64)
+
+
+class ToneSignal(Signal):
+    def __init__(self, offset, level, samp_rate, mod, tone=1000, deviation=2500, depth=0.5):
+        super().__init__(offset, level, samp_rate)
+        self.mod = mod
+        self.tone = tone
+        self.deviation = deviation
+        self.depth = depth
+
+    def baseband(self, start, count):
+        t = (start + np.arange(count)) / self.samp_rate
+        if self.mod == "am":
+            return (1 + self.depth * np.cos(2 * np.pi * self.tone * t)).astype(np.complex64)
+        if self.mod == "nfm":
+            # closed form of the integrated tone, so there is no drift between blocks
+            index = self.deviation / self.tone
+            return np.exp(1j * index * np.sin(2 * np.pi * self.tone * t)).astype(np.complex64)
+        tone = self.tone if self.mod == "usb" else -self.tone
+        return np.exp(2j * np.pi * tone * t).astype(np.complex64)
+
+
+class FileSignal(Signal):
+    def __init__(self, offset, level, samp_rate, file, mod="usb", interval=None, deviation=2500, depth=0.5):
+        super().__init__(offset, level, samp_rate)
+        (audio, self.audio_rate) = FileSignal.load(file)
+        # modulated once at the audio rate, and interpolated to the sample rate while playing
+        self.audio = Modulator.modulate(mod, audio, self.audio_rate, deviation, depth)
+        self.interval = interval
+
+    @staticmethod
+    def load(file):
+        with wave.open(file, "rb") as f:
+            if f.getsampwidth() != 2:
+                raise ValueError("only 16 bit wave files are supported")
+            channels = f.getnchannels()
+            data = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32768
+            return data[::channels], f.getframerate()
+
+    def baseband(self, start, count):
+        if self.interval is not None:
+            # generation is paced to real time, so the wall clock tells where in the interval this block is
+            t = (time.time() + np.arange(count) / self.samp_rate) % self.interval
+        else:
+            t = (start + np.arange(count)) / self.samp_rate
+        # position in the file, in samples at the audio rate
+        position = t * self.audio_rate
+        length = len(self.audio)
+        if self.interval is None:
+            position = position % length
+        index = np.floor(position).astype(np.int64)
+        fraction = (position - index).astype(np.float32)
+        valid = index < length - 1
+        index = np.minimum(index, length - 2)
+        result = self.audio[index] * (1 - fraction) + self.audio[index + 1] * fraction
+        return np.where(valid, result, 0).astype(np.complex64)
+
+
+class Generator(object):
+    def __init__(self, samp_rate, center_freq, signals, noise_level=-90, seed=None):
+        self.samp_rate = samp_rate
+        self.position = 0
+        self.signals = [Generator.createSignal(s, samp_rate, center_freq) for s in signals]
+        # split evenly between i and q
+        self.noise_amplitude = level_to_amplitude(noise_level) / np.sqrt(2) if noise_level is not None else 0
+        self.random = np.random.default_rng(seed)
+
+    @staticmethod
+    def createSignal(config, samp_rate, center_freq):
+        offset = config["frequency"] - center_freq
+        level = config.get("level", -40)
+        t = config["type"]
+        if t == "carrier":
+            return Signal(offset, level, samp_rate)
+        if t in ["nfm", "am", "usb", "lsb"]:
+            return ToneSignal(
+                offset,
+                level,
+                samp_rate,
+                t,
+                tone=config.get("tone", 1000),
+                deviation=config.get("deviation", 2500),
+                depth=config.get("depth", 0.5),
+            )
+        if t == "file":
+            return FileSignal(
+                offset,
+                level,
+                samp_rate,
+                config["file"],
+                mod=config.get("mod", "usb"),
+                interval=config.get("interval"),
+                deviation=config.get("deviation", 2500),
+                depth=config.get("depth", 0.5),
+            )
+        raise ValueError("unknown signal type: {0}".format(t))
+
+    def generate(self, count):
+        block = np.zeros(count, dtype=np.complex64)
+        if self.noise_amplitude:
+            noise = self.random.standard_normal(2 * count, dtype=np.float32) * np.float32(self.noise_amplitude)
+            block += noise.view(np.complex64)
+        for signal in self.signals:
+            block += signal.generate(self.position, count)
+        self.position += count
+        return block
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python3 -m csdr.generator")
+    parser.add_argument("--samp-rate", type=int, required=True)
+    parser.add_argument("--center-freq", type=float, required=True)
+    parser.add_argument("--signals", default="[]", help="list of signals in JSON")
+    parser.add_argument("--noise-level", type=float, default=-90, help="noise floor in dBFS")
+    parser.add_argument("--block-time", type=float, default=0.02, help="length of one block in seconds")
+    parser.add_argument("--no-throttle", action="store_true", help="generate as fast as possible")
+    parser.add_argument("--seed", type=int)
+    options = parser.parse_args(args)
+
+    generator = Generator(
+        options.samp_rate, options.center_freq, json.loads(options.signals), options.noise_level, options.seed
+    )
+    count = max(int(options.samp_rate * options.block_time), 1)
+    out = sys.stdout.buffer
+    start = time.monotonic()
+    while True:
+        out.write(generator.generate(count).tobytes())
+        out.flush()
+        if not options.no_throttle:
+            delay = start + generator.position / options.samp_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -0,0 +1,599 @@
+"""
+Vectorised DSP worker for the analog demodulators (nfm, am, ssb)
+
+    Does the work of the csdr chain (shift_addition_cc, fir_decimate_cc, bandpass_fir_fft_cc, squelch_and_smeter_cc,
+    the demodulator, agc_ff, limit_ff, rational_resampler_ff and the s16 conversion) in a single process with numpy.
+
+    Reads complex float32 IQ data from stdin, or straight from the mapping of a csdr.ringbuffer ring, and writes
+    signed 16 bit audio (or IMA ADPCM) to stdout. The control fifos accept the same values as their csdr counterparts,
+    and the s-meter fifo reports the same linear power values, so the dsp can drive both backends the same way.
+    Alternatively, all of them can go through a single control socket (see csdr.control) that is passed in as an open
+    file descriptor.
+
+        python3 -m csdr.numpy_dsp <nfm|am|ssb> [options]
+"""
+
+import numpy as np
+from fractions import Fraction
+from csdr import control
+from csdr.ringbuffer import readStream
+import argparse
+import errno
+import sys
+import os
+
+
+# same as the frontend decoder in htdocs/lib/AudioEngine.js
+imaIndexTable = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8]
+imaStepTable = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97, 107,
+    118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894,
+    6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+]
+
+
+def _imaDeltas(step):
+    deltas = []
+    for nibble in range(16):
+        delta = step >> 3
+        if nibble & 1:
+            delta += step >> 2
+        if nibble & 2:
+            delta += step >> 1
+        if nibble & 4:
+            delta += step
+        deltas.append(-delta if nibble & 8 else delta)
+    return deltas
+
+
+# lookup tables for the encoder loop: predictor change by step size (including the initial step of 0) and nibble,
+# and the next step index by index and nibble
+imaDeltaTable = {step: _imaDeltas(step) for step in [0] + imaStepTable}
+imaNextIndex = [[min(max(index + change, 0), 88) for change in imaIndexTable] for index in range(89)]
+
+
+def firdes_length(transition_bw):
+    # same rule of thumb as csdr's firdes_filter_len()
+    length = int(4.0 / transition_bw)
+    if length % 2 == 0:
+        length += 1
+    return max(length, 3)
+
+
+def firdes_lowpass(cutoff, transition_bw):
+    """
+    windowed sinc lowpass (hamming window) with unity gain at DC. cutoff and transition_bw are relative to the sample
+    rate.
+    """
+    length = firdes_length(transition_bw)
+    n = np.arange(length) - (length - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(length)
+    return taps / np.sum(taps)
+
+
+def firdes_bandpass(low_cut, high_cut, transition_bw):
+    """
+    complex bandpass; low_cut and high_cut may be negative, like the values csdr's bandpass_fir_fft_cc accepts.
+    """
+    taps = firdes_lowpass((high_cut - low_cut) / 2, transition_bw)
+    n = np.arange(len(taps)) - (len(taps) - 1) / 2
+    return taps * np.exp(2j * np.pi * (low_cut + high_cut) / 2 * n)
+
+
+def firdes_deemphasis(samp_rate, length=129):
+    """
+    nfm de-emphasis: 6 dB/octave rolloff between 300 Hz and 3 kHz, steep cutoff above. designed by frequency sampling.
+    """
+    nfft = 1024
+    f = np.fft.rfftfreq(nfft, 1.0 / samp_rate)
+    response = np.where(f < 300, 1.0, 300 / np.maximum(f, 1))
+    response[f > 4000] = 0
+    taps = np.fft.irfft(response, nfft)
+    taps = np.roll(taps, length // 2)[:length] * np.hamming(length)
+    return taps / np.sum(taps)
+
+
+class FirFilter(object):
+    """
+    stateful FIR filter (fft overlap-save), optionally decimating its output
+    """
+
+    def __init__(self, taps, decimation=1):
+        self.decimation = decimation
+        self.phase = 0
+        self.taps = None
+        self.history = None
+        self.setTaps(taps)
+
+    def setTaps(self, taps):
+        taps = np.asarray(taps, dtype=np.complex128)
+        if self.taps is None or len(taps) != len(self.taps):
+            self.history = np.zeros(len(taps) - 1, dtype=np.complex64)
+        self.taps = taps
+        self.nfft = 1 << int(np.ceil(np.log2(max(4 * len(taps), 1024))))
+        self.step = self.nfft - len(taps) + 1
+        self.spectrum = np.fft.fft(taps, self.nfft)
+
+    def process(self, data):
+        overlap = len(self.taps) - 1
+        data = np.concatenate((self.history, data))
+        count = len(data) - overlap
+        if count <= 0:
+            self.history = data
+            return np.zeros(0, dtype=np.complex64)
+        output = np.empty(count, dtype=np.complex64)
+        for start in range(0, count, self.step):
+            length = min(self.step, count - start)
+            block = np.fft.ifft(np.fft.fft(data[start : start + length + overlap], self.nfft) * self.spectrum)
+            output[start : start + length] = block[overlap : overlap + length]
+        self.history = data[count:]
+        if self.decimation > 1:
+            decimated = output[self.phase :: self.decimation]
+            self.phase = (self.phase - count) % self.decimation
+            return decimated
+        return output
+
+
+class Shifter(object):
+    def __init__(self, rate=0.0):
+        self.rate = rate
+        self.phase = 0.0
+
+    def process(self, data):
+        phases = self.phase + 2 * np.pi * self.rate * np.arange(len(data))
+        self.phase = (self.phase + 2 * np.pi * self.rate * len(data)) % (2 * np.pi)
+        return (data * np.exp(1j * phases)).astype(np.complex64)
+
+
+class FractionalResampler(object):
+    """
+    anti-alias filter followed by linear interpolation, like csdr's fractional_decimator_ff
+    """
+
+    def __init__(self, input_rate, output_rate):
+        self.step = float(input_rate) / output_rate
+        self.filter = None
+        if self.step > 1:
+            self.filter = FirFilter(firdes_lowpass(0.45 / self.step, 0.05 / self.step))
+        self.position = 0.0
+        self.last = 0.0
+
+    def process(self, data):
+        if self.filter is not None:
+            data = self.filter.process(data).real
+        data = np.concatenate(([self.last], data))
+        positions = np.arange(self.position, len(data) - 1, self.step)
+        output = np.interp(positions, np.arange(len(data)), data)
+        if len(positions):
+            self.position = positions[-1] + self.step
+        self.position -= len(data) - 1
+        self.last = data[-1]
+        return output
+
+
+class RationalResampler(object):
+    """
+    polyphase resampler by the ratio interpolation / decimation, like csdr's rational_resampler_ff
+    """
+
+    def __init__(self, interpolation, decimation, transition_bw=0.15):
+        self.interpolation = interpolation
+        self.decimation = decimation
+        factor = max(interpolation, decimation)
+        taps = firdes_lowpass(0.5 / factor, transition_bw / factor) * interpolation
+        self.length = -(-len(taps) // interpolation)
+        taps = np.concatenate((taps, np.zeros(self.length * interpolation - len(taps))))
+        # one row per phase; row p holds the taps p, p + interpolation, p + 2 * interpolation, ...
+        self.phases = taps.reshape(self.length, interpolation).T
+        self.history = np.zeros(self.length - 1)
+        # position of the next output sample on the interpolated time axis, relative to the start of the history
+        self.next = (self.length - 1) * interpolation
+
+    @staticmethod
+    def fromRates(input_rate, output_rate, max_factor=1024):
+        """
+        returns None if the ratio between the two rates is not a reasonably small fraction
+        """
+        ratio = Fraction(output_rate).limit_denominator(max_factor) / Fraction(input_rate).limit_denominator(max_factor)
+        if max(ratio.numerator, ratio.denominator) > max_factor:
+            return None
+        return RationalResampler(ratio.numerator, ratio.denominator)
+
+    def process(self, data):
+        data = np.concatenate((self.history, data))
+        end = len(data) * self.interpolation
+        positions = np.arange(self.next, end, self.decimation)
+        indices = positions // self.interpolation
+        windows = data[indices[:, np.newaxis] - np.arange(self.length)]
+        output = np.einsum("ij,ij->i", windows, self.phases[positions % self.interpolation])
+        if len(positions):
+            self.next = positions[-1] + self.decimation
+        self.next -= (len(data) - len(self.history)) * self.interpolation
+        self.history = data[len(data) - len(self.history) :]
+        return output
+
+
+class Agc(object):
+    """
+    block-wise agc: fast attack, slow decay. the gain is interpolated across each block to avoid steps.
+    """
+
+    def __init__(self, reference=0.8, attack=0.5, decay=0.02, max_gain=65536):
+        self.reference = reference
+        self.attack = attack
+        self.decay = decay
+        self.max_gain = max_gain
+        self.gain = 1.0
+
+    def process(self, data):
+        if not len(data):
+            return data
+        peak = np.max(np.abs(data))
+        target = self.max_gain if peak == 0 else min(self.reference / peak, self.max_gain)
+        factor = self.attack if target < self.gain else self.decay
+        gain = self.gain + (target - self.gain) * factor
+        ramp = np.linspace(self.gain, gain, len(data), endpoint=False)
+        self.gain = gain
+        return data * ramp
+
+
+class ImaAdpcmEncoder(object):
+    def __init__(self):
+        self.index = 0
+        self.step = 0
+        self.predictor = 0
+        # two samples go into every byte; an odd sample at the end of a block waits for the next one
+        self.leftover = None
+
+    def encodeSample(self, sample):
+        diff = sample - self.predictor
+        nibble = 0
+        if diff < 0:
+            nibble = 8
+            diff = -diff
+        step = self.step
+        if diff >= step:
+            nibble |= 4
+            diff -= step
+        step >>= 1
+        if diff >= step:
+            nibble |= 2
+            diff -= step
+        step >>= 1
+        if diff >= step:
+            nibble |= 1
+        # keep the state exactly in sync with the decoder
+        self.index = min(max(self.index + imaIndexTable[nibble], 0), 88)
+        delta = self.step >> 3
+        if nibble & 1:
+            delta += self.step >> 2
+        if nibble & 2:
+            delta += self.step >> 1
+        if nibble & 4:
+            delta += self.step
+        if nibble & 8:
+            delta = -delta
+        self.predictor = min(max(self.predictor + delta, -32768), 32767)
+        self.step = imaStepTable[self.index]
+        return nibble
+
+    def encode(self, samples):
+        """
+        the same as encodeSample() for every sample, inlined. every sample depends on the state left behind by the
+        previous one, so this can't be vectorised; see benchmark.adpcm for the throughput.
+        """
+        samples = samples.astype(np.int64).tolist() if isinstance(samples, np.ndarray) else [int(s) for s in samples]
+        if self.leftover is not None:
+            samples.insert(0, self.leftover)
+            self.leftover = None
+        if len(samples) % 2:
+            self.leftover = samples.pop()
+        nibbles = bytearray(len(samples))
+        index = self.index
+        step = self.step
+        predictor = self.predictor
+        for i, sample in enumerate(samples):
+            diff = sample - predictor
+            if diff < 0:
+                nibble = 8
+                diff = -diff
+            else:
+                nibble = 0
+            if diff >= step:
+                nibble |= 4
+                diff -= step
+            if diff >= step >> 1:
+                nibble |= 2
+                diff -= step >> 1
+            if diff >= step >> 2:
+                nibble |= 1
+            predictor += imaDeltaTable[step][nibble]
+            if predictor > 32767:
+                predictor = 32767
+            elif predictor < -32768:
+                predictor = -32768
+            index = imaNextIndex[index][nibble]
+            step = imaStepTable[index]
+            nibbles[i] = nibble
+        self.index = index
+        self.step = step
+        self.predictor = predictor
+        packed = np.frombuffer(bytes(nibbles), dtype=np.uint8)
+        return (packed[0::2] | packed[1::2] << 4).tobytes()
+
+
+class ControlFifo(object):
+    """
+    non-blocking reader for a csdr style control fifo. only the most recent value counts.
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK) if path is not None else None
+        self.buffer = b""
+
+    def poll(self):
+        if self.fd is None:
+            return None
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.buffer += data
+        if b"\n" not in self.buffer:
+            return None
+        lines = self.buffer.split(b"\n")
+        self.buffer = lines[-1]
+        values = [l for l in lines[:-1] if l.strip()]
+        if not values:
+            return None
+        return [float(v) for v in values[-1].split()]
+
+
+class SmeterFifo(object):
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def write(self, values):
+        if self.path is None:
+            return
+        if self.fd is None:
+            try:
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                # nobody is reading yet
+                if e.errno == errno.ENXIO:
+                    return
+                raise
+        try:
+            os.write(self.fd, "".join("%g\n" % v for v in values).encode())
+        except BlockingIOError:
+            pass
+
+
+class ControlSocket(object):
+    """
+    the worker end of the control socket: receives commands, sends s-meter events
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        os.set_blocking(fd, False)
+        self.decoder = control.FrameDecoder()
+
+    def poll(self):
+        """
+        returns the most recent values of every command that came in since the last poll
+        """
+        commands = {}
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            for (frame_type, payload) in self.decoder.feed(data):
+                commands[frame_type] = control.decode_values(payload)
+        return commands
+
+    def sendSmeter(self, values):
+        if not values:
+            return
+        try:
+            os.write(self.fd, control.encode_values(control.SMETER, values))
+        except BlockingIOError:
+            # nobody is reading, drop the values
+            pass
+
+
+class NumpyDsp(object):
+    demodulators = ["nfm", "am", "ssb"]
+    # squelch_and_smeter_cc counts its report interval in buffers of this size
+    csdr_bufsize = 1024
+
+    def __init__(
+        self,
+        demodulator,
+        decimation,
+        ddc_transition_bw,
+        bpf_transition_bw,
+        if_rate,
+        output_rate,
+        smeter_report_every=None,
+        adpcm=False,
+    ):
+        self.demodulator = demodulator
+        self.shifter = Shifter()
+        self.ddc = None
+        if decimation > 1:
+            self.ddc = FirFilter(firdes_lowpass(0.5 / decimation, ddc_transition_bw), decimation)
+        self.bpf_transition_bw = bpf_transition_bw
+        self.bpf = FirFilter(firdes_bandpass(-4000 / if_rate, 4000 / if_rate, bpf_transition_bw))
+        self.squelch_level = 0.0
+        self.smeter_report_every = smeter_report_every * NumpyDsp.csdr_bufsize if smeter_report_every else None
+        self.smeter_buffer = np.zeros(0, dtype=np.float32)
+        self.smeter_values = []
+        self.last_iq = np.complex64(0)
+        self.dc = 0.0
+        self.resampler = RationalResampler.fromRates(if_rate, output_rate)
+        if self.resampler is None:
+            self.resampler = FractionalResampler(if_rate, output_rate)
+        self.deemphasis = FirFilter(firdes_deemphasis(output_rate)) if demodulator == "nfm" else None
+        self.agc = Agc() if demodulator in ["am", "ssb"] else None
+        self.adpcm = ImaAdpcmEncoder() if adpcm else None
+
+    def setShift(self, rate):
+        self.shifter.rate = rate
+
+    def setBandpass(self, low_cut, high_cut):
+        self.bpf.setTaps(firdes_bandpass(low_cut, high_cut, self.bpf_transition_bw))
+
+    def setSquelchLevel(self, level):
+        self.squelch_level = level
+
+    def getSmeterValues(self):
+        values = self.smeter_values
+        self.smeter_values = []
+        return values
+
+    def squelch(self, data):
+        power = np.abs(data) ** 2
+        if self.smeter_report_every:
+            power_buffer = np.concatenate((self.smeter_buffer, power))
+            count = len(power_buffer) // self.smeter_report_every
+            if count:
+                blocks = power_buffer[: count * self.smeter_report_every].reshape(count, self.smeter_report_every)
+                self.smeter_values += list(np.mean(blocks, axis=1))
+            self.smeter_buffer = power_buffer[count * self.smeter_report_every :]
+        if len(data) and np.mean(power) < self.squelch_level:
+            return np.zeros(len(data), dtype=np.complex64)
+        return data
+
+    def demodulate(self, data):
+        if self.demodulator == "nfm":
+            extended = np.concatenate(([self.last_iq], data))
+            if len(data):
+                self.last_iq = data[-1]
+            # same scale as csdr's fmdemod_quadri_cf: the phase difference in radians
+            return np.clip(np.angle(extended[1:] * np.conj(extended[:-1])), -1, 1)
+        elif self.demodulator == "am":
+            audio = np.abs(data)
+            if len(audio):
+                self.dc = self.dc * 0.9 + np.mean(audio) * 0.1
+            return audio - self.dc
+        elif self.demodulator == "ssb":
+            return data.real
+        raise ValueError("unsupported demodulator: {0}".format(self.demodulator))
+
+    def process(self, iq):
+        data = self.shifter.process(iq)
+        if self.ddc is not None:
+            data = self.ddc.process(data)
+        data = self.bpf.process(data)
+        data = self.squelch(data)
+        audio = self.resampler.process(self.demodulate(data))
+        if self.deemphasis is not None:
+            audio = self.deemphasis.process(audio).real
+        if self.agc is not None:
+            audio = self.agc.process(audio)
+        audio = (np.clip(audio, -1, 1) * 32767).astype("<i2")
+        if self.adpcm is not None:
+            return self.adpcm.encode(audio)
+        return audio.tobytes()
+
+
+def readInput():
+    while True:
+        data = os.read(0, 65536)
+        if not data:
+            return
+        yield data
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python3 -m csdr.numpy_dsp")
+    parser.add_argument("demodulator", choices=NumpyDsp.demodulators)
+    parser.add_argument("--decimation", type=int, default=1)
+    parser.add_argument("--ddc-transition-bw", type=float, default=0.15)
+    parser.add_argument("--bpf-transition-bw", type=float, required=True)
+    parser.add_argument("--if-rate", type=float, required=True)
+    parser.add_argument("--output-rate", type=int, required=True)
+    parser.add_argument("--shift", type=float, default=0.0, help="initial shift rate")
+    parser.add_argument("--bandpass", type=float, nargs=2, help="initial bandpass low and high cut")
+    parser.add_argument("--shift-fifo")
+    parser.add_argument("--bpf-fifo")
+    parser.add_argument("--squelch-fifo")
+    parser.add_argument("--smeter-fifo")
+    parser.add_argument("--smeter-report-every", type=int)
+    parser.add_argument("--control-fd", type=int, help="control socket, replaces the fifos")
+    parser.add_argument("--adpcm", action="store_true")
+    parser.add_argument("--ringbuffer", help="read the IQ data from this ring buffer instead of stdin")
+    options = parser.parse_args(args)
+
+    dsp = NumpyDsp(
+        options.demodulator,
+        options.decimation,
+        options.ddc_transition_bw,
+        options.bpf_transition_bw,
+        options.if_rate,
+        options.output_rate,
+        smeter_report_every=options.smeter_report_every if options.smeter_fifo or options.control_fd else None,
+        adpcm=options.adpcm,
+    )
+    dsp.setShift(options.shift)
+    if options.bandpass is not None:
+        dsp.setBandpass(*options.bandpass)
+    shift = ControlFifo(options.shift_fifo)
+    bpf = ControlFifo(options.bpf_fifo)
+    squelch = ControlFifo(options.squelch_fifo)
+    smeter = SmeterFifo(options.smeter_fifo)
+    control_socket = ControlSocket(options.control_fd) if options.control_fd is not None else None
+
+    out = sys.stdout.buffer
+    remainder = b""
+    # reading the ring directly saves the reader process and the copy through its pipe
+    for data in readStream(options.ringbuffer) if options.ringbuffer is not None else readInput():
+        data = remainder + data
+        usable = len(data) - len(data) % 8
+        remainder = data[usable:]
+
+        value = shift.poll()
+        if value is not None:
+            dsp.setShift(value[0])
+        value = bpf.poll()
+        if value is not None:
+            dsp.setBandpass(*value[0:2])
+        value = squelch.poll()
+        if value is not None:
+            dsp.setSquelchLevel(value[0])
+        if control_socket is not None:
+            commands = control_socket.poll()
+            if control.SHIFT in commands:
+                dsp.setShift(commands[control.SHIFT][0])
+            if control.BPF in commands:
+                dsp.setBandpass(*commands[control.BPF][0:2])
+            if control.SQUELCH in commands:
+                dsp.setSquelchLevel(commands[control.SQUELCH][0])
+
+        output = dsp.process(np.frombuffer(data[:usable], dtype=np.complex64))
+        smeter_values = dsp.getSmeterValues()
+        smeter.write(smeter_values)
+        if control_socket is not None:
+            control_socket.sendSmeter(smeter_values)
+        if output:
+            out.write(output)
+            out.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -0,0 +1,88 @@
+"""
+IQ file playback
+
+    Writes the samples of a recording to stdout, paced to the sample rate (or a multiple of it), so it can take the
+    place of an SDR in front of nmux. The data is passed on as it is; the conversion to complex float happens in the
+    following pipeline stage.
+
+        python3 -m csdr.playback --file <path> --format cu8|cs8|cs16|cf32 --samp-rate <rate> [options]
+"""
+
+import argparse
+import time
+import sys
+import os
+
+# bytes per complex sample
+sample_sizes = {"cu8": 2, "cs8": 2, "cs16": 4, "cf32": 8}
+
+
+class Playback(object):
+    def __init__(self, file, format, samp_rate, loop=False, seek=0, speed=1.0, block_time=0.02):
+        """
+        :param seek: position to start at, in seconds
+        :param speed: playback speed relative to real time, 0 to play as fast as possible
+        """
+        if format not in sample_sizes:
+            raise ValueError("unsupported sample format: {0}".format(format))
+        self.file = file
+        self.sample_size = sample_sizes[format]
+        self.samp_rate = samp_rate
+        self.loop = loop
+        self.speed = speed
+        self.block_size = max(int(samp_rate * block_time), 1) * self.sample_size
+        # a trailing partial sample is never played, and looping must not shift the sample alignment
+        self.length = os.path.getsize(file) // self.sample_size * self.sample_size
+        self.offset = int(seek * samp_rate) * self.sample_size
+        if self.length and self.offset >= self.length:
+            if not loop:
+                raise ValueError("seek position is beyond the end of the recording")
+            self.offset %= self.length
+
+    def blocks(self):
+        with open(self.file, "rb") as f:
+            f.seek(self.offset)
+            position = self.offset
+            while self.length:
+                data = f.read(min(self.block_size, self.length - position))
+                if not data:
+                    if not self.loop:
+                        return
+                    f.seek(0)
+                    position = 0
+                    continue
+                position += len(data)
+                yield data
+
+    def play(self, out):
+        start = time.monotonic()
+        written = 0
+        for data in self.blocks():
+            out.write(data)
+            out.flush()
+            written += len(data)
+            if self.speed > 0:
+                delay = start + written / self.sample_size / self.samp_rate / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python3 -m csdr.playback")
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--format", required=True, choices=sample_sizes.keys())
+    parser.add_argument("--samp-rate", type=int, required=True)
+    parser.add_argument("--loop", action="store_true", help="start over at the end of the recording")
+    parser.add_argument("--seek", type=float, default=0, help="start position in seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="relative to real time, 0 for as fast as possible")
+    options = parser.parse_args(args)
+
+    playback = Playback(options.file, options.format, options.samp_rate, options.loop, options.seek, options.speed)
+    playback.play(sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
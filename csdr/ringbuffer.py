@@ -0,0 +1,427 @@
+"""
+Single-producer, multi-reader IQ ring buffer in a memory-mapped file
+
+    The producer appends the wideband IQ stream to a file (usually on /dev/shm) that is mapped into memory, and every
+    consumer maps the same file read-only and keeps its own cursor. Compared to nmux and one nc connection per
+    consumer, the data does not have to pass through the loopback socket stack once per consumer.
+
+    This module can be run as a pipeline tool:
+
+        python3 -m csdr.ringbuffer write [--tee] <path> <size>
+        python3 -m csdr.ringbuffer read <path>
+        python3 -m csdr.ringbuffer extract <path> <start> <length>
+
+    extract copies a range of the stream (by absolute position, as returned by getPositionAt()) to stdout and exits.
+
+    Readers don't poll: each one binds a unix datagram socket in the <path>.readers directory, and the writer sends
+    every one of them a datagram after each write (see Doorbell). Consumers written in Python (like the numpy dsp
+    backend) can also map the ring themselves through readStream() instead of going through a reader process.
+
+    The write position is 64 bits wide, which can't be written atomically on 32 bit platforms. It is published
+    together with a sequence number that is odd while an update is in progress, and readers retry until they get a
+    consistent copy.
+"""
+
+import mmap
+import os
+import select
+import shutil
+import socket
+import struct
+import sys
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RingBufferException(Exception):
+    pass
+
+
+class Overrun(RingBufferException):
+    pass
+
+
+class RingBuffer(object):
+    MAGIC = b"OWRXRING"
+    # magic, data size, sequence number, write position (total bytes written), timestamp of the last write
+    HEADER = struct.Struct("<8sQI4xQd")
+    SEQUENCE = struct.Struct("<I")
+    SEQUENCE_OFFSET = 16
+    POSITION = struct.Struct("<Qd")
+    POSITION_OFFSET = 24
+    HEADER_SIZE = 64
+    # complex float samples; readers only ever start at sample boundaries
+    ALIGNMENT = 8
+
+    @staticmethod
+    def getReaderCommand(path):
+        return "{python} -m csdr.ringbuffer read {path}".format(python=sys.executable, path=path)
+
+    @staticmethod
+    def getWriterCommand(path, size, tee=False):
+        return "{python} -m csdr.ringbuffer write {tee}{path} {size}".format(
+            python=sys.executable, tee="--tee " if tee else "", path=path, size=int(size)
+        )
+
+    @staticmethod
+    def getExtractCommand(path, start, length):
+        return "{python} -m csdr.ringbuffer extract {path} {start} {length}".format(
+            python=sys.executable, path=path, start=int(start), length=int(length)
+        )
+
+    def __init__(self, path, size, mm):
+        self.path = path
+        self.size = size
+        self.mm = mm
+
+    def _readPosition(self):
+        """
+        the write position and time of the last write, as a consistent pair
+        """
+        while True:
+            (sequence,) = RingBuffer.SEQUENCE.unpack_from(self.mm, RingBuffer.SEQUENCE_OFFSET)
+            if sequence & 1:
+                # the writer is in the middle of an update
+                continue
+            result = RingBuffer.POSITION.unpack_from(self.mm, RingBuffer.POSITION_OFFSET)
+            if RingBuffer.SEQUENCE.unpack_from(self.mm, RingBuffer.SEQUENCE_OFFSET)[0] == sequence:
+                return result
+
+    def getWritePosition(self):
+        return self._readPosition()[0]
+
+    def getLastWriteTime(self):
+        return self._readPosition()[1]
+
+    def getSize(self):
+        return self.size
+
+    def getAvailableRange(self):
+        """
+        the absolute stream positions of the oldest and the newest byte that are still in the ring
+        """
+        write_position = self.getWritePosition()
+        return max(write_position - self.size, 0), write_position
+
+    def getPositionAt(self, timestamp, byte_rate):
+        """
+        the stream position of the data that came in at timestamp, estimated from the time of the last write. only
+        meaningful for streams that are written at a constant rate.
+        """
+        position = self.getWritePosition() - int((self.getLastWriteTime() - timestamp) * byte_rate)
+        return position - position % RingBuffer.ALIGNMENT
+
+    def readRange(self, start, length):
+        """
+        copy bytes from the ring by absolute stream position. does not check whether the data is still available.
+        """
+        offset = start % self.size
+        end = offset + length
+        if end <= self.size:
+            return self.mm[RingBuffer.HEADER_SIZE + offset : RingBuffer.HEADER_SIZE + end]
+        first = self.size - offset
+        return (
+            self.mm[RingBuffer.HEADER_SIZE + offset : RingBuffer.HEADER_SIZE + self.size]
+            + self.mm[RingBuffer.HEADER_SIZE : RingBuffer.HEADER_SIZE + length - first]
+        )
+
+    def close(self):
+        self.mm.close()
+
+
+class Doorbell(object):
+    """
+    the writer side of the reader notification. the list of readers is taken from the directory every
+    rescanInterval seconds, not on every write; new readers poll until they have been picked up (see
+    DoorbellListener).
+    """
+
+    rescanInterval = 0.5
+
+    @staticmethod
+    def getDirectory(path):
+        return path + ".readers"
+
+    def __init__(self, path):
+        self.directory = Doorbell.getDirectory(path)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.readers = []
+        self.lastScan = None
+
+    def _scan(self):
+        now = time.monotonic()
+        if self.lastScan is not None and now - self.lastScan < Doorbell.rescanInterval:
+            return
+        self.lastScan = now
+        try:
+            self.readers = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        except FileNotFoundError:
+            self.readers = []
+
+    def ring(self):
+        self._scan()
+        for reader in self.readers:
+            try:
+                self.socket.sendto(b"\x00", reader)
+            except BlockingIOError:
+                # the reader hasn't picked up its previous notifications yet, so it will read anyway
+                pass
+            except (FileNotFoundError, ConnectionRefusedError):
+                # left behind by a reader that went away without cleaning up
+                try:
+                    os.unlink(reader)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.socket.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class DoorbellListener(object):
+    """
+    the reader side of the doorbell. notifications queue up in the socket, so none are lost between checking the
+    ring and going to sleep. until the writer has found the new socket, wait() only sleeps for pollInterval.
+    """
+
+    pollInterval = 0.02
+
+    def __init__(self, path):
+        self.rung = False
+        self.address = os.path.join(Doorbell.getDirectory(path), "{0}.{1}".format(os.getpid(), id(self)))
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.socket.bind(self.address)
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+
+    def wait(self, timeout):
+        if not self.rung:
+            timeout = min(timeout, DoorbellListener.pollInterval)
+        select.select([self.socket], [], [], timeout)
+        while True:
+            try:
+                self.socket.recv(64)
+                self.rung = True
+            except BlockingIOError:
+                return
+
+    def close(self):
+        self.socket.close()
+        try:
+            os.unlink(self.address)
+        except FileNotFoundError:
+            pass
+
+
+class RingBufferWriter(RingBuffer):
+    def __init__(self, path, size):
+        size = int(size) - int(size) % RingBuffer.ALIGNMENT
+        if size <= 0:
+            raise RingBufferException("ring buffer size must be positive")
+        # before the ring itself, so readers that find the ring can always register
+        self.doorbell = Doorbell(path)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, RingBuffer.HEADER_SIZE + size)
+            mm = mmap.mmap(fd, RingBuffer.HEADER_SIZE + size)
+        finally:
+            os.close(fd)
+        super().__init__(path, size, mm)
+        self.position = 0
+        self._writeHeader()
+
+    def _writeHeader(self):
+        RingBuffer.HEADER.pack_into(self.mm, 0, RingBuffer.MAGIC, self.size, 0, self.position, time.time())
+        self.sequence = 0
+
+    def _publish(self):
+        # seqlock: readers retry while the sequence number is odd, or if it changed while they were reading
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        RingBuffer.SEQUENCE.pack_into(self.mm, RingBuffer.SEQUENCE_OFFSET, self.sequence)
+        RingBuffer.POSITION.pack_into(self.mm, RingBuffer.POSITION_OFFSET, self.position, time.time())
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        RingBuffer.SEQUENCE.pack_into(self.mm, RingBuffer.SEQUENCE_OFFSET, self.sequence)
+
+    def write(self, data):
+        data = memoryview(data)
+        # anything that would be overwritten within this call anyway doesn't need to be copied
+        if len(data) > self.size:
+            self.position += len(data) - self.size
+            data = data[len(data) - self.size :]
+        offset = self.position % self.size
+        first = min(len(data), self.size - offset)
+        base = RingBuffer.HEADER_SIZE
+        self.mm[base + offset : base + offset + first] = data[:first]
+        if first < len(data):
+            self.mm[base : base + len(data) - first] = data[first:]
+        # publish only after the data is in place
+        self.position += len(data)
+        self._publish()
+        self.doorbell.ring()
+
+    def close(self):
+        super().close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.doorbell.close()
+
+
+class RingBufferReader(RingBuffer):
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        (magic, size, _, _, _) = RingBuffer.HEADER.unpack_from(mm, 0)
+        if magic != RingBuffer.MAGIC:
+            mm.close()
+            raise RingBufferException("{0} is not a ring buffer".format(path))
+        super().__init__(path, size, mm)
+        self.overruns = 0
+        # new readers start with the most recent data, just like a new nmux client
+        self.cursor = self._align(self.getWritePosition())
+
+    def _align(self, position):
+        return position - position % RingBuffer.ALIGNMENT
+
+    def available(self):
+        return self.getWritePosition() - self.cursor
+
+    def read(self, max_bytes=65536):
+        """
+        returns the next chunk of data, or an empty bytes object if nothing is available.
+        raises Overrun if the writer has overtaken this reader; the cursor is then moved forward so that the next
+        read can continue with current data.
+        """
+        write_position = self.getWritePosition()
+        if write_position - self.cursor > self.size:
+            self._skip(write_position)
+        length = min(write_position - self.cursor, max_bytes)
+        if length <= 0:
+            return b""
+        data = self.readRange(self.cursor, length)
+        # the writer may have overwritten parts of what we just copied
+        if self.getWritePosition() - self.cursor > self.size:
+            self._skip(self.getWritePosition())
+        self.cursor += length
+        return data
+
+    def _skip(self, write_position):
+        self.overruns += 1
+        # resume in the middle of the buffer to give the reader some room before the next overrun
+        self.cursor = self._align(write_position - self.size // 2)
+        raise Overrun("reader overrun on {0}".format(self.path))
+
+
+def _write(path, size, tee):
+    writer = RingBufferWriter(path, size)
+    try:
+        while True:
+            data = os.read(0, 65536)
+            if not data:
+                break
+            writer.write(data)
+            if tee:
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+    finally:
+        writer.close()
+
+
+def readStream(path, max_bytes=65536):
+    """
+    yields the data from the ring as it comes in, starting with the most recent data. waits for the writer to set up
+    the ring, and skips ahead on overruns.
+    """
+    reader = None
+    retries = 100
+    while reader is None:
+        try:
+            reader = RingBufferReader(path)
+        except (FileNotFoundError, ValueError, RingBufferException):
+            # the writer may not have set up the file yet
+            retries -= 1
+            if retries <= 0:
+                raise
+            time.sleep(0.1)
+    doorbell = DoorbellListener(path)
+    try:
+        while True:
+            try:
+                data = reader.read(max_bytes)
+            except Overrun:
+                logger.warning("ring buffer overrun on %s (%i total)", path, reader.overruns)
+                continue
+            if data:
+                yield data
+            else:
+                # the timeout only matters if the writer has gone away
+                doorbell.wait(1)
+    finally:
+        doorbell.close()
+        reader.close()
+
+
+def _read(path):
+    out = sys.stdout.buffer
+    for data in readStream(path):
+        out.write(data)
+        out.flush()
+
+
+def _extract(path, start, length):
+    reader = RingBufferReader(path)
+    try:
+        (oldest, newest) = reader.getAvailableRange()
+        if start < oldest:
+            logger.warning("start of the range has already been overwritten, skipping %i bytes", oldest - start)
+            length -= oldest - start
+            start = oldest
+        end = min(start + length, newest)
+        out = sys.stdout.buffer
+        position = start
+        while position < end:
+            chunk = min(end - position, 65536)
+            data = reader.readRange(position, chunk)
+            # the writer may have overtaken us while copying
+            if reader.getWritePosition() - position > reader.getSize():
+                raise Overrun("range has been overwritten during extraction")
+            out.write(data)
+            position += chunk
+        out.flush()
+    finally:
+        reader.close()
+
+
+def main(args):
+    if len(args) >= 3 and args[0] == "write":
+        tee = args[1] == "--tee"
+        if tee:
+            args = args[1:]
+        _write(args[1], int(args[2]), tee)
+    elif len(args) == 2 and args[0] == "read":
+        _read(args[1])
+    elif len(args) == 4 and args[0] == "extract":
+        _extract(args[1], int(args[2]), int(args[3]))
+    else:
+        print(__doc__, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -0,0 +1,209 @@
+from owrx.reactor import Reactor
+from owrx.metrics import Metrics, DirectMetric
+import threading
+import time
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessStat(object):
+    def __init__(self, pid, pgid, ticks, rss):
+        self.pid = pid
+        self.pgid = pgid
+        # cpu time including all children that have already been waited for
+        self.ticks = ticks
+        self.rss = rss
+
+
+class TrackedProcess(object):
+    def __init__(self, process, owner, kind, group):
+        self.process = process
+        self.owner = owner
+        self.kind = kind
+        # processes started with start_new_session lead their own process group, and all commands of a pipeline are
+        # accounted to it
+        self.group = group
+        self.lastTicks = None
+        self.lastSample = None
+        self.cpu = 0.0
+        self.rss = 0
+        self.processes = 0
+        self.cpuTime = 0.0
+
+    def getOwner(self):
+        if callable(self.owner):
+            return self.owner()
+        return self.owner
+
+    def update(self, stats, now, clockTicks):
+        ticks = sum(s.ticks for s in stats)
+        if self.lastTicks is not None and now > self.lastSample:
+            # members that have exited but not been waited for yet may cause small jumps backwards
+            delta = max(ticks - self.lastTicks, 0)
+            self.cpu = delta / clockTicks / (now - self.lastSample)
+            self.cpuTime += delta / clockTicks
+        elif self.lastTicks is None:
+            self.cpuTime = ticks / clockTicks
+        if stats:
+            self.lastTicks = ticks
+            self.lastSample = now
+        self.rss = sum(s.rss for s in stats)
+        self.processes = len(stats)
+
+
+class ProcessAccounting(object):
+    """
+    attributes cpu and memory usage to the owners of the processes (clients, services, sdr sources) by sampling
+    /proc/<pid>/stat and statm of every tracked process group
+    """
+
+    sharedInstance = None
+    creationLock = threading.Lock()
+    interval = 3
+
+    @staticmethod
+    def getSharedInstance():
+        with ProcessAccounting.creationLock:
+            if ProcessAccounting.sharedInstance is None:
+                ProcessAccounting.sharedInstance = ProcessAccounting()
+        return ProcessAccounting.sharedInstance
+
+    def __init__(self, procPath="/proc"):
+        self.procPath = procPath
+        self.lock = threading.Lock()
+        self.tracked = {}
+        # cpu time of processes that have ended, per owner
+        self.finished = {}
+        self.timer = None
+        try:
+            self.clockTicks = os.sysconf("SC_CLK_TCK")
+            self.pageSize = os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            self.clockTicks = 100
+            self.pageSize = 4096
+        Metrics.getSharedInstance().addMetric("resources", DirectMetric(self.getUsage))
+
+    def isAvailable(self):
+        return os.path.isdir(self.procPath)
+
+    def track(self, process, owner, kind, group=True):
+        """
+        :param owner: the name that the usage will be reported for, or a callable that returns it
+        :param kind: what the process does for its owner (dsp, decoder, ...)
+        """
+        if not self.isAvailable():
+            return
+        with self.lock:
+            self.tracked[process.pid] = TrackedProcess(process, owner, kind, group)
+            if self.timer is None:
+                self.scheduleSample()
+
+    def untrack(self, process):
+        """
+        takes a last sample, so this should be called before the process is waited for. this runs on the reactor
+        thread for every process exit, so it only reads the stat of the process itself instead of scanning /proc for
+        the rest of its group: a shell has waited for the other commands of its pipeline before it ends, so their cpu
+        time is already included in its own.
+        """
+        with self.lock:
+            tracked = self.tracked.pop(process.pid, None)
+        if tracked is None:
+            return
+        stat = self.readStat(process.pid)
+        tracked.update([] if stat is None else [stat], time.monotonic(), self.clockTicks)
+        with self.lock:
+            owner = tracked.getOwner()
+            self.finished[owner] = self.finished.get(owner, 0.0) + tracked.cpuTime
+
+    def scheduleSample(self):
+        # must be called with the lock held
+        reactor = Reactor.getSharedInstance()
+        self.timer = reactor.callLater(ProcessAccounting.interval, lambda: reactor.submit(self.sample))
+
+    def sample(self):
+        with self.lock:
+            tracked = list(self.tracked.values())
+            self.timer = None
+            if self.tracked:
+                self.scheduleSample()
+            # forget about owners that are gone (clients that have disconnected)
+            owners = set(t.getOwner() for t in tracked)
+            self.finished = {o: v for o, v in self.finished.items() if o in owners}
+        self.sampleProcesses(tracked)
+
+    def sampleProcesses(self, tracked):
+        if not tracked:
+            return
+        groups = set(t.process.pid for t in tracked if t.group)
+        pids = set(t.process.pid for t in tracked if not t.group)
+        if groups:
+            stats = self.scan(groups, pids)
+        else:
+            stats = [s for s in (self.readStat(pid) for pid in pids) if s is not None]
+        now = time.monotonic()
+        for t in tracked:
+            if t.group:
+                members = [s for s in stats if s.pgid == t.process.pid]
+            else:
+                members = [s for s in stats if s.pid == t.process.pid]
+            t.update(members, now, self.clockTicks)
+
+    def scan(self, groups, pids):
+        stats = []
+        try:
+            entries = os.listdir(self.procPath)
+        except OSError:
+            return stats
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            stat = self.readStat(pid, None if pid in pids else groups)
+            if stat is not None:
+                stats.append(stat)
+        return stats
+
+    def readStat(self, pid, groups=None):
+        try:
+            with open("{0}/{1}/stat".format(self.procPath, pid), "r") as f:
+                line = f.read()
+            # the process name may contain spaces and parentheses
+            fields = line[line.rindex(")") + 2 :].split(" ")
+            pgid = int(fields[2])
+            if groups is not None and pgid not in groups:
+                return None
+            ticks = int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+            with open("{0}/{1}/statm".format(self.procPath, pid), "r") as f:
+                rss = int(f.read().split(" ")[1]) * self.pageSize
+        except (OSError, ValueError, IndexError):
+            # gone in the meantime
+            return None
+        return ProcessStat(pid, pgid, ticks, rss)
+
+    def getUsage(self):
+        with self.lock:
+            tracked = list(self.tracked.values())
+            result = {owner: {"cpu": 0.0, "rss": 0, "processes": 0, "cpu_time": cpuTime, "kinds": {}}
+                      for owner, cpuTime in self.finished.items()}
+        for t in tracked:
+            owner = t.getOwner()
+            if owner not in result:
+                result[owner] = {"cpu": 0.0, "rss": 0, "processes": 0, "cpu_time": 0.0, "kinds": {}}
+            usage = result[owner]
+            usage["cpu"] += t.cpu
+            usage["rss"] += t.rss
+            usage["processes"] += t.processes
+            usage["cpu_time"] += t.cpuTime
+            if t.kind not in usage["kinds"]:
+                usage["kinds"][t.kind] = {"cpu": 0.0, "rss": 0}
+            usage["kinds"][t.kind]["cpu"] += t.cpu
+            usage["kinds"][t.kind]["rss"] += t.rss
+        for usage in result.values():
+            usage["cpu"] = round(usage["cpu"], 3)
+            usage["cpu_time"] = round(usage["cpu_time"], 2)
+            for kind in usage["kinds"].values():
+                kind["cpu"] = round(kind["cpu"], 3)
+        return result
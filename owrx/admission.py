@@ -0,0 +1,283 @@
+from owrx.config import Config
+from owrx.accounting import ProcessAccounting
+from owrx.reactor import Reactor
+from owrx.metrics import Metrics, DirectMetric, CounterMetric
+import threading
+import weakref
+import time
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CostModel(object):
+    """
+    estimated cpu usage (in cores) of the parts of a dsp chain. starts out with rough defaults and learns from the
+    usage that is measured for the running chains.
+    """
+
+    # per MS/s that goes through the shift and decimation
+    defaultDdc = 0.06
+    defaultDemodulator = 0.02
+    defaultDigitalVoice = 0.1
+    defaultSecondaryFft = 0.02
+    defaultSecondary = 0.04
+    digitalVoiceModes = ["dmr", "dstar", "nxdn", "ysf"]
+    # weight of a new measurement
+    smoothing = 0.2
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.costs = {}
+
+    def getDefault(self, key):
+        if key == "ddc":
+            return CostModel.defaultDdc
+        if key == "secondary_fft":
+            return CostModel.defaultSecondaryFft
+        (kind, mode) = key.split(".", 1)
+        if kind == "secondary":
+            return CostModel.defaultSecondary
+        if mode in CostModel.digitalVoiceModes:
+            return CostModel.defaultDigitalVoice
+        return CostModel.defaultDemodulator
+
+    def get(self, key):
+        with self.lock:
+            if key in self.costs:
+                return self.costs[key]
+        return self.getDefault(key)
+
+    def learn(self, key, value):
+        with self.lock:
+            if key in self.costs:
+                self.costs[key] += (value - self.costs[key]) * CostModel.smoothing
+            else:
+                self.costs[key] = value
+
+    def estimate(self, samp_rate, mod=None, secondary_mod=None, secondary_fft=False):
+        cost = self.get("ddc") * samp_rate / 1e6
+        if mod:
+            cost += self.get("demodulator." + mod)
+        if secondary_mod:
+            cost += self.get("secondary." + secondary_mod)
+            if secondary_fft:
+                cost += self.get("secondary_fft")
+        return cost
+
+    def estimateSettings(self, samp_rate, settings):
+        secondary_mod = settings.get("secondary_mod") or None
+        return self.estimate(samp_rate, settings.get("mod"), secondary_mod, secondary_mod is not None)
+
+    def learnFromUsage(self, samp_rate, mod, secondary_mod, kinds):
+        """
+        :param kinds: the measured usage per kind of process, as reported by the ProcessAccounting
+        """
+
+        def cpu(*names):
+            return sum(kinds[n]["cpu"] for n in names if n in kinds)
+
+        # without a separate demodulator process, the front chain does everything and can't be told apart
+        if "demodulator" in kinds:
+            if cpu("dsp") > 0 and samp_rate > 0:
+                self.learn("ddc", cpu("dsp") / (samp_rate / 1e6))
+            if cpu("demodulator") > 0:
+                self.learn("demodulator." + mod, cpu("demodulator"))
+        if secondary_mod and cpu("secondary", "decoder") > 0:
+            self.learn("secondary." + secondary_mod, cpu("secondary", "decoder"))
+        if cpu("secondary_fft") > 0:
+            self.learn("secondary_fft", cpu("secondary_fft"))
+
+    def getValue(self):
+        with self.lock:
+            return {k: round(v, 4) for k, v in self.costs.items()}
+
+
+class AdmissionController(object):
+    """
+    keeps the estimated cpu usage of all dsp chains within the configured budget. requests that don't fit are
+    degraded (no secondary fft, lower waterfall frame rate) or rejected.
+    """
+
+    ADMIT = 0
+    DEGRADE = 1
+    REJECT = 2
+
+    sharedInstance = None
+    creationLock = threading.Lock()
+    # admitted chains count with their estimate until their usage shows up in the measurements
+    reservationTime = 10
+    # degraded waterfalls are restored once the load has dropped below this part of the budget
+    recoveryThreshold = 0.7
+    recoveryInterval = 10
+
+    @staticmethod
+    def getSharedInstance():
+        with AdmissionController.creationLock:
+            if AdmissionController.sharedInstance is None:
+                AdmissionController.sharedInstance = AdmissionController()
+        return AdmissionController.sharedInstance
+
+    def __init__(self):
+        self.model = CostModel()
+        self.lock = threading.Lock()
+        self.reservations = []
+        self.dsps = weakref.WeakSet()
+        self.spectrums = weakref.WeakSet()
+        self.degraded = False
+        self.recoveryTimer = None
+        self.lastLearned = None
+        self.rejected = CounterMetric()
+        self.degradations = CounterMetric()
+
+        metrics = Metrics.getSharedInstance()
+        metrics.addMetric("admission.budget", DirectMetric(self.getBudget))
+        metrics.addMetric("admission.load", DirectMetric(self.getLoad))
+        metrics.addMetric("admission.costs", DirectMetric(self.model.getValue))
+        metrics.addMetric("admission.rejected", self.rejected)
+        metrics.addMetric("admission.degraded", self.degradations)
+
+    def getBudget(self):
+        """
+        the budget in cores, or None if admission control is disabled
+        """
+        pm = Config.get()
+        if "cpu_budget" not in pm or pm["cpu_budget"] is None:
+            return None
+        return pm["cpu_budget"] * (os.cpu_count() or 1)
+
+    def isEnabled(self):
+        return self.getBudget() is not None and ProcessAccounting.getSharedInstance().isAvailable()
+
+    def getLoad(self):
+        usage = ProcessAccounting.getSharedInstance().getUsage()
+        load = sum(u["cpu"] for u in usage.values())
+        now = time.monotonic()
+        with self.lock:
+            self.reservations = [r for r in self.reservations if r[0] > now]
+            load += sum(r[1] for r in self.reservations)
+        return round(load, 3)
+
+    def reserve(self, cost):
+        if cost <= 0:
+            return
+        with self.lock:
+            self.reservations.append((time.monotonic() + AdmissionController.reservationTime, cost))
+
+    def addDsp(self, dsp):
+        """
+        running dsps are measured to improve the estimates
+        """
+        self.dsps.add(dsp)
+
+    def addSpectrum(self, spectrum):
+        self.spectrums.add(spectrum)
+
+    def learn(self):
+        now = time.monotonic()
+        with self.lock:
+            # no new measurements in the meantime
+            if self.lastLearned is not None and now - self.lastLearned < ProcessAccounting.interval:
+                return
+            self.lastLearned = now
+        usage = ProcessAccounting.getSharedInstance().getUsage()
+        dsps = [d for d in list(self.dsps) if d.running]
+        owners = [d.get_owner() for d in dsps]
+        for dsp, owner in zip(dsps, owners):
+            # measurements of owners with more than one chain can't be attributed
+            if owner not in usage or owners.count(owner) > 1:
+                continue
+            self.model.learnFromUsage(
+                dsp.samp_rate, dsp.get_demodulator(), dsp.get_secondary_demodulator(), usage[owner]["kinds"]
+            )
+
+    def admit(self, cost, degradedCost=None):
+        if not self.isEnabled():
+            return AdmissionController.ADMIT
+        self.learn()
+        budget = self.getBudget()
+        load = self.getLoad()
+        if load + cost <= budget:
+            self.reserve(cost)
+            return AdmissionController.ADMIT
+        # the waterfalls give something back to everybody
+        self.degradeSpectrums()
+        if degradedCost is not None and load + degradedCost <= budget:
+            logger.info("cpu budget exhausted (%.2f of %.2f cores), degrading request", load, budget)
+            self.degradations.inc()
+            self.reserve(degradedCost)
+            return AdmissionController.DEGRADE
+        logger.warning("cpu budget exhausted (%.2f of %.2f cores), rejecting request", load, budget)
+        self.rejected.inc()
+        return AdmissionController.REJECT
+
+    def admitListener(self, source=None):
+        """
+        whether there is room for one more listener on source, or on the default sdr that new connections start on.
+        only checks, the chain is admitted separately.
+        """
+        if not self.isEnabled():
+            return True
+        if source is None:
+            # avoid circular imports
+            from owrx.sdr import SdrService
+
+            source = SdrService.getFirstSource()
+        samp_rate = source.getProps()["samp_rate"] if source is not None else 0
+        self.learn()
+        if self.getLoad() + self.model.estimate(samp_rate, "nfm") <= self.getBudget():
+            return True
+        logger.warning("cpu budget exhausted, rejecting new listener")
+        self.rejected.inc()
+        self.degradeSpectrums()
+        return False
+
+    def admitChain(self, samp_rate, settings, current=None):
+        """
+        :param current: the settings the chain is running with now, if it is changed instead of started
+        """
+        cost = self.model.estimateSettings(samp_rate, settings)
+        if current is not None:
+            cost -= self.model.estimateSettings(samp_rate, current)
+        degradedCost = None
+        if settings.get("secondary_mod"):
+            degradedCost = cost - self.model.get("secondary_fft")
+        return self.admit(cost, degradedCost)
+
+    def admitService(self, samp_rate, mod, secondary_mod):
+        return self.admit(self.model.estimate(samp_rate, mod, secondary_mod))
+
+    def admitResampler(self, samp_rate):
+        return self.admit(self.model.estimate(samp_rate))
+
+    def degradeSpectrums(self):
+        with self.lock:
+            if self.degraded:
+                return
+            self.degraded = True
+            self.scheduleRecovery()
+        logger.info("lowering waterfall frame rates")
+        for spectrum in list(self.spectrums):
+            spectrum.setDegraded(True)
+
+    def scheduleRecovery(self):
+        # must be called with the lock held
+        reactor = Reactor.getSharedInstance()
+        self.recoveryTimer = reactor.callLater(
+            AdmissionController.recoveryInterval, lambda: reactor.submit(self.checkRecovery)
+        )
+
+    def checkRecovery(self):
+        budget = self.getBudget()
+        recovered = budget is None or self.getLoad() < budget * AdmissionController.recoveryThreshold
+        with self.lock:
+            self.recoveryTimer = None
+            if not recovered:
+                self.scheduleRecovery()
+                return
+            self.degraded = False
+        logger.info("restoring waterfall frame rates")
+        for spectrum in list(self.spectrums):
+            spectrum.setDegraded(False)
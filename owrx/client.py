@@ -1,5 +1,6 @@
 from owrx.config import Config
 from owrx.metrics import Metrics, DirectMetric
+from owrx.admission import AdmissionController
 import threading
 
 import logging
@@ -24,6 +25,8 @@ class ClientRegistry(object):
 
     def __init__(self):
         self.clients = []
+        self.clientIds = {}
+        self.lastClientId = 0
         Metrics.getSharedInstance().addMetric("openwebrx.users", DirectMetric(self.clientCount))
         super().__init__()
 
@@ -36,9 +39,18 @@ class ClientRegistry(object):
         pm = Config.get()
         if len(self.clients) >= pm["max_clients"]:
             raise TooManyClientsException()
+        if not AdmissionController.getSharedInstance().admitListener():
+            raise TooManyClientsException()
         self.clients.append(client)
+        self.lastClientId += 1
+        self.clientIds[client] = self.lastClientId
         self.broadcast()
 
+    def getClientId(self, client):
+        if client not in self.clientIds:
+            return None
+        return self.clientIds[client]
+
     def clientCount(self):
         return len(self.clients)
 
@@ -47,4 +59,5 @@ class ClientRegistry(object):
             self.clients.remove(client)
         except ValueError:
             pass
+        self.clientIds.pop(client, None)
         self.broadcast()
@@ -4,6 +4,7 @@ from owrx.cpu import CpuUsageThread
 from owrx.sdr import SdrService
 from owrx.source import SdrSource
 from owrx.client import ClientRegistry, TooManyClientsException
+from owrx.admission import AdmissionController
 from owrx.feature import FeatureDetector
 from owrx.version import openwebrx_version
 from owrx.bands import Bandplan
@@ -11,7 +12,8 @@ from owrx.bookmarks import Bookmarks
 from owrx.map import Map
 from owrx.locator import Locator
 from owrx.property import PropertyStack
-from multiprocessing import Queue
+from owrx.sendqueue import SendQueue, SendQueueClosed
+from owrx.websocket import WebSocketClosed, PreparedMessage
 from queue import Full
 import json
 import threading
@@ -22,33 +24,52 @@ logger = logging.getLogger(__name__)
 
 
 class Client(object):
+    connectionCount = 0
+    connectionCountLock = threading.Lock()
+
     def __init__(self, conn):
         self.conn = conn
-        self.multiprocessingPipe = Queue(100)
+        with Client.connectionCountLock:
+            Client.connectionCount += 1
+            name = "{0}.{1}".format(type(self).__name__, Client.connectionCount)
+        self.sendQueue = SendQueue(name)
+        pm = Config.get()
+        # message classes that are sent uncompressed even if the connection has compression
+        self.uncompressed = pm["websocket_compression_exclude"] if "websocket_compression_exclude" in pm else []
 
-        def mp_passthru():
-            run = True
-            while run:
+        def send_queued():
+            while True:
                 try:
-                    data = self.multiprocessingPipe.get()
-                    self.send(data)
+                    (data, messageClass) = self.sendQueue.getMessage()
+                    self.send(data, messageClass not in self.uncompressed)
+                except (SendQueueClosed, WebSocketClosed):
+                    return
                 except (EOFError, OSError):
-                    run = False
+                    logger.debug("connection lost while sending, closing client")
+                    self.close()
+                    return
 
-        threading.Thread(target=mp_passthru).start()
+        threading.Thread(target=send_queued, name="send-" + name, daemon=True).start()
 
-    def send(self, data):
-        self.conn.send(data)
+    def send(self, data, compress=True):
+        self.conn.send(data, compress)
 
     def close(self):
         self.conn.close()
-        self.multiprocessingPipe.close()
-
-    def mp_send(self, data):
+        self.sendQueue.close()
+
+    def queue_send(self, data, priority=SendQueue.CONTROL):
+        """
+        messages are sent from a separate thread, so the producers are never held up by this client. a client that
+        falls behind loses its oldest audio and waterfall frames, and is only disconnected once its control messages
+        back up as well.
+        """
         try:
-            self.multiprocessingPipe.put(data, block=False)
+            self.sendQueue.put(data, priority)
         except Full:
             self.close()
+        except SendQueueClosed:
+            pass
 
     def handleTextMessage(self, conn, message):
         pass
@@ -137,7 +158,7 @@ class OpenWebRxReceiverClient(Client):
             if "type" in message:
                 if message["type"] == "dspcontrol":
                     if "action" in message and message["action"] == "start":
-                        self.startDsp()
+                        self.startDsp(message.get("params"))
 
                     if "params" in message:
                         params = message["params"]
@@ -152,8 +173,8 @@ class OpenWebRxReceiverClient(Client):
                 elif message["type"] == "selectprofile":
                     if "params" in message and "profile" in message["params"]:
                         profile = message["params"]["profile"].split("|")
-                        self.setSdr(profile[0])
-                        self.sdr.activateProfile(profile[1])
+                        if self.setSdr(profile[0]):
+                            self.sdr.activateProfile(profile[1])
                 elif message["type"] == "connectionproperties":
                     if "params" in message:
                         self.connectionProperties = message["params"]
@@ -176,11 +197,16 @@ class OpenWebRxReceiverClient(Client):
             if next is None:
                 # exit condition: no sdrs available
                 self.handleNoSdrsAvailable()
-                return
+                return False
 
             # exit condition: no change
             if next == self.sdr:
-                return
+                return True
+
+            # new connections have been admitted for the default sdr already
+            if self.sdr is not None and not AdmissionController.getSharedInstance().admitListener(next):
+                self.write_log_message('Not enough CPU left to listen on "{0}"'.format(next.getName()))
+                return False
 
             self.stopDsp()
 
@@ -190,7 +216,7 @@ class OpenWebRxReceiverClient(Client):
 
             self.sdr = next
 
-            self.startDsp()
+            self.startDsp(self.connectionProperties)
 
             # keep trying until we find a suitable SDR
             if self.sdr.getState() == SdrSource.STATE_FAILED:
@@ -226,13 +252,17 @@ class OpenWebRxReceiverClient(Client):
         self.__sendProfiles()
 
         self.sdr.addSpectrumClient(self)
+        return True
 
     def handleNoSdrsAvailable(self):
         self.write_sdr_error("No SDR Devices available")
 
-    def startDsp(self):
+    def startDsp(self, params=None):
         if self.dsp is None and self.sdr is not None:
             self.dsp = DspManager(self, self.sdr)
+            # the settings go in before the chain is attached, so it is set up for them right away
+            if params:
+                self.setDspProperties(params)
             self.dsp.start()
 
     def close(self):
@@ -269,68 +299,79 @@ class OpenWebRxReceiverClient(Client):
         for key, value in params.items():
             self.dsp.setProperty(key, value)
 
-    def write_spectrum_data(self, data):
-        self.mp_send(bytes([0x01]) + data)
+    @staticmethod
+    def prepare_spectrum_data(data):
+        """
+        waterfall rows are the same for all clients of an sdr, so the message only needs to be built once
+        """
+        return PreparedMessage(bytes([0x01]), data)
+
+    def write_spectrum_data(self, message):
+        """
+        :param message: a row as returned by prepare_spectrum_data()
+        """
+        self.queue_send(message, SendQueue.WATERFALL)
 
     def write_dsp_data(self, data):
-        self.send(bytes([0x02]) + data)
+        self.queue_send(bytes([0x02]) + data, SendQueue.AUDIO)
 
     def write_s_meter_level(self, level):
-        self.send({"type": "smeter", "value": level})
+        self.queue_send({"type": "smeter", "value": level})
 
     def write_cpu_usage(self, usage):
-        self.mp_send({"type": "cpuusage", "value": usage})
+        self.queue_send({"type": "cpuusage", "value": usage})
 
     def write_clients(self, clients):
-        self.mp_send({"type": "clients", "value": clients})
+        self.queue_send({"type": "clients", "value": clients})
 
     def write_secondary_fft(self, data):
-        self.send(bytes([0x03]) + data)
+        self.queue_send(bytes([0x03]) + data, SendQueue.SECONDARY_FFT)
 
     def write_secondary_demod(self, data):
         message = data.decode("ascii", "replace")
-        self.send({"type": "secondary_demod", "value": message})
+        self.queue_send({"type": "secondary_demod", "value": message})
 
     def write_secondary_dsp_config(self, cfg):
-        self.send({"type": "secondary_config", "value": cfg})
+        self.queue_send({"type": "secondary_config", "value": cfg})
 
     def write_config(self, cfg):
-        self.send({"type": "config", "value": cfg})
+        self.queue_send({"type": "config", "value": cfg})
 
     def write_receiver_details(self, details):
-        self.send({"type": "receiver_details", "value": details})
+        self.queue_send({"type": "receiver_details", "value": details})
 
     def write_profiles(self, profiles):
-        self.send({"type": "profiles", "value": profiles})
+        self.queue_send({"type": "profiles", "value": profiles})
 
     def write_features(self, features):
-        self.send({"type": "features", "value": features})
+        self.queue_send({"type": "features", "value": features})
 
     def write_metadata(self, metadata):
-        self.send({"type": "metadata", "value": metadata})
+        self.queue_send({"type": "metadata", "value": metadata})
 
     def write_wsjt_message(self, message):
-        self.send({"type": "wsjt_message", "value": message})
+        self.queue_send({"type": "wsjt_message", "value": message})
 
     def write_dial_frequendies(self, frequencies):
-        self.send({"type": "dial_frequencies", "value": frequencies})
+        self.queue_send({"type": "dial_frequencies", "value": frequencies})
 
     def write_bookmarks(self, bookmarks):
-        self.send({"type": "bookmarks", "value": bookmarks})
+        self.queue_send({"type": "bookmarks", "value": bookmarks})
 
     def write_aprs_data(self, data):
-        self.send({"type": "aprs_data", "value": data})
+        self.queue_send({"type": "aprs_data", "value": data})
 
     def write_log_message(self, message):
-        self.send({"type": "log_message", "value": message})
+        self.queue_send({"type": "log_message", "value": message})
 
     def write_sdr_error(self, message):
-        self.send({"type": "sdr_error", "value": message})
+        self.queue_send({"type": "sdr_error", "value": message})
 
     def write_pocsag_data(self, data):
-        self.send({"type": "pocsag_data", "value": data})
+        self.queue_send({"type": "pocsag_data", "value": data})
 
     def write_backoff_message(self, reason):
+        # sent right away, the connection is closed afterwards
         self.send({"type": "backoff", "reason": reason})
 
 
@@ -351,10 +392,10 @@ class MapConnection(Client):
         super().close()
 
     def write_config(self, cfg):
-        self.send({"type": "config", "value": cfg})
+        self.queue_send({"type": "config", "value": cfg})
 
     def write_update(self, update):
-        self.mp_send({"type": "update", "value": update})
+        self.queue_send({"type": "update", "value": update})
 
 
 class WebSocketMessageHandler(object):
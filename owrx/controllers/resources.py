@@ -0,0 +1,9 @@
+from .admin import AdminController
+from owrx.accounting import ProcessAccounting
+import json
+
+
+class ResourcesController(AdminController):
+    def indexAction(self):
+        data = json.dumps(ProcessAccounting.getSharedInstance().getUsage())
+        self.send_response(data, content_type="application/json")
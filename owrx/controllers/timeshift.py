@@ -0,0 +1,45 @@
+from .admin import AdminController
+from owrx.sdr import SdrService
+from owrx.timeshift import TimeShiftException
+import json
+import time
+
+
+class TimeShiftController(AdminController):
+    def indexAction(self):
+        result = {}
+        for (id, source) in SdrService.getSources().items():
+            timeShift = source.getTimeShift()
+            if timeShift is None or not timeShift.isEnabled():
+                continue
+            result[id] = timeShift.getValue()
+        self.send_response(json.dumps(result), content_type="application/json")
+
+    def sendError(self, message, code=400):
+        self.send_response(json.dumps({"error": message}), code=code, content_type="application/json")
+
+    def snapshotAction(self):
+        """
+        expects a json object with the keys sdr, start, end (unix timestamps, or seconds before now if <= 0),
+        frequency and bandwidth (in Hz)
+        """
+        try:
+            data = json.loads(self.get_body().decode("utf-8"))
+            now = time.time()
+            (start, end) = [float(data[k]) if float(data[k]) > 0 else now + float(data[k]) for k in ["start", "end"]]
+            frequency = int(data["frequency"])
+            bandwidth = int(data["bandwidth"])
+            source = SdrService.getSource(data["sdr"])
+        except (AttributeError, ValueError, KeyError, TypeError):
+            self.sendError("invalid request")
+            return
+        timeShift = source.getTimeShift() if source is not None else None
+        if timeShift is None or not timeShift.isEnabled():
+            self.sendError("no time shift available for this sdr", code=404)
+            return
+        try:
+            snapshot = timeShift.snapshot(start, end, frequency, bandwidth)
+        except TimeShiftException as e:
+            self.sendError(str(e))
+            return
+        self.send_response(json.dumps(snapshot.getValue()), content_type="application/json")
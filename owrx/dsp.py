@@ -5,6 +5,11 @@ from owrx.aprs import AprsParser
 from owrx.pocsag import PocsagParser
 from owrx.source import SdrSource
 from owrx.property import PropertyStack, PropertyLayer
+from owrx.feature import FeatureDetector
+from owrx.metrics import Metrics, DirectMetric
+from owrx.client import ClientRegistry
+from owrx.admission import AdmissionController
+from owrx.reactor import Reactor
 from csdr import csdr
 import threading
 
@@ -13,30 +18,39 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class DspManager(csdr.output):
-    def __init__(self, handler, sdrSource):
-        self.handler = handler
+# local demodulator properties not forwarded to the sdr
+localProperties = [
+    "output_rate",
+    "squelch_level",
+    "secondary_mod",
+    "low_cut",
+    "high_cut",
+    "offset_freq",
+    "mod",
+    "secondary_offset_freq",
+    "dmr_filter",
+]
+
+
+class DspChain(csdr.output):
+    """
+    a csdr dsp chain with its own copy of the demodulator settings. its output is passed on to all DspManagers that
+    are attached to it.
+    """
+
+    def __init__(self, sdrSource, settings, pooled=False):
         self.sdrSource = sdrSource
-        self.parsers = {
-            "meta": MetaParser(self.handler),
-            "wsjt_demod": WsjtParser(self.handler),
-            "packet_demod": AprsParser(self.handler),
-            "pocsag_demod": PocsagParser(self.handler),
-        }
+        self.listeners = []
+        # pooled chains don't count as users, and only run while the source is busy
+        self.pooled = pooled
+        # degraded chains run without the secondary fft
+        self.degraded = False
 
+        self.localProps = PropertyLayer()
+        for key, value in settings.items():
+            self.localProps[key] = value
         self.props = PropertyStack()
-        # local demodulator properties not forwarded to the sdr
-        self.props.addLayer(0, PropertyLayer().filter(
-            "output_rate",
-            "squelch_level",
-            "secondary_mod",
-            "low_cut",
-            "high_cut",
-            "offset_freq",
-            "mod",
-            "secondary_offset_freq",
-            "dmr_filter",
-        ))
+        self.props.addLayer(0, self.localProps)
         # properties that we inherit from the sdr
         self.props.addLayer(1, self.sdrSource.getProps().filter(
             "audio_compression",
@@ -50,10 +64,16 @@ class DspManager(csdr.output):
             "digital_voice_unvoiced_quality",
             "temporary_directory",
             "center_freq",
+            "dsp_backend",
         ))
 
         self.dsp = csdr.dsp(self)
+        self.dsp.set_owner(self.getOwner)
+        AdmissionController.getSharedInstance().addDsp(self.dsp)
         self.dsp.nc_port = self.sdrSource.getPort()
+        self.dsp.ringbuffer_path = self.sdrSource.getRingBufferPath()
+        self.dsp.set_offset_freq(0)
+        self.dsp.set_bpf(-4000, 4000)
 
         def set_low_cut(cut):
             bpf = self.dsp.get_bpf()
@@ -65,11 +85,6 @@ class DspManager(csdr.output):
             bpf[1] = cut
             self.dsp.set_bpf(*bpf)
 
-        def set_dial_freq(key, value):
-            freq = self.props["center_freq"] + self.props["offset_freq"]
-            for parser in self.parsers.values():
-                parser.setDialFrequency(freq)
-
         self.subscriptions = [
             self.props.wireProperty("audio_compression", self.dsp.set_audio_compression),
             self.props.wireProperty("fft_compression", self.dsp.set_fft_compression),
@@ -85,14 +100,12 @@ class DspManager(csdr.output):
             self.props.wireProperty("digital_voice_unvoiced_quality", self.dsp.set_unvoiced_quality),
             self.props.wireProperty("dmr_filter", self.dsp.set_dmr_filter),
             self.props.wireProperty("temporary_directory", self.dsp.set_temporary_directory),
-            self.props.filter("center_freq", "offset_freq").wire(set_dial_freq),
         ]
 
-        self.dsp.set_offset_freq(0)
-        self.dsp.set_bpf(-4000, 4000)
         self.dsp.csdr_dynamic_bufsize = self.props["csdr_dynamic_bufsize"]
         self.dsp.csdr_print_bufsizes = self.props["csdr_print_bufsizes"]
         self.dsp.csdr_through = self.props["csdr_through"]
+        self.dsp.set_backend(self.getBackend())
 
         if self.props["digimodes_enable"]:
 
@@ -100,14 +113,7 @@ class DspManager(csdr.output):
                 if mod == False:
                     mod = None
                 self.dsp.set_secondary_demodulator(mod)
-                if mod is not None:
-                    self.handler.write_secondary_dsp_config(
-                        {
-                            "secondary_fft_size": self.props["digimodes_fft_size"],
-                            "if_samp_rate": self.dsp.if_samp_rate(),
-                            "secondary_bw": self.dsp.secondary_bw(),
-                        }
-                    )
+                self.sendSecondaryDspConfig(self.listeners)
 
             self.subscriptions += [
                 self.props.wireProperty("secondary_mod", set_secondary_mod),
@@ -118,42 +124,119 @@ class DspManager(csdr.output):
 
         super().__init__()
 
+    def getBackend(self):
+        if "dsp_backend" not in self.props:
+            return "csdr"
+        backend = self.props["dsp_backend"]
+        if backend == "numpy" and not FeatureDetector().is_available("numpy_dsp"):
+            logger.warning("numpy dsp backend requested, but numpy is not available. falling back to csdr.")
+            return "csdr"
+        return backend
+
+    def setProperty(self, prop, value):
+        self.localProps[prop] = value
+
+    def setDegraded(self, degraded):
+        # only takes effect with the next secondary demodulator change
+        self.degraded = degraded
+
+    def supports_type(self, t):
+        if t == "secondary_fft":
+            return not self.degraded
+        return True
+
+    def sendSecondaryDspConfig(self, listeners):
+        if not self.dsp.get_secondary_demodulator():
+            return
+        for listener in listeners:
+            listener.handler.write_secondary_dsp_config(
+                {
+                    "secondary_fft_size": self.props["digimodes_fft_size"],
+                    "if_samp_rate": self.dsp.if_samp_rate(),
+                    "secondary_bw": self.dsp.secondary_bw(),
+                }
+            )
+
+    def addListener(self, listener):
+        self.listeners = self.listeners + [listener]
+        self.sendSecondaryDspConfig([listener])
+
+    def removeListener(self, listener):
+        self.listeners = [l for l in self.listeners if l is not listener]
+
+    def getListenerCount(self):
+        return len(self.listeners)
+
+    def getOwner(self):
+        if not self.listeners:
+            return "pool.{0}".format(self.sdrSource.getId())
+        # chains shared by several clients are accounted to all of them together
+        return "+".join(sorted(listener.getOwner() for listener in self.listeners))
+
     def start(self):
-        if self.sdrSource.isAvailable():
-            self.dsp.start()
+        if not self.sdrSource.isAvailable():
+            return
+        if self.pooled and self.sdrSource.getBusyState() != SdrSource.BUSYSTATE_BUSY:
+            return
+        self.attachChannelizer()
+        self.dsp.start()
+
+    def activate(self):
+        """
+        turn a pooled chain into a regular one
+        """
+        self.pooled = False
+        self.sdrSource.checkClients()
+        self.start()
+
+    def attachChannelizer(self):
+        channelizer = self.sdrSource.getChannelizer()
+        if channelizer is not None and channelizer.addListener(self):
+            self.dsp.set_fastddc(channelizer.getPort(), channelizer.getDecimation())
+        else:
+            self.dsp.set_fastddc(None, None)
+
+    def detachChannelizer(self):
+        channelizer = self.sdrSource.getChannelizer()
+        if channelizer is not None:
+            channelizer.removeListener(self)
+
+    def onChannelizerChange(self, channelizer):
+        if channelizer.isAvailable():
+            self.dsp.set_fastddc(channelizer.getPort(), channelizer.getDecimation())
+        else:
+            self.dsp.set_fastddc(None, None)
 
     def receive_output(self, t, read_fn):
         logger.debug("adding new output of type %s", t)
-        writers = {
-            "audio": self.handler.write_dsp_data,
-            "smeter": self.handler.write_s_meter_level,
-            "secondary_fft": self.handler.write_secondary_fft,
-            "secondary_demod": self.handler.write_secondary_demod,
-        }
-        for demod, parser in self.parsers.items():
-            writers[demod] = parser.parse
 
-        write = writers[t]
+        def write(data):
+            # the list is replaced, not modified, when listeners come and go
+            for listener in self.listeners:
+                try:
+                    listener.write(t, data)
+                except Exception:
+                    logger.exception("error while writing dsp output")
 
-        threading.Thread(target=self.pump(read_fn, write)).start()
+        self.pump(read_fn, write)
 
     def stop(self):
         self.dsp.stop()
+        self.detachChannelizer()
         self.sdrSource.removeClient(self)
         for sub in self.subscriptions:
             sub.cancel()
         self.subscriptions = []
 
-    def setProperty(self, prop, value):
-        self.props[prop] = value
-
     def getClientClass(self):
+        if self.pooled:
+            return SdrSource.CLIENT_INACTIVE
         return SdrSource.CLIENT_USER
 
     def onStateChange(self, state):
         if state == SdrSource.STATE_RUNNING:
             logger.debug("received STATE_RUNNING, attempting DspSource restart")
-            self.dsp.start()
+            self.start()
         elif state == SdrSource.STATE_STOPPING:
             logger.debug("received STATE_STOPPING, shutting down DspSource")
             self.dsp.stop()
@@ -161,5 +244,362 @@ class DspManager(csdr.output):
             logger.debug("received STATE_FAILED, shutting down DspSource")
             self.dsp.stop()
 
+    def onBusyStateChange(self, state):
+        if not self.pooled:
+            return
+        if state == SdrSource.BUSYSTATE_BUSY:
+            self.start()
+        else:
+            self.dsp.stop()
+
+
+class DspChainPool(object):
+    """
+    keeps a few dsp chains running for a source while it has users, so that new users can get audio without waiting
+    for a chain to start up. the pool is refilled in the background.
+
+    a different output rate changes the decimation and requires a full restart, so the pooled chains run at the rate
+    that was asked for last.
+    """
+
+    # the rate requested by the web client
+    defaultOutputRate = 12000
+
+    def __init__(self, sdrSource):
+        self.sdrSource = sdrSource
+        self.chains = []
+        self.outputRate = DspChainPool.defaultOutputRate
+        self.lock = threading.Lock()
+        self.refilling = False
+        # counts the drains, so that a refill that overlaps with one doesn't put chains back
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        Metrics.getSharedInstance().addMetric("dsp.pool.{0}".format(sdrSource.getId()), DirectMetric(self.getMetrics))
+        # the pool follows the state of the source, without counting as a user
+        self.sdrSource.addClient(self)
+
+    def getClientClass(self):
+        return SdrSource.CLIENT_INACTIVE
+
+    def onStateChange(self, state):
+        if state in [SdrSource.STATE_STOPPING, SdrSource.STATE_FAILED]:
+            # stopping the chains changes the client list of the source, which is being iterated right now
+            Reactor.getSharedInstance().submit(self.drain)
+
     def onBusyStateChange(self, state):
         pass
+
+    def drain(self):
+        """
+        stop and discard all pooled chains. the pool is refilled on the next claim.
+        """
+        with self.lock:
+            chains = self.chains
+            self.chains = []
+            self.generation += 1
+        if chains:
+            logger.debug("draining %i pooled dsp chain(s)", len(chains))
+        for chain in chains:
+            chain.stop()
+
+    def getSize(self):
+        props = self.sdrSource.getProps()
+        if "dsp_pool_size" not in props:
+            return 0
+        return props["dsp_pool_size"]
+
+    def getMetrics(self):
+        with self.lock:
+            claims = self.hits + self.misses
+            return {
+                "size": len(self.chains),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / claims if claims else 0,
+            }
+
+    def claim(self, settings):
+        """
+        returns a pooled chain running at the output rate in the settings, or None if there is none. the caller
+        reports through recordClaim() whether the chain could be used without a restart.
+        """
+        outputRate = settings.get("output_rate", self.outputRate)
+        stale = []
+        with self.lock:
+            if outputRate != self.outputRate:
+                logger.debug("dsp pool output rate changed to %i", outputRate)
+                stale = self.chains
+                self.chains = []
+                self.generation += 1
+                self.outputRate = outputRate
+            chain = self.chains.pop(0) if self.chains else None
+        for c in stale:
+            c.stop()
+        self.refill()
+        return chain
+
+    def recordClaim(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def refill(self):
+        with self.lock:
+            if self.refilling or len(self.chains) >= self.getSize():
+                return
+            self.refilling = True
+        threading.Thread(target=self._refill, name="dsp-pool-{0}".format(self.sdrSource.getId()), daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self.lock:
+                    if len(self.chains) >= self.getSize():
+                        return
+                    generation = self.generation
+                    settings = {"output_rate": self.outputRate}
+                chain = DspChain(self.sdrSource, settings, pooled=True)
+                chain.start()
+                with self.lock:
+                    drained = generation != self.generation
+                    if not drained:
+                        self.chains.append(chain)
+                if drained:
+                    chain.stop()
+                    return
+        except Exception:
+            logger.exception("error while refilling the dsp chain pool")
+        finally:
+            with self.lock:
+                self.refilling = False
+
+
+class DspChainRegistry(object):
+    """
+    keeps track of the dsp chains, and lets users with identical demodulator settings share one chain.
+
+    a user that changes a setting on a chain of its own retunes that chain in place; a user that changes a setting on
+    a shared chain splits off to a chain of its own (or joins another one that already has the new settings).
+    """
+
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    # all of these need to be set for a chain to be shared
+    sharedProperties = ["offset_freq", "mod", "low_cut", "high_cut", "squelch_level", "output_rate"]
+    # changes of these need to be admitted
+    costlyProperties = ["mod", "secondary_mod"]
+
+    @staticmethod
+    def getSharedInstance():
+        with DspChainRegistry.creationLock:
+            if DspChainRegistry.sharedInstance is None:
+                DspChainRegistry.sharedInstance = DspChainRegistry()
+        return DspChainRegistry.sharedInstance
+
+    def __init__(self):
+        # chains that can be shared, by key
+        self.sharedChains = {}
+        self.chains = []
+        self.pools = {}
+        self.lock = threading.RLock()
+        metrics = Metrics.getSharedInstance()
+        metrics.addMetric("dsp.chains", DirectMetric(self.getChainCount))
+        metrics.addMetric("dsp.listeners", DirectMetric(self.getListenerCount))
+
+    def getChainCount(self):
+        return len(self.chains)
+
+    def getListenerCount(self):
+        return sum(chain.getListenerCount() for chain in self.chains)
+
+    def getKey(self, sdrSource, settings):
+        """
+        returns None if the settings don't allow sharing
+        """
+        if settings.get("secondary_mod"):
+            return None
+        if any(p not in settings for p in DspChainRegistry.sharedProperties):
+            return None
+        # audio compression and everything else inherited from the sdr is the same for all users of a source
+        return (
+            (sdrSource,)
+            + tuple(settings[p] for p in DspChainRegistry.sharedProperties)
+            + (settings.get("dmr_filter"),)
+        )
+
+    def getPool(self, sdrSource):
+        with self.lock:
+            if sdrSource not in self.pools:
+                self.pools[sdrSource] = DspChainPool(sdrSource)
+            return self.pools[sdrSource]
+
+    def admit(self, sdrSource, settings, current=None):
+        """
+        returns a tuple (admitted, degraded)
+        """
+        decision = AdmissionController.getSharedInstance().admitChain(
+            sdrSource.getProps()["samp_rate"], settings, current
+        )
+        return decision != AdmissionController.REJECT, decision == AdmissionController.DEGRADE
+
+    def createChain(self, sdrSource, settings, degraded=None):
+        if degraded is None:
+            # the listener has been admitted already, so a new chain is only ever degraded
+            (_, degraded) = self.admit(sdrSource, settings)
+        pool = self.getPool(sdrSource)
+        chain = pool.claim(settings)
+        if chain is None:
+            pool.recordClaim(False)
+            chain = DspChain(sdrSource, settings)
+            chain.setDegraded(degraded)
+            chain.start()
+            return chain
+        logger.debug("using pooled dsp chain")
+        restarts = chain.dsp.restarts
+        chain.setDegraded(degraded)
+        # the listener's settings go in first, so the chain doesn't start up or count as a user with the pool defaults
+        for key, value in settings.items():
+            chain.setProperty(key, value)
+        chain.activate()
+        # a chain that had to be restarted for the listener's settings didn't save any time
+        pool.recordClaim(chain.dsp.restarts == restarts)
+        return chain
+
+    def getChainKey(self, chain):
+        return self.getKey(chain.sdrSource, chain.localProps.__dict__())
+
+    def attach(self, manager, degraded=None):
+        """
+        :param degraded: the admission decision, if the new settings have been admitted already
+        """
+        with self.lock:
+            key = self.getKey(manager.sdrSource, manager.getSettings())
+            if key is not None and key in self.sharedChains:
+                chain = self.sharedChains[key]
+                logger.debug("sharing dsp chain with %i other listener(s)", chain.getListenerCount())
+            else:
+                chain = self.createChain(manager.sdrSource, manager.getSettings(), degraded)
+                self.chains.append(chain)
+                if key is not None:
+                    self.sharedChains[key] = chain
+            chain.addListener(manager)
+            manager.chain = chain
+
+    def detach(self, manager):
+        with self.lock:
+            chain = manager.chain
+            if chain is None:
+                return
+            manager.chain = None
+            chain.removeListener(manager)
+            if chain.getListenerCount() == 0:
+                self.removeChain(chain)
+
+    def removeChain(self, chain):
+        key = self.getChainKey(chain)
+        if key is not None and self.sharedChains.get(key) is chain:
+            del self.sharedChains[key]
+        self.chains.remove(chain)
+        chain.stop()
+
+    def update(self, manager, prop, value):
+        with self.lock:
+            chain = manager.chain
+            if chain is None:
+                return
+            shared = chain.getListenerCount() > 1
+            oldKey = self.getChainKey(chain)
+            newKey = self.getKey(manager.sdrSource, manager.getSettings())
+            joining = newKey is not None and newKey != oldKey and newKey in self.sharedChains
+            degraded = None
+            if prop in DspChainRegistry.costlyProperties and not joining:
+                # a chain of its own costs the full estimate, a chain that is changed only the difference
+                current = None if shared else chain.localProps.__dict__()
+                (admitted, degraded) = self.admit(manager.sdrSource, manager.getSettings(), current)
+                if not admitted:
+                    manager.handler.write_log_message("Not enough CPU available to switch to {0}".format(value))
+                    return
+                if not shared:
+                    chain.setDegraded(degraded)
+            if shared:
+                logger.debug("splitting off from shared dsp chain")
+                self.detach(manager)
+                self.attach(manager, degraded)
+                return
+            if joining:
+                logger.debug("joining existing dsp chain")
+                self.detach(manager)
+                self.attach(manager)
+                return
+            if oldKey is not None and self.sharedChains.get(oldKey) is chain:
+                del self.sharedChains[oldKey]
+            chain.setProperty(prop, value)
+            if newKey is not None:
+                self.sharedChains[newKey] = chain
+
+
+class DspManager(object):
+    def __init__(self, handler, sdrSource):
+        self.handler = handler
+        self.sdrSource = sdrSource
+        self.chain = None
+        self.parsers = {
+            "meta": MetaParser(self.handler),
+            "wsjt_demod": WsjtParser(self.handler),
+            "packet_demod": AprsParser(self.handler),
+            "pocsag_demod": PocsagParser(self.handler),
+        }
+        self.writers = {
+            "audio": self.handler.write_dsp_data,
+            "smeter": self.handler.write_s_meter_level,
+            "secondary_fft": self.handler.write_secondary_fft,
+            "secondary_demod": self.handler.write_secondary_demod,
+        }
+        for demod, parser in self.parsers.items():
+            self.writers[demod] = parser.parse
+
+        self.localProps = PropertyLayer().filter(*localProperties)
+        self.props = PropertyStack()
+        self.props.addLayer(0, self.localProps)
+        self.props.addLayer(1, self.sdrSource.getProps().filter("center_freq"))
+
+        def set_dial_freq(key, value):
+            freq = self.props["center_freq"] + self.props["offset_freq"]
+            for parser in self.parsers.values():
+                parser.setDialFrequency(freq)
+
+        def forward(key, value):
+            DspChainRegistry.getSharedInstance().update(self, key, value)
+
+        self.subscriptions = [
+            self.localProps.wire(forward),
+            self.props.filter("center_freq", "offset_freq").wire(set_dial_freq),
+        ]
+
+    def getSettings(self):
+        return self.localProps.__dict__()
+
+    def getOwner(self):
+        clientId = ClientRegistry.getSharedInstance().getClientId(self.handler)
+        if clientId is None:
+            return "client"
+        return "client.{0}".format(clientId)
+
+    def start(self):
+        DspChainRegistry.getSharedInstance().attach(self)
+
+    def write(self, t, data):
+        self.writers[t](data)
+
+    def stop(self):
+        DspChainRegistry.getSharedInstance().detach(self)
+        for sub in self.subscriptions:
+            sub.cancel()
+        self.subscriptions = []
+
+    def setProperty(self, prop, value):
+        self.props[prop] = value
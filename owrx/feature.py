@@ -34,12 +34,15 @@ class FeatureDetector(object):
         "soapy_remote": ["soapy_connector", "soapy_remote"],
         "uhd": ["soapy_connector", "soapy_uhd"],
         "red_pitaya": ["soapy_connector", "soapy_red_pitaya"],
+        "signal_generator": ["numpy"],
+        "file": [],
         # optional features and their requirements
         "digital_voice_digiham": ["digiham", "sox"],
         "digital_voice_dsd": ["dsd", "sox", "digiham"],
         "wsjt-x": ["wsjtx", "sox"],
         "packet": ["direwolf", "sox"],
         "pocsag": ["digiham", "sox"],
+        "numpy_dsp": ["numpy"],
     }
 
     def feature_availability(self):
@@ -376,3 +379,15 @@ class FeatureDetector(object):
         on the Alsa library. It is available as a package for most Linux distributions.
         """
         return self.command_is_runnable("arecord --help")
+
+    def has_numpy(self):
+        """
+        The optional numpy DSP backend (setting `dsp_backend = "numpy"`) requires the numpy python package. It is
+        available through pip or as a package on most distributions (e.g. `python3-numpy`).
+        """
+        try:
+            import numpy
+
+            return True
+        except ImportError:
+            return False
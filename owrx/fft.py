@@ -2,21 +2,41 @@ from owrx.config import Config
 from csdr import csdr
 import threading
 from owrx.source import SdrSource
-from owrx.property import PropertyStack
+from owrx.property import PropertyStack, PropertyLayer
+from owrx.admission import AdmissionController
+from owrx.reactor import Reactor
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class SpectrumThread(csdr.output):
+class SpectrumOutput(csdr.output):
+    def __init__(self, spectrumThread):
+        self.spectrumThread = spectrumThread
+
+    def supports_type(self, t):
+        return t == "audio"
+
+    def receive_output(self, type, read_fn):
+        self.pump(read_fn, self.write)
+
+    def write(self, data):
+        self.spectrumThread.onFrame(self, data)
+
+
+class SpectrumThread(object):
+    # all changes that happen within this time are applied at once
+    reconfigureDelay = 0.1
+
     def __init__(self, sdrSource):
         self.sdrSource = sdrSource
         super().__init__()
 
-        stack = PropertyStack()
-        stack.addLayer(0, self.sdrSource.props)
-        stack.addLayer(1, Config.get())
+        self.stack = stack = PropertyStack()
+        # layer 0 is used by setDegraded()
+        stack.addLayer(1, self.sdrSource.props)
+        stack.addLayer(2, Config.get())
         self.props = props = stack.filter(
             "samp_rate",
             "fft_size",
@@ -29,51 +49,141 @@ class SpectrumThread(csdr.output):
             "temporary_directory",
         )
 
-        self.dsp = dsp = csdr.dsp(self)
-        dsp.nc_port = self.sdrSource.getPort()
-        dsp.set_demodulator("fft")
-
-        def set_fft_averages(key, value):
-            samp_rate = props["samp_rate"]
-            fft_size = props["fft_size"]
-            fft_fps = props["fft_fps"]
-            fft_voverlap_factor = props["fft_voverlap_factor"]
-
-            dsp.set_fft_averages(
-                int(round(1.0 * samp_rate / fft_size / fft_fps / (1.0 - fft_voverlap_factor)))
-                if fft_voverlap_factor > 0
-                else 0
-            )
+        self.degraded = False
+        self.lock = threading.Lock()
+        self.reconfigureTimer = None
+        # the pipeline whose frames are currently forwarded to the clients
+        self.dsp = self.createDsp()
+        # a reconfigured pipeline that takes over as soon as it produces its first frame
+        self.pendingDsp = None
 
         self.subscriptions = [
-            props.wireProperty("samp_rate", dsp.set_samp_rate),
-            props.wireProperty("fft_size", dsp.set_fft_size),
-            props.wireProperty("fft_fps", dsp.set_fft_fps),
-            props.wireProperty("fft_compression", dsp.set_fft_compression),
-            props.wireProperty("temporary_directory", dsp.set_temporary_directory),
-            props.filter("samp_rate", "fft_size", "fft_fps", "fft_voverlap_factor").wire(set_fft_averages),
+            props.filter(
+                "samp_rate", "fft_size", "fft_fps", "fft_voverlap_factor", "fft_compression", "temporary_directory"
+            ).wire(self.scheduleReconfigure),
         ]
+        AdmissionController.getSharedInstance().addSpectrum(self)
+        logger.debug("Spectrum thread initialized successfully.")
 
-        set_fft_averages(None, None)
+    def setDegraded(self, degraded):
+        """
+        the frame rate is halved while the cpu budget is exhausted
+        """
+        if degraded == self.degraded:
+            return
+        self.degraded = degraded
+        layer = PropertyLayer()
+        if degraded:
+            layer["fft_fps"] = max(int(self.props["fft_fps"] / 2), 1)
+        self.stack.replaceLayer(0, layer)
+
+    def getFftAverages(self):
+        samp_rate = self.props["samp_rate"]
+        fft_size = self.props["fft_size"]
+        fft_fps = self.props["fft_fps"]
+        fft_voverlap_factor = self.props["fft_voverlap_factor"]
+
+        return (
+            int(round(1.0 * samp_rate / fft_size / fft_fps / (1.0 - fft_voverlap_factor)))
+            if fft_voverlap_factor > 0
+            else 0
+        )
+
+    def createDsp(self):
+        props = self.props
+        dsp = csdr.dsp(SpectrumOutput(self))
+        dsp.set_owner("spectrum.{0}".format(self.sdrSource.getId()))
+        dsp.nc_port = self.sdrSource.getPort()
+        dsp.ringbuffer_path = self.sdrSource.getRingBufferPath()
+        dsp.set_demodulator("fft")
+        dsp.set_samp_rate(props["samp_rate"])
+        dsp.set_fft_size(props["fft_size"])
+        dsp.set_fft_fps(props["fft_fps"])
+        dsp.set_fft_averages(self.getFftAverages())
+        dsp.set_fft_compression(props["fft_compression"])
+        dsp.set_temporary_directory(props["temporary_directory"])
 
         dsp.csdr_dynamic_bufsize = props["csdr_dynamic_bufsize"]
         dsp.csdr_print_bufsizes = props["csdr_print_bufsizes"]
         dsp.csdr_through = props["csdr_through"]
-        logger.debug("Spectrum thread initialized successfully.")
+        return dsp
+
+    def scheduleReconfigure(self, key, value):
+        reactor = Reactor.getSharedInstance()
+        with self.lock:
+            if self.reconfigureTimer:
+                self.reconfigureTimer.cancel()
+            # starting the new pipeline may block, so it doesn't run on the reactor thread itself
+            self.reconfigureTimer = reactor.callLater(
+                SpectrumThread.reconfigureDelay, lambda: reactor.submit(self.reconfigure)
+            )
+
+    def reconfigure(self):
+        """
+        csdr can only pick up new fft parameters on startup. to avoid blanking the waterfall, the reconfigured
+        pipeline is started next to the current one, and replaces it at the boundary of its first frame.
+        """
+        with self.lock:
+            self.reconfigureTimer = None
+            if self.pendingDsp is not None:
+                self.pendingDsp.stop()
+                self.pendingDsp = None
+            dsp = self.createDsp()
+            if not self.dsp.running:
+                self.dsp = dsp
+                return
+            logger.debug("starting reconfigured spectrum pipeline")
+            self.pendingDsp = dsp
+        dsp.start()
+
+    def onFrame(self, output, data):
+        with self.lock:
+            if self.pendingDsp is not None and output is self.pendingDsp.output:
+                logger.debug("switching over to reconfigured spectrum pipeline")
+                old = self.dsp
+                self.dsp = self.pendingDsp
+                self.pendingDsp = None
+            elif output is self.dsp.output:
+                old = None
+            else:
+                # frames from a pipeline that has already been replaced
+                return
+        if old is not None:
+            old.stop()
+        self.sdrSource.writeSpectrumData(data)
 
     def start(self):
         self.sdrSource.addClient(self)
         if self.sdrSource.isAvailable():
-            self.dsp.start()
-
-    def supports_type(self, t):
-        return t == "audio"
-
-    def receive_output(self, type, read_fn):
-        threading.Thread(target=self.pump(read_fn, self.sdrSource.writeSpectrumData)).start()
+            self.startDsp()
+
+    def startDsp(self):
+        """
+        (re)start the pipeline with the current settings. changes that came in while it was stopped don't need a
+        reconfiguration any more.
+        """
+        with self.lock:
+            if self.reconfigureTimer:
+                self.reconfigureTimer.cancel()
+                self.reconfigureTimer = None
+            if not self.dsp.running:
+                self.dsp = self.createDsp()
+            dsp = self.dsp
+        dsp.start()
+
+    def stopDsp(self):
+        with self.lock:
+            if self.reconfigureTimer:
+                self.reconfigureTimer.cancel()
+                self.reconfigureTimer = None
+            pending = self.pendingDsp
+            self.pendingDsp = None
+        if pending is not None:
+            pending.stop()
+        self.dsp.stop()
 
     def stop(self):
-        self.dsp.stop()
+        self.stopDsp()
         self.sdrSource.removeClient(self)
         for c in self.subscriptions:
             c.cancel()
@@ -84,9 +194,9 @@ class SpectrumThread(csdr.output):
 
     def onStateChange(self, state):
         if state in [SdrSource.STATE_STOPPING, SdrSource.STATE_FAILED]:
-            self.dsp.stop()
+            self.stopDsp()
         elif state == SdrSource.STATE_RUNNING:
-            self.dsp.start()
+            self.startDsp()
 
     def onBusyStateChange(self, state):
         pass
@@ -12,6 +12,8 @@ from owrx.controllers.websocket import WebSocketController
 from owrx.controllers.api import ApiController
 from owrx.controllers.metrics import MetricsController
 from owrx.controllers.settings import SettingsController
+from owrx.controllers.resources import ResourcesController
+from owrx.controllers.timeshift import TimeShiftController
 from owrx.controllers.session import SessionController
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
@@ -102,6 +104,11 @@ class Router(object):
             StaticRoute("/metrics", MetricsController),
             StaticRoute("/admin", SettingsController),
             StaticRoute("/admin", SettingsController, method="POST", options={"action": "processFormData"}),
+            StaticRoute("/admin/resources.json", ResourcesController),
+            StaticRoute("/admin/timeshift.json", TimeShiftController),
+            StaticRoute(
+                "/admin/timeshift/snapshot", TimeShiftController, method="POST", options={"action": "snapshotAction"}
+            ),
             StaticRoute("/login", SessionController, options={"action": "loginAction"}),
             StaticRoute("/login", SessionController, method="POST", options={"action": "processLoginAction"}),
             StaticRoute("/logout", SessionController, options={"action": "logoutAction"}),
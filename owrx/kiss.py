@@ -89,32 +89,41 @@ class KissClient(object):
             time.sleep(delay)
 
     def read(self):
-        return self.socket.recv(1)
+        return self.socket.recv(4096)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def close(self):
+        self.socket.close()
 
 
 class KissDeframer(object):
     def __init__(self):
-        self.escaped = False
-        self.buf = bytearray()
+        # raw (still escaped) data of the current, incomplete frame
+        self.buf = b""
 
     def parse(self, input):
+        # everything up to the last FEND is complete; the rest is kept for the next call
+        *complete, self.buf = (self.buf + bytes(input)).split(bytes([FEND]))
         frames = []
-        for b in input:
-            if b == FESC:
-                self.escaped = True
-            elif self.escaped:
-                if b == TFEND:
-                    self.buf.append(FEND)
-                elif b == TFESC:
-                    self.buf.append(FESC)
-                else:
-                    logger.warning("invalid escape char: %s", str(input[0]))
-                self.escaped = False
-            elif input[0] == FEND:
-                # data frames start with 0x00
-                if len(self.buf) > 1 and self.buf[0] == 0x00:
-                    frames += [self.buf[1:]]
-                self.buf = bytearray()
-            else:
-                self.buf.append(b)
+        for raw in complete:
+            # data frames start with 0x00
+            if len(raw) > 1 and raw[0] == 0x00:
+                frames.append(self.unescape(raw[1:]))
         return frames
+
+    def unescape(self, raw):
+        if FESC not in raw:
+            return raw
+        parts = raw.split(bytes([FESC]))
+        output = bytearray(parts[0])
+        for part in parts[1:]:
+            if part and part[0] == TFEND:
+                output.append(FEND)
+            elif part and part[0] == TFESC:
+                output.append(FESC)
+            else:
+                logger.warning("invalid escape char: %s", str(part[:1]))
+            output += part[1:]
+        return bytes(output)
@@ -25,6 +25,28 @@ class DirectMetric(Metric):
         return self.getter()
 
 
+class LatencyMetric(Metric):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def getValue(self):
+        with self.lock:
+            return {
+                "count": self.count,
+                "avg_ms": self.total / self.count * 1000 if self.count else 0,
+                "max_ms": self.max * 1000,
+            }
+
+
 class Metrics(object):
     sharedInstance = None
     creationLock = threading.Lock()
@@ -0,0 +1,444 @@
+from owrx.metrics import Metrics, DirectMetric, LatencyMetric, CounterMetric
+from abc import ABC, abstractmethod
+from collections import deque
+import selectors
+import threading
+import queue
+import heapq
+import time
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Reader(ABC):
+    """
+    non-blocking reader on top of a file descriptor. the reactor calls fill() whenever the descriptor is readable, and
+    then hands every complete frame that frames() can produce to the handler.
+    """
+
+    chunkSize = 65536
+
+    def __init__(self, source):
+        self.source = source
+        self.buffer = bytearray()
+        os.set_blocking(self.fileno(), False)
+
+    def fileno(self):
+        return self.source.fileno()
+
+    def fill(self):
+        """
+        read whatever is available. returns False on end of file.
+        """
+        try:
+            data = os.read(self.fileno(), Reader.chunkSize)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    @abstractmethod
+    def frames(self):
+        pass
+
+    def getFlushDelay(self):
+        """
+        readers that hold back incomplete frames can return a timeout here; the reactor will then call flush() once
+        the timeout has passed since data came in.
+        """
+        return None
+
+    def flush(self):
+        return []
+
+    def close(self):
+        try:
+            self.source.close()
+        except OSError:
+            pass
+
+
+class FixedSizeReader(Reader):
+    def __init__(self, source, size, skip=0):
+        self.size = size
+        # number of bytes to drop from the start of the stream (e.g. the csdr dynamic buffer size preamble)
+        self.skip = skip
+        super().__init__(source)
+
+    def frames(self):
+        if self.skip:
+            skipped = min(self.skip, len(self.buffer))
+            del self.buffer[:skipped]
+            self.skip -= skipped
+        count = len(self.buffer) // self.size
+        if not count:
+            return []
+        frames = [bytes(self.buffer[i * self.size : (i + 1) * self.size]) for i in range(count)]
+        del self.buffer[: count * self.size]
+        return frames
+
+
+class LineReader(Reader):
+    def __init__(self, source, encoding=None, parse=None):
+        self.encoding = encoding
+        self.parse = parse
+        super().__init__(source)
+
+    def frames(self):
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            return []
+        lines = bytes(self.buffer[: end + 1]).splitlines(keepends=True)
+        del self.buffer[: end + 1]
+        if self.encoding is not None:
+            lines = [line.decode(self.encoding, "replace") for line in lines]
+        if self.parse is not None:
+            lines = [self.parse(line) for line in lines]
+        return lines
+
+
+class ChunkReader(Reader):
+    """
+    forwards data as it comes in, without any framing
+    """
+
+    def frames(self):
+        if not self.buffer:
+            return []
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return [data]
+
+
+class BatchingReader(Reader):
+    """
+    collects data until either maxSize bytes are available, or maxDelay seconds have passed since the batch started
+    """
+
+    def __init__(self, source, maxSize=64, maxDelay=0.05):
+        self.maxSize = maxSize
+        self.maxDelay = maxDelay
+        super().__init__(source)
+
+    def frames(self):
+        if len(self.buffer) < self.maxSize:
+            return []
+        return self.flush()
+
+    def getFlushDelay(self):
+        return self.maxDelay
+
+    def flush(self):
+        if not self.buffer:
+            return []
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return [data]
+
+
+class Timer(object):
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+
+class Watch(object):
+    """
+    one-shot notification when a file descriptor becomes readable, e.g. a pidfd when its process has exited. the
+    callback runs on the reactor thread and must not block.
+    """
+
+    def __init__(self, reactor, fd, callback):
+        self.reactor = reactor
+        self.fd = fd
+        self.callback = callback
+        self.closed = False
+
+    def onReadable(self, timestamp):
+        self.reactor.unregister(self.fd)
+        self.callback()
+
+    def close(self):
+        self.reactor.unregister(self.fd)
+
+
+class Registration(object):
+    # frames waiting for a slow handler; beyond this, the oldest ones are dropped so a stuck handler can't eat up memory
+    maxPending = 500
+
+    def __init__(self, reactor, reader, handler):
+        self.reactor = reactor
+        self.reader = reader
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.overflowing = False
+        self.scheduled = False
+        self.eof = False
+        self.closed = False
+        self.flushTimer = None
+
+    def onReadable(self, timestamp):
+        if self.eof:
+            return
+        if not self.reader.fill():
+            self.eof = True
+            self.reactor.remove(self)
+        frames = self.reader.frames()
+        if self.eof:
+            frames += self.reader.flush()
+        if self.flushTimer is not None and (self.eof or not self.reader.buffer):
+            self.flushTimer.cancel()
+            self.flushTimer = None
+        elif self.flushTimer is None and self.reader.buffer:
+            delay = self.reader.getFlushDelay()
+            if delay is not None:
+                self.flushTimer = self.reactor.callLater(delay, self.onFlushTimeout)
+        self.enqueue(frames, timestamp)
+
+    def onFlushTimeout(self):
+        self.flushTimer = None
+        if self.eof:
+            return
+        self.enqueue(self.reader.flush(), time.monotonic())
+
+    def enqueue(self, frames, timestamp):
+        with self.lock:
+            self.pending.extend(frames)
+            dropped = len(self.pending) - Registration.maxPending
+            if dropped > 0:
+                for _ in range(dropped):
+                    self.pending.popleft()
+                self.reactor.dropped.inc(dropped)
+                if not self.overflowing:
+                    logger.warning("output handler on fd %i can't keep up, dropping frames", self.reader.fileno())
+                    self.overflowing = True
+            if self.scheduled or not (self.pending or self.eof):
+                return
+            self.scheduled = True
+        self.reactor.schedule(self, timestamp)
+
+    def dispatch(self):
+        # only the frames that are available now; if more come in, the registration goes back into the queue
+        with self.lock:
+            count = len(self.pending)
+        for _ in range(count):
+            with self.lock:
+                # frames may have been dropped in the meantime
+                if not self.pending:
+                    break
+                frame = self.pending.popleft()
+            if self.closed:
+                continue
+            try:
+                self.handler(frame)
+            except Exception:
+                logger.exception("error in output handler, closing output")
+                self.close()
+        with self.lock:
+            if self.pending:
+                return True
+            self.overflowing = False
+            self.scheduled = False
+            eof = self.eof
+        if eof:
+            self.close()
+        return False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.reactor.remove(self)
+        self.reader.close()
+
+
+class Reactor(object):
+    """
+    a single selector loop that watches all registered readers and dispatches their frames to the handlers on a small
+    pool of worker threads. frames from one reader are always handled in order, and never on two workers at once.
+
+    callbacks that may block (restarts, accounting) run on a separate pool, so they can't hold up the frames.
+    """
+
+    sharedInstance = None
+    creationLock = threading.Lock()
+    workerCount = 4
+    blockingWorkerCount = 2
+
+    @staticmethod
+    def getSharedInstance():
+        with Reactor.creationLock:
+            if Reactor.sharedInstance is None:
+                Reactor.sharedInstance = Reactor()
+        return Reactor.sharedInstance
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.tasks = queue.Queue()
+        self.timers = []
+        self.latency = LatencyMetric()
+        self.dropped = CounterMetric()
+
+        (self.wakeupReader, self.wakeupWriter) = os.pipe()
+        os.set_blocking(self.wakeupReader, False)
+        os.set_blocking(self.wakeupWriter, False)
+        self.selector.register(self.wakeupReader, selectors.EVENT_READ, None)
+
+        metrics = Metrics.getSharedInstance()
+        metrics.addMetric("reactor.threads", DirectMetric(threading.active_count))
+        metrics.addMetric("reactor.registrations", DirectMetric(self.getRegistrationCount))
+        metrics.addMetric("reactor.dispatch_latency", self.latency)
+        metrics.addMetric("reactor.dropped_frames", self.dropped)
+        metrics.addMetric("reactor.pending_tasks", DirectMetric(self.tasks.qsize))
+
+        threading.Thread(target=self.loop, name="reactor", daemon=True).start()
+        for i in range(Reactor.workerCount):
+            threading.Thread(target=self.work, name="reactor-worker-{0}".format(i), daemon=True).start()
+        for i in range(Reactor.blockingWorkerCount):
+            threading.Thread(target=self.runTasks, name="reactor-blocking-{0}".format(i), daemon=True).start()
+
+    def getRegistrationCount(self):
+        # minus the wakeup pipe
+        return len(self.selector.get_map()) - 1
+
+    def register(self, reader, handler):
+        registration = Registration(self, reader, handler)
+        fd = reader.fileno()
+        with self.lock:
+            try:
+                old = self.selector.get_key(fd)
+                # the descriptor has been closed and reused without the old reader being unregistered
+                logger.warning("replacing stale registration on fd %i", fd)
+                self.selector.unregister(fd)
+                if old.data is not None:
+                    old.data.closed = True
+            except KeyError:
+                pass
+            self.selector.register(fd, selectors.EVENT_READ, registration)
+        self.wakeup()
+        return registration
+
+    def unregister(self, fileobj):
+        with self.lock:
+            try:
+                key = self.selector.unregister(fileobj)
+            except (KeyError, ValueError):
+                return
+        if key.data is not None:
+            key.data.closed = True
+
+    def remove(self, registration):
+        with self.lock:
+            try:
+                key = self.selector.get_key(registration.reader.fileno())
+            except (KeyError, ValueError, OSError):
+                return
+            if key.data is registration:
+                self.selector.unregister(key.fd)
+
+    def watch(self, fd, callback):
+        watch = Watch(self, fd, callback)
+        with self.lock:
+            self.selector.register(fd, selectors.EVENT_READ, watch)
+        self.wakeup()
+        return watch
+
+    def submit(self, callback):
+        """
+        run callback on the pool for blocking tasks. the workers that dispatch the frames are never used for this.
+        """
+        self.tasks.put(callback)
+
+    def callLater(self, delay, callback):
+        """
+        run callback on the reactor thread after delay seconds. the callback must not block.
+        """
+        timer = Timer(time.monotonic() + delay, callback)
+        with self.lock:
+            heapq.heappush(self.timers, timer)
+        self.wakeup()
+        return timer
+
+    def getTimeout(self):
+        with self.lock:
+            while self.timers and self.timers[0].cancelled:
+                heapq.heappop(self.timers)
+            if not self.timers:
+                return None
+            return max(self.timers[0].deadline - time.monotonic(), 0)
+
+    def runTimers(self, now):
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0].deadline > now:
+                    return
+                timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback()
+            except Exception:
+                logger.exception("error in timer callback")
+
+    def wakeup(self):
+        try:
+            os.write(self.wakeupWriter, b"\x00")
+        except BlockingIOError:
+            # the loop will wake up anyway
+            pass
+
+    def schedule(self, registration, timestamp):
+        self.queue.put((registration, timestamp))
+
+    def loop(self):
+        while True:
+            events = self.selector.select(self.getTimeout())
+            now = time.monotonic()
+            self.runTimers(now)
+            for (key, mask) in events:
+                if key.data is None:
+                    try:
+                        os.read(self.wakeupReader, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    key.data.onReadable(now)
+                except Exception:
+                    logger.exception("error while reading from fd %i", key.fd)
+                    key.data.close()
+
+    def work(self):
+        while True:
+            (registration, timestamp) = self.queue.get()
+            self.latency.add(time.monotonic() - timestamp)
+            try:
+                if registration.dispatch():
+                    self.schedule(registration, time.monotonic())
+            except Exception:
+                logger.exception("error while dispatching")
+
+    def runTasks(self):
+        while True:
+            callback = self.tasks.get()
+            try:
+                callback()
+            except Exception:
+                logger.exception("error in blocking task")
@@ -0,0 +1,161 @@
+from owrx.metrics import Metrics, DirectMetric
+from collections import deque
+from queue import Full
+import threading
+import weakref
+
+
+class SendQueueClosed(Exception):
+    pass
+
+
+class MessageClass(object):
+    def __init__(self, name, maxsize, dropOldest, maxBytes=None):
+        """
+        :param dropOldest: whether a full queue makes room by dropping its oldest message. otherwise, put() fails.
+        :param maxBytes: optional limit on the total size of the queued messages, in addition to their number
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.maxBytes = maxBytes
+        self.dropOldest = dropOldest
+        self.queue = deque()
+        self.bytes = 0
+        self.sent = 0
+        self.drops = 0
+        self.maxDepth = 0
+
+    def getValue(self):
+        return {"depth": len(self.queue), "max_depth": self.maxDepth, "sent": self.sent, "drops": self.drops}
+
+    def getSize(self, data):
+        # only byte-bounded classes need to know the size, the others may also carry dicts for json
+        return 0 if self.maxBytes is None else len(data)
+
+    def isFull(self, size):
+        if len(self.queue) >= self.maxsize:
+            return True
+        return self.maxBytes is not None and len(self.queue) > 0 and self.bytes + size > self.maxBytes
+
+    def append(self, data):
+        self.queue.append(data)
+        self.bytes += self.getSize(data)
+        self.maxDepth = max(self.maxDepth, len(self.queue))
+
+    def popleft(self):
+        data = self.queue.popleft()
+        self.bytes -= self.getSize(data)
+        return data
+
+    def clear(self):
+        self.queue.clear()
+        self.bytes = 0
+
+
+class SendQueue(object):
+    """
+    per-connection send scheduler. messages are sent in the order of their class (audio before control messages
+    before the secondary fft before the waterfall), and in order within a class. put() never blocks: audio, waterfall
+    and secondary fft frames only keep the newest few and drop the oldest ones, while a full control queue raises Full.
+    """
+
+    AUDIO = 0
+    CONTROL = 1
+    SECONDARY_FFT = 2
+    WATERFALL = 3
+
+    # newest rows kept when the connection can't keep up, roughly one second at the default frame rate
+    waterfallDepth = 10
+    secondaryFftDepth = 5
+    # audio is bounded by size, since frame sizes depend on the codec. 256 kb are about 10 seconds of 12 kHz pcm, and
+    # four times as much with adpcm. a connection that stalls for longer loses the oldest audio instead of being closed.
+    audioDepth = 10000
+    audioBytes = 256 * 1024
+
+    def __init__(self, name, maxsize=1000):
+        """
+        :param maxsize: the limit for control messages. a connection that can't take this many is considered stuck.
+        """
+        self.name = name
+        self.classes = [
+            MessageClass("audio", SendQueue.audioDepth, True, SendQueue.audioBytes),
+            MessageClass("control", maxsize, False),
+            MessageClass("secondary_fft", SendQueue.secondaryFftDepth, True),
+            MessageClass("waterfall", SendQueue.waterfallDepth, True),
+        ]
+        self.condition = threading.Condition()
+        self.closed = False
+        SendQueueMetrics.getSharedInstance().addQueue(self)
+
+    def put(self, data, priority=CONTROL):
+        messageClass = self.classes[priority]
+        with self.condition:
+            if self.closed:
+                raise SendQueueClosed()
+            size = messageClass.getSize(data)
+            if messageClass.isFull(size) and not messageClass.dropOldest:
+                messageClass.drops += 1
+                raise Full()
+            while messageClass.isFull(size):
+                messageClass.drops += 1
+                messageClass.popleft()
+            messageClass.append(data)
+            self.condition.notify()
+
+    def get(self):
+        """
+        blocks until a message is available, and returns the most important one. raises SendQueueClosed once the
+        queue has been closed.
+        """
+        return self.getMessage()[0]
+
+    def getMessage(self):
+        """
+        like get(), but returns the name of the message class along with the message
+        """
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise SendQueueClosed()
+                for messageClass in self.classes:
+                    if messageClass.queue:
+                        messageClass.sent += 1
+                        return messageClass.popleft(), messageClass.name
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            for messageClass in self.classes:
+                messageClass.clear()
+            self.condition.notify_all()
+
+    def getDepth(self):
+        with self.condition:
+            return sum(len(c.queue) for c in self.classes)
+
+    def getValue(self):
+        with self.condition:
+            return {c.name: c.getValue() for c in self.classes}
+
+
+class SendQueueMetrics(object):
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with SendQueueMetrics.creationLock:
+            if SendQueueMetrics.sharedInstance is None:
+                SendQueueMetrics.sharedInstance = SendQueueMetrics()
+        return SendQueueMetrics.sharedInstance
+
+    def __init__(self):
+        self.queues = weakref.WeakSet()
+        Metrics.getSharedInstance().addMetric("openwebrx.send_queues", DirectMetric(self.getValue))
+
+    def addQueue(self, queue):
+        self.queues.add(queue)
+
+    def getValue(self):
+        return {q.name: q.getValue() for q in list(self.queues) if not q.closed}
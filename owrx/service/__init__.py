@@ -9,6 +9,7 @@ from owrx.config import Config
 from owrx.source.resampler import Resampler
 from owrx.feature import FeatureDetector
 from owrx.property import PropertyLayer
+from owrx.admission import AdmissionController
 from abc import ABCMeta, abstractmethod
 from .schedule import ServiceScheduler
 from functools import reduce
@@ -30,8 +31,7 @@ class ServiceOutput(output, metaclass=ABCMeta):
     def receive_output(self, t, read_fn):
         parser = self.getParser()
         parser.setDialFrequency(self.frequency)
-        target = self.pump(read_fn, parser.parse)
-        threading.Thread(target=target).start()
+        self.pump(read_fn, parser.parse)
 
 
 class WsjtServiceOutput(ServiceOutput):
@@ -165,11 +165,12 @@ class ServiceHandler(object):
             self.services = []
 
             groups = self.optimizeResampling(dials, sr)
+            admission = AdmissionController.getSharedInstance()
             if groups is None:
                 for dial in dials:
-                    self.services.append(
-                        self.setupService(dial["mode"], dial["frequency"], self.source)
-                    )
+                    service = self.setupService(dial["mode"], dial["frequency"], self.source)
+                    if service is not None:
+                        self.services.append(service)
             else:
                 for group in groups:
                     frequencies = sorted([f["frequency"] for f in group])
@@ -184,15 +185,16 @@ class ServiceHandler(object):
                     resampler_props["center_freq"] = cf
                     # TODO the + 24000 is a temporary fix since the resampling optimizer does not account for required bandwidths
                     resampler_props["samp_rate"] = bw + 24000
+                    if admission.admitResampler(sr) == AdmissionController.REJECT:
+                        logger.warning("not enough cpu for the resampler at {0}, skipping its services".format(cf))
+                        continue
                     resampler = Resampler(resampler_props, self.source)
                     resampler.start()
 
                     for dial in group:
-                        self.services.append(
-                            self.setupService(
-                                dial["mode"], dial["frequency"], resampler
-                            )
-                        )
+                        service = self.setupService(dial["mode"], dial["frequency"], resampler)
+                        if service is not None:
+                            self.services.append(service)
 
                     # resampler goes in after the services since it must not be shutdown as long as the services are still running
                     self.services.append(resampler)
@@ -254,6 +256,14 @@ class ServiceHandler(object):
         return best["groups"]
 
     def setupService(self, mode, frequency, source):
+        # the same name the dsp runs with, since that's what the cost model learns under
+        demodulator = "nfm" if mode == "packet" else "ssb"
+        decision = AdmissionController.getSharedInstance().admitService(
+            source.getProps()["samp_rate"], demodulator, mode
+        )
+        if decision == AdmissionController.REJECT:
+            logger.warning("not enough cpu for service {0} on frequency {1}".format(mode, frequency))
+            return None
         logger.debug("setting up service {0} on frequency {1}".format(mode, frequency))
         # TODO selecting outputs will need some more intelligence here
         if mode == "packet":
@@ -261,19 +271,20 @@ class ServiceHandler(object):
         else:
             output = WsjtServiceOutput(frequency)
         d = dsp(output)
+        d.set_owner("service.{0}.{1}.{2}".format(self.source.getId(), mode, frequency))
+        AdmissionController.getSharedInstance().addDsp(d)
         d.nc_port = source.getPort()
+        d.ringbuffer_path = source.getRingBufferPath()
         center_freq = source.getProps()["center_freq"]
         d.set_offset_freq(frequency - center_freq)
         d.set_center_freq(center_freq)
+        d.set_demodulator(demodulator)
         if mode == "packet":
-            d.set_demodulator("nfm")
             d.set_bpf(-4000, 4000)
         elif mode == "wspr":
-            d.set_demodulator("usb")
             # WSPR only samples between 1400 and 1600 Hz
             d.set_bpf(1350, 1650)
         else:
-            d.set_demodulator("usb")
             d.set_bpf(0, 3000)
         d.set_secondary_demodulator(mode)
         d.set_audio_compression("none")
@@ -0,0 +1,87 @@
+from owrx.version import openwebrx_version
+import json
+import os
+
+
+class SigMFException(Exception):
+    pass
+
+
+class SigMF(object):
+    """
+    metadata of SigMF recordings (https://github.com/gnuradio/SigMF): a .sigmf-data file with the raw samples and a
+    .sigmf-meta file describing them
+    """
+
+    # SigMF datatypes and the names of the sample formats that the csdr tools use for them
+    datatypes = {
+        "cu8": "cu8",
+        "ci8": "cs8",
+        "ci16_le": "cs16",
+        "cf32_le": "cf32",
+    }
+
+    def __init__(self, format, samp_rate, center_freq=None, datetime=None):
+        self.format = format
+        self.samp_rate = samp_rate
+        self.center_freq = center_freq
+        self.datetime = datetime
+
+    @staticmethod
+    def getPaths(path):
+        """
+        :param path: the data file, the meta file, or the common part of both names
+        :return: the paths of the meta and the data file
+        """
+        for extension in [".sigmf-meta", ".sigmf-data", ".sigmf"]:
+            if path.endswith(extension):
+                path = path[: -len(extension)]
+                break
+        return path + ".sigmf-meta", path + ".sigmf-data"
+
+    @staticmethod
+    def isRecording(path):
+        return os.path.isfile(SigMF.getPaths(path)[0])
+
+    @staticmethod
+    def read(path):
+        (metaPath, _) = SigMF.getPaths(path)
+        try:
+            with open(metaPath, "r") as f:
+                meta = json.load(f)
+            info = meta["global"]
+            datatype = info["core:datatype"]
+            samp_rate = info["core:sample_rate"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise SigMFException("could not read SigMF metadata from {0}: {1}".format(metaPath, e))
+        if datatype not in SigMF.datatypes:
+            raise SigMFException("unsupported SigMF datatype: {0}".format(datatype))
+        captures = meta.get("captures") or [{}]
+        return SigMF(
+            SigMF.datatypes[datatype],
+            int(samp_rate),
+            captures[0].get("core:frequency"),
+            captures[0].get("core:datetime"),
+        )
+
+    def write(self, path, description=None):
+        """
+        stores the metadata next to the data file of the recording
+        """
+        datatypes = {v: k for k, v in SigMF.datatypes.items()}
+        info = {
+            "core:datatype": datatypes[self.format],
+            "core:sample_rate": self.samp_rate,
+            "core:version": "1.0.0",
+            "core:recorder": "OpenWebRX {0}".format(openwebrx_version),
+        }
+        if description is not None:
+            info["core:description"] = description
+        capture = {"core:sample_start": 0}
+        if self.center_freq is not None:
+            capture["core:frequency"] = self.center_freq
+        if self.datetime is not None:
+            capture["core:datetime"] = self.datetime
+        (metaPath, _) = SigMF.getPaths(path)
+        with open(metaPath, "w") as f:
+            json.dump({"global": info, "captures": [capture], "annotations": []}, f, indent=4)
@@ -9,7 +9,11 @@ import signal
 from abc import ABC, abstractmethod
 from owrx.command import CommandMapper
 from owrx.socket import getAvailablePort
+from owrx.supervisor import Supervisor
+from owrx.reactor import Reactor
+from owrx.timeshift import TimeShift
 from owrx.property import PropertyStack, PropertyLayer
+from csdr.ringbuffer import RingBuffer
 
 import logging
 
@@ -51,10 +55,14 @@ class SdrSource(ABC):
         else:
             self.port = getAvailablePort()
         self.monitor = None
+        self.supervision = Supervisor.getSharedInstance().supervise("source")
         self.clients = []
         self.spectrumClients = []
         self.spectrumThread = None
+        self.channelizer = None
         self.process = None
+        self.ringBufferProcess = None
+        self.timeShift = None
         self.modificationLock = threading.Lock()
         self.failed = False
         self.state = SdrSource.STATE_STOPPED
@@ -103,18 +111,29 @@ class SdrSource(ABC):
         self.props["profile_id"] = profile_id
         profile = profiles[profile_id]
         self.profile_id = profile_id
+        self.props.replaceLayer(0, self.getProfileLayer(profile))
 
+    def getProfileLayer(self, profile):
+        """
+        the properties of a profile. override this in subclasses that derive properties from the profile.
+        """
         layer = PropertyLayer()
         for (key, value) in profile.items():
             # skip the name, that would overwrite the source name.
             if key == "name":
                 continue
             layer[key] = value
-        self.props.replaceLayer(0, layer)
+        return layer
 
     def getId(self):
         return self.id
 
+    def getOwner(self):
+        """
+        the name that the cpu and memory usage of this source's processes is reported for
+        """
+        return "source.{0}".format(self.id)
+
     def getProfileId(self):
         return self.profile_id
 
@@ -130,6 +149,61 @@ class SdrSource(ABC):
     def getPort(self):
         return self.port
 
+    def getRingBufferPath(self):
+        if "iq_transport" not in self.props or self.props["iq_transport"] != "shm":
+            return None
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else self.props["temporary_directory"]
+        return "{dir}/openwebrx_iq_{myid}".format(dir=directory, myid=id(self))
+
+    def getIqReaderCommand(self):
+        path = self.getRingBufferPath()
+        if path is not None:
+            return RingBuffer.getReaderCommand(path)
+        return "nc -v 127.0.0.1 {nc_port}".format(nc_port=self.getPort())
+
+    def startRingBuffer(self):
+        path = self.getRingBufferPath()
+        if path is None:
+            return
+        # one single nmux consumer feeds the ring buffer, all other consumers read from shared memory
+        cmd = " | ".join(
+            [
+                "nc -v 127.0.0.1 {nc_port}".format(nc_port=self.getPort()),
+                RingBuffer.getWriterCommand(path, self.props["nmux_memory"] * 1e6),
+            ]
+        )
+        logger.debug("starting ring buffer: %s", cmd)
+        self.ringBufferProcess = subprocess.Popen(cmd, shell=True, start_new_session=True)
+        Supervisor.getSharedInstance().watch(self.ringBufferProcess, self.getOwner(), "ringbuffer")
+
+    def stopRingBuffer(self):
+        if self.ringBufferProcess is None:
+            return
+        try:
+            os.killpg(os.getpgid(self.ringBufferProcess.pid), signal.SIGTERM)
+        except ProcessLookupError:
+            # been killed by something else, ignore
+            pass
+        self.ringBufferProcess = None
+
+    def getTimeShift(self):
+        """
+        the recording of the last minutes of this source's IQ data, or None if the source doesn't support it
+        """
+        if self.timeShift is None:
+            self.timeShift = TimeShift(self)
+        return self.timeShift
+
+    def getChannelizer(self):
+        if "channelizer_enabled" not in self.props or not self.props["channelizer_enabled"]:
+            return None
+        if self.channelizer is None:
+            # local import due to circular depencency
+            from owrx.source.channelizer import Channelizer
+
+            self.channelizer = Channelizer(self)
+        return self.channelizer
+
     def getCommandValues(self):
         dict = self.sdrProps.__dict__()
         if "lfo_offset" in dict and dict["lfo_offset"] is not None:
@@ -166,13 +240,18 @@ class SdrSource(ABC):
 
             available = False
 
-            def wait_for_process_to_end():
-                rc = self.process.wait()
+            def onExit(rc):
                 logger.debug("shut down with RC={0}".format(rc))
                 self.monitor = None
+                # stop() changes the state before it kills the process
+                if self.state == SdrSource.STATE_RUNNING:
+                    delay = self.supervision.onCrash()
+                    logger.warning("sdr source ended unexpectedly (RC=%d), restarting in %.1fs", rc, delay)
+                    reactor = Reactor.getSharedInstance()
+                    reactor.callLater(delay, lambda: reactor.submit(self.restartAfterCrash))
 
-            self.monitor = threading.Thread(target=wait_for_process_to_end)
-            self.monitor.start()
+            self.monitor = Supervisor.getSharedInstance().watch(self.process, self.getOwner(), "source")
+            self.monitor.onExit(onExit)
 
             retries = 1000
             while retries > 0:
@@ -190,6 +269,11 @@ class SdrSource(ABC):
 
             if not available:
                 self.failed = True
+            else:
+                self.startRingBuffer()
+                timeShift = self.getTimeShift()
+                if timeShift is not None:
+                    timeShift.start()
 
             try:
                 self.postStart()
@@ -197,6 +281,9 @@ class SdrSource(ABC):
                 logger.exception("Exception during postStart()")
                 self.failed = True
 
+            if not self.failed:
+                self.supervision.onStart()
+
         self.setState(SdrSource.STATE_FAILED if self.failed else SdrSource.STATE_RUNNING)
 
     def preStart(self):
@@ -222,23 +309,42 @@ class SdrSource(ABC):
 
         with self.modificationLock:
 
+            self.stopRingBuffer()
+            if self.timeShift is not None:
+                self.timeShift.stop()
+
             if self.process is not None:
                 try:
                     os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
                 except ProcessLookupError:
                     # been killed by something else, ignore
                     pass
-            if self.monitor:
-                self.monitor.join()
+            monitor = self.monitor
+            if monitor:
+                monitor.wait()
+            self.supervision.onStop()
 
         self.setState(SdrSource.STATE_STOPPED)
 
+    def restartAfterCrash(self):
+        # stopped or restarted by someone else in the meantime
+        if self.monitor is not None or self.state != SdrSource.STATE_RUNNING:
+            return
+        self.stop()
+        self.start()
+
     def hasClients(self, *args):
         clients = [c for c in self.clients if c.getClientClass() in args]
         return len(clients) > 0
 
     def addClient(self, c):
         self.clients.append(c)
+        self.checkClients()
+
+    def checkClients(self):
+        """
+        start the source if any of the clients requires it. needs to be called when a client changes its client class.
+        """
         hasUsers = self.hasClients(SdrSource.CLIENT_USER)
         hasBackgroundTasks = self.hasClients(SdrSource.CLIENT_BACKGROUND)
         if hasUsers or hasBackgroundTasks:
@@ -280,8 +386,13 @@ class SdrSource(ABC):
             self.spectrumThread = None
 
     def writeSpectrumData(self, data):
+        # local import due to circular depencency
+        from owrx.connection import OpenWebRxReceiverClient
+
+        # framed once and shared by all clients
+        message = OpenWebRxReceiverClient.prepare_spectrum_data(data)
         for c in self.spectrumClients:
-            c.write_spectrum_data(data)
+            c.write_spectrum_data(message)
 
     def getState(self):
         return self.state
@@ -293,6 +404,9 @@ class SdrSource(ABC):
         for c in self.clients:
             c.onStateChange(state)
 
+    def getBusyState(self):
+        return self.busyState
+
     def setBusyState(self, state):
         if state == self.busyState:
             return
@@ -0,0 +1,163 @@
+from . import SdrSource
+from owrx.socket import getAvailablePort
+from owrx.supervisor import Supervisor
+import subprocess
+import threading
+import socket
+import time
+import os
+import signal
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Channelizer(object):
+    """
+    Runs the forward half of csdr's FFT-based fast DDC (fastddc_fwd_cc) over the full bandwidth of an SdrSource once.
+    Clients attach to the output of this stage and only run the inverse half (fastddc_inv_cc), which produces their
+    narrowband IF signal at a fraction of the cost of a full-rate shift and decimation.
+    """
+
+    # the highest audio rate any demodulator requires (digital voice, packet, pocsag)
+    minimum_channel_rate = 48000
+
+    def __init__(self, sdrSource):
+        self.sdrSource = sdrSource
+        self.port = getAvailablePort()
+        self.process = None
+        self.monitor = None
+        self.decimation = None
+        self.transition_bw = None
+        self.listeners = []
+        self.modificationLock = threading.Lock()
+        self.subscription = self.sdrSource.getProps().wireProperty("samp_rate", self.onSampleRateChange)
+        self.sdrSource.addClient(self)
+
+    @staticmethod
+    def getDecimationFor(samp_rate):
+        decimation = int(samp_rate / Channelizer.minimum_channel_rate)
+        if decimation < 2:
+            return None
+        return decimation
+
+    def getPort(self):
+        return self.port
+
+    def getDecimation(self):
+        return self.decimation
+
+    def getTransitionBandwidth(self):
+        return self.transition_bw
+
+    def isAvailable(self):
+        return self.monitor is not None
+
+    def onSampleRateChange(self, samp_rate):
+        decimation = Channelizer.getDecimationFor(samp_rate)
+        if decimation == self.decimation:
+            return
+        self.decimation = decimation
+        # same formula as the per-client ddc; fwd and inv stages need to agree on this
+        self.transition_bw = 0.15 / decimation if decimation is not None else None
+        if self.isAvailable():
+            logger.debug("sample rate changed, restarting channelizer with decimation %s", decimation)
+            self.stop()
+            if self.listeners:
+                self.start()
+        for l in self.listeners:
+            l.onChannelizerChange(self)
+
+    def getCommand(self):
+        return " | ".join(
+            [
+                self.sdrSource.getIqReaderCommand(),
+                "csdr fastddc_fwd_cc {decimation} {transition_bw}".format(
+                    decimation=self.decimation, transition_bw=self.transition_bw
+                ),
+                # the fft blocks carry some overlap, so this stream is slightly larger than the input
+                "nmux --bufsize {bufsize} --bufcnt {bufcnt} --port {port} --address 127.0.0.1".format(
+                    bufsize=self.getNmuxBufsize(), bufcnt=self.getNmuxBufcnt(), port=self.port
+                ),
+            ]
+        )
+
+    def getNmuxBufsize(self):
+        bufsize = 0
+        while bufsize < self.sdrSource.getProps()["samp_rate"] / 2:
+            bufsize += 4096
+        return bufsize
+
+    def getNmuxBufcnt(self):
+        bufcnt = 0
+        while self.getNmuxBufsize() * bufcnt < self.sdrSource.getProps()["nmux_memory"] * 1e6:
+            bufcnt += 1
+        return max(bufcnt, 1)
+
+    def start(self):
+        with self.modificationLock:
+            if self.monitor or self.decimation is None:
+                return
+
+            cmd = self.getCommand()
+            logger.debug("starting channelizer: %s", cmd)
+            self.process = subprocess.Popen(cmd, shell=True, start_new_session=True)
+
+            def onExit(rc):
+                logger.debug("channelizer shut down with RC={0}".format(rc))
+                self.monitor = None
+
+            self.monitor = Supervisor.getSharedInstance().watch(self.process, self.sdrSource.getOwner(), "channelizer")
+            self.monitor.onExit(onExit)
+
+            retries = 100
+            while retries > 0:
+                retries -= 1
+                if self.monitor is None:
+                    break
+                testsock = socket.socket()
+                try:
+                    testsock.connect(("127.0.0.1", self.port))
+                    testsock.close()
+                    break
+                except:
+                    time.sleep(0.1)
+
+    def stop(self):
+        with self.modificationLock:
+            if self.process is not None:
+                try:
+                    os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+                except ProcessLookupError:
+                    # been killed by something else, ignore
+                    pass
+                self.process = None
+            monitor = self.monitor
+            if monitor:
+                monitor.wait()
+
+    def addListener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+        if self.sdrSource.isAvailable():
+            self.start()
+        return self.isAvailable()
+
+    def removeListener(self, listener):
+        try:
+            self.listeners.remove(listener)
+        except ValueError:
+            pass
+        if not self.listeners:
+            self.stop()
+
+    def getClientClass(self):
+        return SdrSource.CLIENT_INACTIVE
+
+    def onStateChange(self, state):
+        if state in [SdrSource.STATE_STOPPING, SdrSource.STATE_FAILED]:
+            self.stop()
+
+    def onBusyStateChange(self, state):
+        pass
@@ -0,0 +1,78 @@
+from .direct import DirectSource
+from owrx.command import Flag, Option
+from owrx.sigmf import SigMF, SigMFException
+import sys
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FileSource(DirectSource):
+    """
+    plays back IQ recordings, either SigMF recordings or raw files in one of the formats in formatConversions. sample
+    rate, center frequency and format of SigMF recordings are taken from the metadata.
+    """
+
+    formatConversions = {
+        "cu8": ["csdr convert_u8_f"],
+        "cs8": ["csdr convert_s8_f"],
+        "cs16": ["csdr convert_s16_f"],
+        "cf32": [],
+    }
+
+    def getCommandMapper(self):
+        return (
+            super()
+            .getCommandMapper()
+            .setBase("{0} -m csdr.playback".format(sys.executable))
+            .setMappings(
+                {
+                    "file": Option("--file"),
+                    "format": Option("--format"),
+                    "samp_rate": Option("--samp-rate"),
+                    "loop": Flag("--loop"),
+                    "seek": Option("--seek"),
+                    "playback_speed": Option("--speed"),
+                }
+            )
+        )
+
+    def getProfileLayer(self, profile):
+        layer = super().getProfileLayer(profile)
+        if "file" in layer:
+            file = layer["file"]
+        elif "file" in self.props:
+            file = self.props["file"]
+        else:
+            return layer
+        if not SigMF.isRecording(file):
+            return layer
+        try:
+            meta = SigMF.read(file)
+        except SigMFException:
+            logger.exception("error reading recording metadata")
+            return layer
+        layer["format"] = meta.format
+        layer["samp_rate"] = meta.samp_rate
+        if meta.center_freq is not None:
+            layer["center_freq"] = int(meta.center_freq)
+        return layer
+
+    def getFormat(self):
+        if "format" in self.sdrProps and self.sdrProps["format"] is not None:
+            return self.sdrProps["format"]
+        return "cf32"
+
+    def getCommandValues(self):
+        values = super().getCommandValues()
+        values["format"] = self.getFormat()
+        if SigMF.isRecording(values["file"]):
+            values["file"] = SigMF.getPaths(values["file"])[1]
+        return values
+
+    def getFormatConversion(self):
+        format = self.getFormat()
+        if format not in FileSource.formatConversions:
+            raise ValueError("unsupported sample format: {0}".format(format))
+        return FileSource.formatConversions[format]
@@ -1,5 +1,6 @@
 from .direct import DirectSource
 from . import SdrSource
+from csdr.decimation import DecimationPlanner
 import subprocess
 import threading
 import os
@@ -18,22 +19,24 @@ class Resampler(DirectSource):
     def __init__(self, props, sdr):
         sdrProps = sdr.getProps()
         self.shift = (sdrProps["center_freq"] - props["center_freq"]) / sdrProps["samp_rate"]
-        self.decimation = int(float(sdrProps["samp_rate"]) / props["samp_rate"])
-        if_samp_rate = sdrProps["samp_rate"] / self.decimation
-        self.transition_bw = 0.15 * (if_samp_rate / float(sdrProps["samp_rate"]))
-        props["samp_rate"] = if_samp_rate
+        self.decimationPlan = DecimationPlanner.plan(sdrProps["samp_rate"], props["samp_rate"])
+        props["samp_rate"] = self.decimationPlan.get_intermediate_rate()
 
         self.sdr = sdr
         super().__init__(None, props)
 
     def getCommand(self):
         return [
-            "nc -v 127.0.0.1 {nc_port}".format(nc_port=self.sdr.getPort()),
+            self.sdr.getIqReaderCommand(),
             "csdr shift_addition_cc {shift}".format(shift=self.shift),
-            "csdr fir_decimate_cc {decimation} {ddc_transition_bw} HAMMING".format(
-                decimation=self.decimation, ddc_transition_bw=self.transition_bw
-            ),
-        ] + self.getNmuxCommand()
+        ] + self.decimationPlan.get_commands() + self.getNmuxCommand()
+
+    def getOwner(self):
+        return "{0}.resampler.{1}".format(self.sdr.getOwner(), self.props["center_freq"])
+
+    def getTimeShift(self):
+        # the sdr that is being resampled keeps its own time shift, which covers this range as well
+        return None
 
     def activateProfile(self, profile_id=None):
         logger.warning("Resampler does not support setting profiles")
@@ -0,0 +1,39 @@
+from .direct import DirectSource
+from owrx.command import Flag, Option, CommandMapping
+import json
+import shlex
+import sys
+
+
+class JsonOption(CommandMapping):
+    def __init__(self, option):
+        self.option = option
+
+    def map(self, value):
+        if value is None:
+            return ""
+        return "{0} {1}".format(self.option, shlex.quote(json.dumps(value)))
+
+
+class SignalGeneratorSource(DirectSource):
+    """
+    generates IQ data with configurable test signals instead of reading it from a device (see csdr.generator for the
+    signal descriptions). useful for trying out and load testing openwebrx without hardware.
+    """
+
+    def getCommandMapper(self):
+        return (
+            super()
+            .getCommandMapper()
+            .setBase("{0} -m csdr.generator".format(sys.executable))
+            .setMappings(
+                {
+                    "samp_rate": Option("--samp-rate"),
+                    "center_freq": Option("--center-freq"),
+                    "signals": JsonOption("--signals"),
+                    "noise_level": Option("--noise-level"),
+                    "generator_seed": Option("--seed"),
+                    "generator_no_throttle": Flag("--no-throttle"),
+                }
+            )
+        )
@@ -0,0 +1,195 @@
+from owrx.reactor import Reactor
+from owrx.metrics import Metrics, DirectMetric
+from owrx.accounting import ProcessAccounting
+import threading
+import weakref
+import time
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessWatch(object):
+    def __init__(self, process, accounted=False):
+        self.process = process
+        self.accounted = accounted
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.returncode = None
+        self.exitEvent = threading.Event()
+        self.pidfd = None
+        self.watch = None
+
+    def onExit(self, callback):
+        """
+        callback will be called with the return code once the process has ended, or right away if it already has.
+        callbacks run on the reactor thread and must not block.
+        """
+        with self.lock:
+            if self.returncode is None:
+                self.callbacks.append(callback)
+                return
+        callback(self.returncode)
+
+    def isRunning(self):
+        return not self.exitEvent.is_set()
+
+    def wait(self, timeout=None):
+        return self.exitEvent.wait(timeout)
+
+    def exited(self):
+        if not self.isRunning():
+            return
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+        if self.accounted:
+            ProcessAccounting.getSharedInstance().untrack(self.process)
+        # the process has ended, so this does not block. it reaps the zombie and sets the returncode on the Popen.
+        rc = self.process.wait()
+        with self.lock:
+            self.returncode = rc
+            callbacks = self.callbacks
+            self.callbacks = []
+        for callback in callbacks:
+            try:
+                callback(rc)
+            except Exception:
+                logger.exception("error in process exit callback")
+        self.exitEvent.set()
+
+
+class Supervision(object):
+    """
+    uptime and restart bookkeeping for one supervised chain of processes
+    """
+
+    minBackoff = 0.5
+    maxBackoff = 30
+    # a chain that has been running for this long is considered to have recovered
+    stableAfter = 60
+
+    def __init__(self, name):
+        self.name = name
+        self.startTime = None
+        self.restarts = 0
+        self.backoff = 0
+
+    def onStart(self):
+        self.startTime = time.monotonic()
+
+    def onStop(self):
+        self.startTime = None
+
+    def onCrash(self):
+        """
+        count a restart and return how long to wait before it. the first crash after a stable run restarts right away,
+        repeated crashes back off exponentially.
+        """
+        self.restarts += 1
+        if self.getUptime() > Supervision.stableAfter:
+            self.backoff = 0
+        delay = self.backoff
+        self.backoff = min(max(self.backoff * 2, Supervision.minBackoff), Supervision.maxBackoff)
+        return delay
+
+    def getUptime(self):
+        if self.startTime is None:
+            return 0
+        return time.monotonic() - self.startTime
+
+    def getValue(self):
+        return {"uptime": round(self.getUptime(), 1), "restarts": self.restarts, "backoff": self.backoff}
+
+
+class Supervisor(object):
+    """
+    reaps all child processes in one place. exits are detected through a pidfd on the reactor, or by a single polling
+    thread where pidfds are not available.
+    """
+
+    sharedInstance = None
+    creationLock = threading.Lock()
+    pollInterval = 0.5
+
+    @staticmethod
+    def getSharedInstance():
+        with Supervisor.creationLock:
+            if Supervisor.sharedInstance is None:
+                Supervisor.sharedInstance = Supervisor()
+        return Supervisor.sharedInstance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watches = []
+        self.supervisions = weakref.WeakSet()
+        self.counter = 0
+        self.usePidfd = hasattr(os, "pidfd_open")
+        self.poller = None
+
+        metrics = Metrics.getSharedInstance()
+        metrics.addMetric("supervisor.processes", DirectMetric(self.getProcessCount))
+        metrics.addMetric("supervisor.chains", DirectMetric(self.getChainStats))
+
+    def getProcessCount(self):
+        with self.lock:
+            return len(self.watches)
+
+    def getChainStats(self):
+        return {s.name: s.getValue() for s in list(self.supervisions)}
+
+    def supervise(self, name):
+        with self.lock:
+            self.counter += 1
+            supervision = Supervision("{0}.{1}".format(name, self.counter))
+        self.supervisions.add(supervision)
+        return supervision
+
+    def watch(self, process, owner=None, kind=None):
+        """
+        :param owner: if given, the cpu and memory usage of the process group will be accounted to this owner
+        """
+        watch = ProcessWatch(process, owner is not None)
+        if owner is not None:
+            ProcessAccounting.getSharedInstance().track(process, owner, kind)
+        with self.lock:
+            self.watches.append(watch)
+        watch.onExit(lambda rc: self.remove(watch))
+        if self.usePidfd:
+            try:
+                watch.pidfd = os.pidfd_open(process.pid)
+            except ProcessLookupError:
+                # already gone (and reaped by someone else)
+                watch.exited()
+                return watch
+            except OSError:
+                logger.warning("pidfd not supported, falling back to polling")
+                self.usePidfd = False
+            else:
+                watch.watch = Reactor.getSharedInstance().watch(watch.pidfd, watch.exited)
+                return watch
+        self.startPoller()
+        return watch
+
+    def remove(self, watch):
+        with self.lock:
+            if watch in self.watches:
+                self.watches.remove(watch)
+
+    def startPoller(self):
+        with self.lock:
+            if self.poller is not None:
+                return
+            self.poller = threading.Thread(target=self.poll, name="supervisor", daemon=True)
+        self.poller.start()
+
+    def poll(self):
+        while True:
+            with self.lock:
+                watches = [w for w in self.watches if w.pidfd is None]
+            for watch in watches:
+                if watch.process.poll() is not None:
+                    watch.exited()
+            time.sleep(Supervisor.pollInterval)
@@ -0,0 +1,220 @@
+from owrx.supervisor import Supervisor
+from owrx.sigmf import SigMF
+from csdr.ringbuffer import RingBuffer, RingBufferReader, RingBufferException
+from csdr.decimation import DecimationPlanner
+from datetime import datetime, timezone
+import subprocess
+import threading
+import signal
+import shlex
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TimeShiftException(Exception):
+    pass
+
+
+class Snapshot(object):
+    STATE_RUNNING = "running"
+    STATE_COMPLETE = "complete"
+    STATE_FAILED = "failed"
+
+    def __init__(self, path, start, end, frequency, samp_rate):
+        """
+        :param path: where the recording goes, without the SigMF extensions
+        :param samp_rate: the sample rate of the extracted slice
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.frequency = frequency
+        self.samp_rate = samp_rate
+        self.state = Snapshot.STATE_RUNNING
+
+    def getName(self):
+        return os.path.basename(self.path)
+
+    def onExit(self, rc):
+        if rc != 0:
+            logger.warning("snapshot %s failed with RC=%i", self.getName(), rc)
+            self.state = Snapshot.STATE_FAILED
+            return
+        timestamp = datetime.fromtimestamp(self.start, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        try:
+            SigMF("cf32", self.samp_rate, self.frequency, timestamp).write(self.path, "OpenWebRX time shift snapshot")
+        except OSError:
+            logger.exception("could not write snapshot metadata")
+            self.state = Snapshot.STATE_FAILED
+            return
+        logger.info("snapshot %s complete", self.getName())
+        self.state = Snapshot.STATE_COMPLETE
+
+    def getValue(self):
+        return {
+            "name": self.getName(),
+            "path": SigMF.getPaths(self.path)[0],
+            "start": self.start,
+            "end": self.end,
+            "frequency": self.frequency,
+            "samp_rate": self.samp_rate,
+            "state": self.state,
+        }
+
+
+class TimeShift(object):
+    """
+    keeps the last minutes of the wideband IQ stream of an sdr source in a memory-mapped ring file on disk. parts of
+    it can be saved as narrowband SigMF recordings after the fact, shifted and decimated with the same decimation
+    stages as the dsp chains.
+    """
+
+    # complex float
+    sampleSize = 8
+
+    def __init__(self, source):
+        self.source = source
+        self.process = None
+        self.lock = threading.Lock()
+        self.snapshots = []
+        # the ring only makes sense for a single sample rate and center frequency
+        self.subscription = self.source.getProps().filter("samp_rate", "center_freq").wire(self.onTuningChange)
+
+    def isEnabled(self):
+        props = self.source.getProps()
+        return "time_shift" in props and props["time_shift"] is not None and props["time_shift"] > 0
+
+    def getDirectory(self):
+        props = self.source.getProps()
+        if "time_shift_directory" in props and props["time_shift_directory"] is not None:
+            return props["time_shift_directory"]
+        return props["temporary_directory"]
+
+    def getPath(self):
+        return "{dir}/openwebrx_timeshift_{id}".format(dir=self.getDirectory(), id=self.source.getId())
+
+    def getByteRate(self):
+        return self.source.getProps()["samp_rate"] * TimeShift.sampleSize
+
+    def getSize(self):
+        return self.source.getProps()["time_shift"] * 60 * self.getByteRate()
+
+    def start(self):
+        if not self.isEnabled():
+            return
+        with self.lock:
+            if self.process is not None:
+                return
+            cmd = " | ".join(
+                [self.source.getIqReaderCommand(), RingBuffer.getWriterCommand(self.getPath(), self.getSize())]
+            )
+            logger.debug("starting time shift: %s", cmd)
+            self.process = subprocess.Popen(cmd, shell=True, start_new_session=True)
+            Supervisor.getSharedInstance().watch(self.process, self.source.getOwner(), "recorder")
+
+    def stop(self):
+        with self.lock:
+            if self.process is None:
+                return
+            try:
+                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+            except ProcessLookupError:
+                # been killed by something else, ignore
+                pass
+            self.process = None
+        try:
+            os.unlink(self.getPath())
+        except FileNotFoundError:
+            pass
+
+    def onTuningChange(self, name, value):
+        if self.process is None:
+            return
+        logger.debug("%s changed, discarding time shift history", name)
+        self.stop()
+        self.start()
+
+    def openRing(self):
+        if self.process is None:
+            raise TimeShiftException("time shift is not running")
+        try:
+            return RingBufferReader(self.getPath())
+        except (OSError, ValueError, RingBufferException) as e:
+            raise TimeShiftException("time shift buffer not available: {0}".format(e))
+
+    def getTimeRange(self):
+        """
+        the timestamps of the oldest and the newest data in the ring
+        """
+        ring = self.openRing()
+        try:
+            (oldest, newest) = ring.getAvailableRange()
+            end = ring.getLastWriteTime()
+        finally:
+            ring.close()
+        return end - (newest - oldest) / self.getByteRate(), end
+
+    def snapshot(self, start, end, frequency, bandwidth):
+        """
+        save the signal at frequency with (at least) the given bandwidth from start to end (unix timestamps)
+        """
+        props = self.source.getProps()
+        samp_rate = props["samp_rate"]
+        center_freq = props["center_freq"]
+        if abs(frequency - center_freq) + bandwidth / 2 > samp_rate / 2:
+            raise TimeShiftException("frequency range is outside of the sdr bandwidth")
+        if bandwidth <= 0 or bandwidth > samp_rate:
+            raise TimeShiftException("invalid bandwidth")
+        if end <= start:
+            raise TimeShiftException("invalid time range")
+
+        ring = self.openRing()
+        try:
+            (oldest, newest) = ring.getAvailableRange()
+            startPosition = max(ring.getPositionAt(start, self.getByteRate()), oldest)
+            endPosition = min(ring.getPositionAt(end, self.getByteRate()), newest)
+            lastWrite = ring.getLastWriteTime()
+        finally:
+            ring.close()
+        if endPosition <= startPosition:
+            raise TimeShiftException("time range is not available")
+        # the timestamps of what is actually available
+        start = lastWrite - (newest - startPosition) / self.getByteRate()
+        end = lastWrite - (newest - endPosition) / self.getByteRate()
+
+        plan = DecimationPlanner.plan(samp_rate, bandwidth)
+        outputRate = int(plan.get_intermediate_rate())
+        name = "{id}_{time}_{frequency}".format(
+            id=self.source.getId(),
+            time=datetime.fromtimestamp(start, timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+            frequency=int(frequency),
+        )
+        path = os.path.join(self.getDirectory(), name)
+        snapshot = Snapshot(path, start, end, frequency, outputRate)
+
+        cmd = " | ".join(
+            [
+                RingBuffer.getExtractCommand(self.getPath(), startPosition, endPosition - startPosition),
+                "csdr shift_addition_cc {0}".format((center_freq - frequency) / samp_rate),
+            ]
+            + plan.get_commands()
+        ) + " > {0}".format(shlex.quote(SigMF.getPaths(path)[1]))
+        logger.debug("starting snapshot: %s", cmd)
+        process = subprocess.Popen(cmd, shell=True, start_new_session=True)
+        Supervisor.getSharedInstance().watch(process, self.source.getOwner(), "recorder").onExit(snapshot.onExit)
+        with self.lock:
+            self.snapshots.append(snapshot)
+        return snapshot
+
+    def getValue(self):
+        try:
+            (start, end) = self.getTimeRange()
+            available = {"start": start, "end": end}
+        except TimeShiftException:
+            available = None
+        with self.lock:
+            snapshots = [s.getValue() for s in self.snapshots]
+        return {"available": available, "snapshots": snapshots}
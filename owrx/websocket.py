@@ -1,9 +1,11 @@
+from owrx.config import Config
 import base64
 import hashlib
 import json
 from multiprocessing import Pipe
 import select
 import threading
+import zlib
 
 import logging
 
@@ -32,6 +34,94 @@ class WebSocketClosed(WebSocketException):
     pass
 
 
+class PerMessageDeflate(object):
+    """
+    the permessage-deflate extension (RFC 7692), with context takeover unless the client asks for none
+    """
+
+    # the end of the sync flush that is left out of every compressed message
+    tail = b"\x00\x00\xff\xff"
+    # not worth the effort below this size
+    minimumSize = 64
+    parameters = [
+        "server_no_context_takeover",
+        "client_no_context_takeover",
+        "server_max_window_bits",
+        "client_max_window_bits",
+    ]
+
+    @staticmethod
+    def negotiate(header, level):
+        """
+        picks the first acceptable offer from a Sec-WebSocket-Extensions header.
+        :return: the extension and the value for the response header, or None if no offer is acceptable
+        """
+        for offer in header.split(","):
+            params = [p.strip() for p in offer.split(";")]
+            if params[0] != "permessage-deflate":
+                continue
+            options = {}
+            for param in params[1:]:
+                (key, _, value) = param.partition("=")
+                options[key.strip()] = value.strip().strip('"')
+            if len(options) != len(params) - 1 or any(k not in PerMessageDeflate.parameters for k in options):
+                continue
+            windowBits = 15
+            if "server_max_window_bits" in options:
+                try:
+                    windowBits = int(options["server_max_window_bits"])
+                except ValueError:
+                    continue
+                # zlib can't produce raw deflate streams with a window of 8 bits
+                if not 9 <= windowBits <= 15:
+                    continue
+            response = ["permessage-deflate"]
+            noContextTakeover = "server_no_context_takeover" in options
+            if noContextTakeover:
+                response.append("server_no_context_takeover")
+            if "client_no_context_takeover" in options:
+                response.append("client_no_context_takeover")
+            if "server_max_window_bits" in options:
+                response.append("server_max_window_bits={0}".format(windowBits))
+            return PerMessageDeflate(level, noContextTakeover, windowBits), "; ".join(response)
+        return None
+
+    def __init__(self, level, noContextTakeover=False, windowBits=15):
+        self.level = level
+        self.noContextTakeover = noContextTakeover
+        self.windowBits = windowBits
+        self.compressor = None
+        # the client's window may be smaller, but never larger
+        self.decompressor = zlib.decompressobj(-15)
+
+    def compress(self, data):
+        if self.compressor is None or self.noContextTakeover:
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, -self.windowBits)
+        payload = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return payload[: -len(PerMessageDeflate.tail)]
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data + PerMessageDeflate.tail)
+
+
+class PreparedMessage(object):
+    """
+    a binary message that is framed once and can then be sent on any number of connections
+    """
+
+    def __init__(self, *parts):
+        size = sum(len(p) for p in parts)
+        header = WebSocketConnection.get_header(size, OPCODE_BINARY_MESSAGE)
+        self.frame = b"".join([header] + list(parts))
+        self.headerSize = len(header)
+
+    def getFrame(self):
+        return self.frame
+
+    def getPayload(self):
+        return memoryview(self.frame)[self.headerSize :]
+
+
 class WebSocketConnection(object):
     connections = []
 
@@ -49,7 +139,11 @@ class WebSocketConnection(object):
         self.setMessageHandler(messageHandler)
         (self.interruptPipeRecv, self.interruptPipeSend) = Pipe(duplex=False)
         self.open = True
-        self.sendLock = threading.Lock()
+        # held while compressing as well, so that messages go out in the order of the compression context
+        self.sendLock = threading.RLock()
+        # registered once, used to wait until the socket accepts more data
+        self.writePoll = select.poll()
+        self.writePoll.register(self.handler.connection, select.POLLOUT)
 
         headers = {key.lower(): value for key, value in self.handler.headers.items()}
         if not "upgrade" in headers:
@@ -63,9 +157,20 @@ class WebSocketConnection(object):
         shakey = hashlib.sha1()
         shakey.update("{ws_key}258EAFA5-E914-47DA-95CA-C5AB0DC85B11".format(ws_key=ws_key).encode())
         ws_key_toreturn = base64.b64encode(shakey.digest())
+
+        self.deflate = None
+        extensions = ""
+        pm = Config.get()
+        level = pm["websocket_compression_level"] if "websocket_compression_level" in pm else None
+        if level is not None and "sec-websocket-extensions" in headers:
+            negotiated = PerMessageDeflate.negotiate(headers["sec-websocket-extensions"], level)
+            if negotiated is not None:
+                (self.deflate, response) = negotiated
+                extensions = "Sec-WebSocket-Extensions: {0}\r\n".format(response)
+
         self.handler.wfile.write(
-            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {0}\r\nCQ-CQ-de: HA5KFU\r\n\r\n".format(
-                ws_key_toreturn.decode()
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {0}\r\n{1}CQ-CQ-de: HA5KFU\r\n\r\n".format(
+                ws_key_toreturn.decode(), extensions
             ).encode()
         )
         self.pingTimer = None
@@ -74,8 +179,12 @@ class WebSocketConnection(object):
     def setMessageHandler(self, messageHandler):
         self.messageHandler = messageHandler
 
-    def get_header(self, size, opcode):
+    @staticmethod
+    def get_header(size, opcode, compressed=False):
         ws_first_byte = 0b10000000 | (opcode & 0x0F)
+        if compressed:
+            # RSV1 marks compressed messages
+            ws_first_byte |= 0b01000000
         if size > 2 ** 16 - 1:
             # frame size can be increased up to 2^64 by setting the size to 127
             # anything beyond that would need to be segmented into frames. i don't really think we'll need more.
@@ -100,9 +209,19 @@ class WebSocketConnection(object):
             # 125 bytes binary message in a single unmasked frame
             return bytes([ws_first_byte, size])
 
-    def send(self, data):
+    def send(self, data, compress=True):
+        """
+        :param compress: whether the message may be compressed, if the client supports it. messages that are already
+        compressed (e.g. adpcm audio) won't get any smaller.
+        """
         if not self.open:
             raise WebSocketClosed()
+        compress = compress and self.deflate is not None
+        if isinstance(data, PreparedMessage):
+            if not compress:
+                self._sendBytes(data.getFrame())
+                return
+            data = data.getPayload()
         # convenience
         if type(data) == dict:
             # allow_nan = False disallows NaN and Infinty to be encoded. Browser JSON will not parse them anyway.
@@ -110,33 +229,42 @@ class WebSocketConnection(object):
 
         # string-type messages are sent as text frames
         if type(data) == str:
-            header = self.get_header(len(data), OPCODE_TEXT_MESSAGE)
-            data_to_send = header + data.encode("utf-8")
+            data = data.encode("utf-8")
+            opcode = OPCODE_TEXT_MESSAGE
         # anything else as binary
         else:
-            header = self.get_header(len(data), OPCODE_BINARY_MESSAGE)
-            data_to_send = header + data
-
-        self._sendBytes(data_to_send)
-
-    def _sendBytes(self, data_to_send):
-        def chunks(l, n):
-            """Yield successive n-sized chunks from l."""
-            for i in range(0, len(l), n):
-                yield l[i : i + n]
+            opcode = OPCODE_BINARY_MESSAGE
 
+        if not compress or len(data) < PerMessageDeflate.minimumSize:
+            self._sendBytes(self.get_header(len(data), opcode), data)
+            return
+        with self.sendLock:
+            data = self.deflate.compress(data)
+            self._sendBytes(self.get_header(len(data), opcode, True), data)
+
+    def _sendBytes(self, *buffers):
+        """
+        writes the buffers to the socket with as few system calls as possible (sendmsg, i.e. writev), without joining
+        or copying them. waits for the socket to become writable if it doesn't take everything at once.
+        """
+        buffers = [memoryview(b).cast("B") for b in buffers if len(b)]
         try:
             with self.sendLock:
-                for chunk in chunks(data_to_send, 1024):
-                    (_, write, _) = select.select([], [self.handler.wfile], [], 10)
-                    if self.handler.wfile in write:
-                        written = self.handler.wfile.write(chunk)
-                        if written != len(chunk):
-                            logger.error("incomplete write! closing socket!")
-                            self.close()
-                    else:
-                        logger.debug("socket not returned from select; closing")
+                while buffers:
+                    try:
+                        written = self.handler.connection.sendmsg(buffers)
+                    except BlockingIOError:
+                        written = 0
+                    # drop whatever has been sent, the remainder of a partially sent buffer is sent as a view
+                    while buffers and written >= len(buffers[0]):
+                        written -= len(buffers[0])
+                        buffers.pop(0)
+                    if buffers and written:
+                        buffers[0] = buffers[0][written:]
+                    if buffers and not self.writePoll.poll(10000):
+                        logger.debug("socket did not become writable; closing")
                         self.close()
+                        return
         # these exception happen when the socket is closed
         except OSError:
             logger.exception("OSError while writing data")
@@ -187,6 +315,7 @@ class WebSocketConnection(object):
                     try:
                         header = protected_read(2)
                         opcode = header[0] & 0x0F
+                        compressed = header[0] & 0b01000000
                         length = header[1] & 0x7F
                         mask = (header[1] & 0x80) >> 7
                         if length == 126:
@@ -197,6 +326,12 @@ class WebSocketConnection(object):
                         data = protected_read(length)
                         if mask:
                             data = bytes([b ^ masking_key[index % 4] for (index, b) in enumerate(data)])
+                        if compressed:
+                            if self.deflate is None:
+                                logger.warning("compressed message without compression being negotiated; closing")
+                                self.open = False
+                                continue
+                            data = self.deflate.decompress(data)
                         if opcode == OPCODE_TEXT_MESSAGE:
                             message = data.decode("utf-8")
                             self.messageHandler.handleTextMessage(self, message)
@@ -217,6 +352,9 @@ class WebSocketConnection(object):
                     except IncompleteRead:
                         logger.warning("incomplete read on websocket; closing connection")
                         self.open = False
+                    except zlib.error:
+                        logger.warning("invalid compressed message on websocket; closing connection")
+                        self.open = False
                     except OSError:
                         logger.exception("OSError while reading data; closing connection")
                         self.open = False
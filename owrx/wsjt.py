@@ -9,6 +9,7 @@ import re
 from queue import Queue, Full
 from owrx.config import Config
 from owrx.metrics import Metrics, CounterMetric, DirectMetric
+from owrx.accounting import ProcessAccounting
 from owrx.pskreporter import PskReporter
 from owrx.parser import Parser
 from abc import ABC, ABCMeta, abstractmethod
@@ -172,8 +173,11 @@ class WsjtChopper(threading.Thread, metaclass=ABCMeta):
             cwd=self.tmp_dir,
             close_fds=True,
         )
+        accounting = ProcessAccounting.getSharedInstance()
+        accounting.track(decoder, self.dsp.get_owner, "decoder", group=False)
         for line in decoder.stdout:
             self.outputWriter.send((job.freq, line))
+        accounting.untrack(decoder)
         try:
             rc = decoder.wait(timeout=10)
             if rc != 0:
@@ -0,0 +1,137 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from owrx.accounting import ProcessAccounting
+import tempfile
+import shutil
+import subprocess
+import os
+
+
+class ProcessAccountingTest(TestCase):
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        self.accounting = ProcessAccounting(self.proc)
+        self.accounting.clockTicks = 100
+        self.accounting.pageSize = 4096
+        self.scheduler = patch.object(ProcessAccounting, "scheduleSample")
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        shutil.rmtree(self.proc)
+
+    def writeProcess(self, pid, pgid, utime, stime=0, cutime=0, rss=10, name="csdr"):
+        os.makedirs("{0}/{1}".format(self.proc, pid), exist_ok=True)
+        # pid (comm) state ppid pgrp session tty_nr tpgid flags minflt cminflt majflt cmajflt utime stime cutime cstime
+        with open("{0}/{1}/stat".format(self.proc, pid), "w") as f:
+            f.write("{0} ({1}) S 1 {2} {2} 0 -1 0 0 0 0 0 {3} {4} {5} 0 20 0 1\n".format(pid, name, pgid, utime, stime, cutime))
+        with open("{0}/{1}/statm".format(self.proc, pid), "w") as f:
+            f.write("1000 {0} 100 1 0 50 0\n".format(rss))
+
+    def removeProcess(self, pid):
+        shutil.rmtree("{0}/{1}".format(self.proc, pid))
+
+    def testAggregatesProcessGroup(self):
+        self.writeProcess(100, 100, 10)
+        self.writeProcess(101, 100, 20, name="csdr fir_decimate_cc")
+        self.writeProcess(200, 200, 500)
+        self.accounting.track(Mock(pid=100), "client.1", "dsp")
+        with patch("time.monotonic", return_value=10):
+            self.accounting.sample()
+        self.writeProcess(101, 100, 120)
+        with patch("time.monotonic", return_value=12):
+            self.accounting.sample()
+        usage = self.accounting.getUsage()["client.1"]
+        # 100 ticks in 2 seconds
+        self.assertEqual(usage["cpu"], 0.5)
+        self.assertEqual(usage["processes"], 2)
+        self.assertEqual(usage["rss"], 2 * 10 * 4096)
+        self.assertEqual(usage["cpu_time"], 1.3)
+        self.assertEqual(usage["kinds"]["dsp"]["cpu"], 0.5)
+
+    def testAggregatesByOwner(self):
+        self.writeProcess(100, 100, 0)
+        self.writeProcess(200, 200, 0)
+        self.accounting.track(Mock(pid=100), "service.rtlsdr.ft8.14074000", "dsp")
+        self.accounting.track(Mock(pid=200), lambda: "service.rtlsdr.ft8.14074000", "secondary")
+        with patch("time.monotonic", return_value=10):
+            self.accounting.sample()
+        self.writeProcess(100, 100, 100)
+        self.writeProcess(200, 200, 300)
+        with patch("time.monotonic", return_value=11):
+            self.accounting.sample()
+        usage = self.accounting.getUsage()
+        self.assertEqual(list(usage.keys()), ["service.rtlsdr.ft8.14074000"])
+        self.assertEqual(usage["service.rtlsdr.ft8.14074000"]["cpu"], 4.0)
+        self.assertEqual(usage["service.rtlsdr.ft8.14074000"]["kinds"]["secondary"]["cpu"], 3.0)
+
+    def testReapedChildrenStayAccounted(self):
+        self.writeProcess(100, 100, 10, name="sh")
+        self.writeProcess(101, 100, 100)
+        self.accounting.track(Mock(pid=100), "client.1", "dsp")
+        with patch("time.monotonic", return_value=10):
+            self.accounting.sample()
+        # the shell has waited for its child
+        self.removeProcess(101)
+        self.writeProcess(100, 100, 10, cutime=100, name="sh")
+        with patch("time.monotonic", return_value=11):
+            self.accounting.sample()
+        self.assertEqual(self.accounting.getUsage()["client.1"]["cpu"], 0)
+
+    def testUntrackKeepsCpuTime(self):
+        self.writeProcess(300, 1, 250, name="jt9")
+        self.writeProcess(100, 100, 0)
+        self.accounting.track(Mock(pid=100), "service.rtlsdr.ft8.14074000", "dsp")
+        decoder = Mock(pid=300)
+        self.accounting.track(decoder, "service.rtlsdr.ft8.14074000", "decoder", group=False)
+        self.accounting.untrack(decoder)
+        usage = self.accounting.getUsage()["service.rtlsdr.ft8.14074000"]
+        self.assertEqual(usage["cpu_time"], 2.5)
+        self.assertNotIn("decoder", usage["kinds"])
+
+    def testUntrackOnlyReadsTheLeader(self):
+        self.writeProcess(100, 100, 10, name="sh")
+        self.writeProcess(101, 100, 100)
+        process = Mock(pid=100)
+        self.accounting.track(process, "client.1", "dsp")
+        with patch("time.monotonic", return_value=10):
+            self.accounting.sample()
+        # the shell has waited for its child before exiting
+        self.removeProcess(101)
+        self.writeProcess(100, 100, 10, cutime=150, name="sh")
+        with patch.object(self.accounting, "scan") as scan, patch("time.monotonic", return_value=11):
+            self.accounting.untrack(process)
+        scan.assert_not_called()
+        self.assertEqual(self.accounting.getUsage()["client.1"]["cpu_time"], 1.6)
+
+    def testForgetsFinishedOwners(self):
+        self.writeProcess(100, 100, 50)
+        process = Mock(pid=100)
+        self.accounting.track(process, "client.1", "dsp")
+        self.accounting.untrack(process)
+        self.assertIn("client.1", self.accounting.getUsage())
+        self.accounting.sample()
+        self.assertEqual(self.accounting.getUsage(), {})
+
+    def testMissingProcess(self):
+        self.accounting.track(Mock(pid=100), "client.1", "dsp")
+        self.accounting.sample()
+        self.assertEqual(self.accounting.getUsage()["client.1"]["processes"], 0)
+
+
+class ProcessAccountingProcTest(TestCase):
+    def testRealProcess(self):
+        accounting = ProcessAccounting()
+        if not accounting.isAvailable():
+            self.skipTest("no /proc")
+        with patch.object(ProcessAccounting, "scheduleSample"):
+            process = subprocess.Popen("sleep 5 | cat", shell=True, start_new_session=True)
+            try:
+                accounting.track(process, "client.1", "dsp")
+                accounting.sample()
+                usage = accounting.getUsage()["client.1"]
+                self.assertGreaterEqual(usage["processes"], 1)
+                self.assertGreater(usage["rss"], 0)
+            finally:
+                os.killpg(process.pid, 15)
+                process.wait()
@@ -0,0 +1,143 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from owrx.admission import AdmissionController, CostModel
+from owrx.service import ServiceHandler
+
+
+class CostModelTest(TestCase):
+    def testDefaults(self):
+        model = CostModel()
+        analog = model.estimate(2400000, "nfm")
+        self.assertAlmostEqual(analog, 2.4 * CostModel.defaultDdc + CostModel.defaultDemodulator)
+        self.assertGreater(model.estimate(2400000, "dmr"), analog)
+        self.assertGreater(model.estimate(2400000, "usb", "ft8"), model.estimate(2400000, "usb"))
+
+    def testSecondaryFft(self):
+        model = CostModel()
+        withFft = model.estimateSettings(2400000, {"mod": "usb", "secondary_mod": "bpsk31"})
+        withoutFft = model.estimate(2400000, "usb", "bpsk31")
+        self.assertAlmostEqual(withFft - withoutFft, CostModel.defaultSecondaryFft)
+        self.assertEqual(model.estimateSettings(2400000, {"mod": "usb", "secondary_mod": False}), model.estimate(2400000, "usb"))
+
+    def testLearnsFromUsage(self):
+        model = CostModel()
+        kinds = {
+            "dsp": {"cpu": 0.24},
+            "demodulator": {"cpu": 0.3},
+            "secondary": {"cpu": 0.05},
+            "decoder": {"cpu": 0.05},
+        }
+        model.learnFromUsage(2400000, "dmr", "ft8", kinds)
+        self.assertAlmostEqual(model.get("ddc"), 0.1)
+        self.assertAlmostEqual(model.get("demodulator.dmr"), 0.3)
+        self.assertAlmostEqual(model.get("secondary.ft8"), 0.1)
+        # other modes keep their defaults
+        self.assertEqual(model.get("demodulator.nfm"), CostModel.defaultDemodulator)
+
+        model.learnFromUsage(2400000, "dmr", None, {"dsp": {"cpu": 0.24}, "demodulator": {"cpu": 0.5}})
+        self.assertAlmostEqual(model.get("demodulator.dmr"), 0.3 + 0.2 * CostModel.smoothing)
+
+    def testCombinedChainIsNotLearned(self):
+        model = CostModel()
+        model.learnFromUsage(2400000, "nfm", None, {"dsp": {"cpu": 0.5}})
+        self.assertEqual(model.getValue(), {})
+
+
+class AdmissionControllerTest(TestCase):
+    def setUp(self):
+        self.controller = AdmissionController()
+        self.budget = patch.object(AdmissionController, "getBudget", return_value=1.0)
+        self.budget.start()
+        self.enabled = patch.object(AdmissionController, "isEnabled", return_value=True)
+        self.enabled.start()
+        self.usage = {}
+        self.accounting = patch("owrx.admission.ProcessAccounting.getSharedInstance")
+        self.accounting.start().return_value.getUsage.side_effect = lambda: self.usage
+
+    def tearDown(self):
+        self.accounting.stop()
+        self.enabled.stop()
+        self.budget.stop()
+
+    def testAdmitsWithinBudget(self):
+        self.assertEqual(self.controller.admit(0.5), AdmissionController.ADMIT)
+        # the reservation counts until the chain shows up in the measurements
+        self.assertEqual(self.controller.getLoad(), 0.5)
+        self.assertEqual(self.controller.admit(0.6), AdmissionController.REJECT)
+
+    def testMeasuredLoad(self):
+        self.usage = {"client.1": {"cpu": 0.8, "kinds": {}}}
+        self.assertEqual(self.controller.admit(0.3), AdmissionController.REJECT)
+        self.assertEqual(self.controller.rejected.getValue(), {"count": 1})
+
+    def testDegrades(self):
+        self.usage = {"client.1": {"cpu": 0.8, "kinds": {}}}
+        spectrum = Mock()
+        self.controller.addSpectrum(spectrum)
+        with patch("owrx.admission.Reactor"):
+            self.assertEqual(self.controller.admit(0.3, 0.1), AdmissionController.DEGRADE)
+        spectrum.setDegraded.assert_called_once_with(True)
+
+    def testRecovery(self):
+        self.usage = {"client.1": {"cpu": 0.9, "kinds": {}}}
+        spectrum = Mock()
+        self.controller.addSpectrum(spectrum)
+        with patch("owrx.admission.Reactor"):
+            self.controller.admit(0.3)
+            self.controller.checkRecovery()
+            spectrum.setDegraded.assert_called_once_with(True)
+            self.usage = {"client.1": {"cpu": 0.5, "kinds": {}}}
+            self.controller.checkRecovery()
+        spectrum.setDegraded.assert_called_with(False)
+        self.assertFalse(self.controller.degraded)
+
+    def testRejectsChainChange(self):
+        self.usage = {"client.1": {"cpu": 0.95, "kinds": {}}}
+        current = {"mod": "nfm"}
+        with patch("owrx.admission.Reactor"):
+            self.assertEqual(
+                self.controller.admitChain(2400000, {"mod": "dmr"}, current), AdmissionController.REJECT
+            )
+        # switching to a cheaper mode is always possible
+        self.assertEqual(self.controller.admitChain(2400000, current, {"mod": "dmr"}), AdmissionController.ADMIT)
+
+    def testDisabled(self):
+        with patch.object(AdmissionController, "isEnabled", return_value=False):
+            self.assertEqual(self.controller.admit(100), AdmissionController.ADMIT)
+            self.assertTrue(self.controller.admitListener())
+
+    def testDisabledByDefault(self):
+        self.budget.stop()
+        self.addCleanup(self.budget.start)
+        self.assertIsNone(AdmissionController().getBudget())
+
+    def testListenerOnRequestedSource(self):
+        self.usage = {"client.1": {"cpu": 0.8, "kinds": {}}}
+        small = Mock()
+        small.getProps.return_value = {"samp_rate": 250000}
+        large = Mock()
+        large.getProps.return_value = {"samp_rate": 10000000}
+        with patch("owrx.admission.Reactor"):
+            self.assertTrue(self.controller.admitListener(small))
+            self.assertFalse(self.controller.admitListener(large))
+        with patch("owrx.sdr.SdrService.getFirstSource", return_value=small):
+            self.assertTrue(self.controller.admitListener())
+
+
+class ServiceAdmissionTest(TestCase):
+    def testChargesTheDemodulatorTheServiceRunsWith(self):
+        handler = ServiceHandler.__new__(ServiceHandler)
+        handler.source = Mock()
+        source = Mock()
+        source.getProps.return_value = {"samp_rate": 2400000, "center_freq": 14000000}
+        with patch("owrx.service.AdmissionController.getSharedInstance") as controller:
+            controller.return_value.admitService.return_value = AdmissionController.ADMIT
+            with patch("owrx.service.dsp") as dsp:
+                handler.setupService("ft8", 14074000, source)
+                handler.setupService("packet", 14105000, source)
+        # the same keys that the cost model learns under from the running dsps
+        self.assertEqual(
+            [c.args for c in controller.return_value.admitService.call_args_list],
+            [(2400000, "ssb", "ft8"), (2400000, "nfm", "packet")],
+        )
+        self.assertEqual([c.args[0] for c in dsp.return_value.set_demodulator.call_args_list], ["ssb", "nfm"])
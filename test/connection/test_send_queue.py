@@ -0,0 +1,184 @@
+from unittest import TestCase
+from owrx.sendqueue import SendQueue, SendQueueClosed, SendQueueMetrics
+from owrx.connection import Client
+from owrx.source import SdrSource
+from unittest.mock import Mock
+from owrx.websocket import WebSocketClosed
+from queue import Full
+import threading
+import time
+
+
+class SendQueueTest(TestCase):
+    def testOrder(self):
+        queue = SendQueue("test.order", 10)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual([queue.get() for _ in range(5)], list(range(5)))
+
+    def testDropsWhenFull(self):
+        queue = SendQueue("test.full", 2)
+        queue.put(1)
+        queue.put(2)
+        with self.assertRaises(Full):
+            queue.put(3)
+        self.assertEqual(queue.getValue()["control"], {"depth": 2, "max_depth": 2, "sent": 0, "drops": 1})
+
+    def testDropsOldestAudioBeyondByteLimit(self):
+        queue = SendQueue("test.audio")
+        frame = bytes(1024)
+        count = SendQueue.audioBytes // len(frame)
+        for i in range(count + 10):
+            queue.put(bytes([i % 256]) + frame[1:], SendQueue.AUDIO)
+        value = queue.getValue()["audio"]
+        self.assertEqual(value["depth"], count)
+        self.assertEqual(value["drops"], 10)
+        self.assertEqual(queue.get()[0], 10)
+
+    def testPriorities(self):
+        queue = SendQueue("test.priorities")
+        queue.put("waterfall", SendQueue.WATERFALL)
+        queue.put("fft", SendQueue.SECONDARY_FFT)
+        queue.put("config")
+        queue.put("audio 1", SendQueue.AUDIO)
+        queue.put("audio 2", SendQueue.AUDIO)
+        self.assertEqual([queue.get() for _ in range(5)], ["audio 1", "audio 2", "config", "fft", "waterfall"])
+
+    def testKeepsNewestWaterfallRows(self):
+        queue = SendQueue("test.waterfall")
+        for i in range(SendQueue.waterfallDepth + 5):
+            queue.put(i, SendQueue.WATERFALL)
+        self.assertEqual(queue.getDepth(), SendQueue.waterfallDepth)
+        self.assertEqual(queue.get(), 5)
+        self.assertEqual(queue.getValue()["waterfall"]["drops"], 5)
+
+    def testCloseWakesUpReader(self):
+        queue = SendQueue("test.close")
+        result = []
+
+        def read():
+            try:
+                queue.get()
+            except SendQueueClosed:
+                result.append("closed")
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        time.sleep(0.05)
+        queue.close()
+        thread.join(1)
+        self.assertEqual(result, ["closed"])
+        with self.assertRaises(SendQueueClosed):
+            queue.put(1)
+
+    def testMetrics(self):
+        queue = SendQueue("test.metrics")
+        queue.put("x")
+        self.assertEqual(SendQueueMetrics.getSharedInstance().getValue()["test.metrics"]["control"]["depth"], 1)
+        queue.close()
+        self.assertNotIn("test.metrics", SendQueueMetrics.getSharedInstance().getValue())
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.sent = []
+        self.open = True
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+    def send(self, data, compress=True):
+        self.unblock.wait()
+        if not self.open:
+            raise WebSocketClosed()
+        self.sent.append(data)
+
+    def close(self):
+        self.open = False
+        self.unblock.set()
+
+
+class ResetConnection(FakeConnection):
+    def send(self, data, compress=True):
+        raise ConnectionResetError()
+
+
+class ClientTest(TestCase):
+    def testQueuedMessagesAreSent(self):
+        conn = FakeConnection()
+        client = Client(conn)
+        self.addCleanup(client.close)
+        for i in range(3):
+            client.queue_send(i)
+        deadline = time.monotonic() + 1
+        while len(conn.sent) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(conn.sent, [0, 1, 2])
+
+    def testSlowClientIsDisconnected(self):
+        conn = FakeConnection()
+        conn.unblock.clear()
+        client = Client(conn)
+        for i in range(client.sendQueue.classes[SendQueue.CONTROL].maxsize + 2):
+            client.queue_send(i)
+        self.assertFalse(conn.open)
+        self.assertTrue(client.sendQueue.closed)
+
+    def testClosesOnConnectionError(self):
+        conn = ResetConnection()
+        client = Client(conn)
+        client.queue_send("x")
+        deadline = time.monotonic() + 1
+        while conn.open and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(conn.open)
+        self.assertTrue(client.sendQueue.closed)
+
+    def testWaterfallCongestionDoesNotDisconnect(self):
+        conn = FakeConnection()
+        conn.unblock.clear()
+        client = Client(conn)
+        self.addCleanup(client.close)
+        for i in range(200):
+            client.queue_send(bytes([i]), SendQueue.WATERFALL)
+        client.queue_send(b"audio", SendQueue.AUDIO)
+        self.assertTrue(conn.open)
+        conn.unblock.set()
+        deadline = time.monotonic() + 1
+        while (client.sendQueue.getDepth() or len(conn.sent) < 11) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn(b"audio", conn.sent)
+        rows = [d for d in conn.sent if d != b"audio"]
+        # the newest rows, plus the one that may have been in flight when the congestion started
+        for i in range(190, 200):
+            self.assertIn(bytes([i]), rows)
+        self.assertLessEqual(len(rows), SendQueue.waterfallDepth + 1)
+
+
+    def testAudioCongestionDoesNotDisconnect(self):
+        conn = FakeConnection()
+        conn.unblock.clear()
+        client = Client(conn)
+        self.addCleanup(client.close)
+        # a few seconds worth of 12 kHz pcm at 200 frames per second
+        frame = bytes(120)
+        for i in range(1000):
+            client.queue_send(bytes([0x02]) + frame, SendQueue.AUDIO)
+        self.assertTrue(conn.open)
+        self.assertFalse(client.sendQueue.closed)
+        conn.unblock.set()
+        deadline = time.monotonic() + 1
+        while client.sendQueue.getDepth() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(conn.open)
+        self.assertGreaterEqual(len(conn.sent), 999)
+
+
+class SpectrumBroadcastTest(TestCase):
+    def testRowIsFramedOnce(self):
+        source = Mock()
+        source.spectrumClients = [Mock(), Mock(), Mock()]
+        SdrSource.writeSpectrumData(source, b"row")
+        messages = [c.write_spectrum_data.call_args[0][0] for c in source.spectrumClients]
+        self.assertIs(messages[0], messages[1])
+        self.assertIs(messages[0], messages[2])
+        self.assertEqual(bytes(messages[0].getPayload()), b"\x01row")
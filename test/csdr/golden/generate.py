@@ -0,0 +1,144 @@
+"""
+Reference audio for the numpy worker: the test signals from test_numpy_dsp run through the demodulator chains, saved
+as 16 bit samples after the filters and the agc have settled.
+
+    python3 -m test.csdr.golden.generate [csdr|numpy]
+
+"csdr" (the default) runs the same csdr commands as the csdr backend and is what the vectors are meant to come from;
+"numpy" takes the output of the worker itself, for machines without csdr.
+"""
+
+from fractions import Fraction
+import numpy as np
+import subprocess
+import tempfile
+import sys
+import os
+
+samp_rate = 240000
+decimation = 5
+if_rate = samp_rate // decimation
+output_rate = 12000
+duration = 0.5
+# after the filters and the agc have settled
+start = 2400
+length = 3000
+transition_bw = 0.15
+
+# offset, bandpass and test signal per mode
+modes = {
+    "nfm": (20000, -4000, 4000, "fm"),
+    "am": (-30000, -5000, 5000, "am"),
+    # two tones at 700 and 1900 Hz above the dial frequency
+    "usb": (10000, 300, 3000, "two_tone"),
+}
+
+
+def fm(offset, tone=1000, deviation=2500, amplitude=0.5):
+    t = np.arange(int(samp_rate * duration)) / samp_rate
+    phase = 2 * np.pi * offset * t + 2 * np.pi * deviation * np.cumsum(np.sin(2 * np.pi * tone * t)) / samp_rate
+    return (amplitude * np.exp(1j * phase)).astype(np.complex64)
+
+
+def am(offset, tone=700, amplitude=0.5):
+    t = np.arange(int(samp_rate * duration)) / samp_rate
+    envelope = amplitude * (1 + 0.5 * np.sin(2 * np.pi * tone * t))
+    return (envelope * np.exp(2j * np.pi * offset * t)).astype(np.complex64)
+
+
+def two_tone(offset, amplitude=0.25):
+    t = np.arange(int(samp_rate * duration)) / samp_rate
+    signal = np.exp(2j * np.pi * (offset + 700) * t) + np.exp(2j * np.pi * (offset + 1900) * t)
+    return (amplitude * signal).astype(np.complex64)
+
+
+def getInput(mode):
+    (offset, _, _, signal) = modes[mode]
+    return globals()[signal](offset)
+
+
+def getPath(mode):
+    return os.path.join(os.path.dirname(__file__), "{0}.s16".format(mode))
+
+
+def load(mode):
+    return np.fromfile(getPath(mode), dtype="<i2").astype(np.float64)
+
+
+def csdrCommand(mode, path):
+    (offset, low_cut, high_cut, _) = modes[mode]
+    ratio = Fraction(output_rate, if_rate)
+    resampler = "csdr rational_resampler_ff {0} {1} {2}".format(
+        ratio.numerator, ratio.denominator, transition_bw / max(ratio.numerator, ratio.denominator)
+    )
+    chain = [
+        "cat {0}".format(path),
+        "csdr shift_addition_cc {0}".format(-offset / samp_rate),
+        "csdr fir_decimate_cc {0} {1} HAMMING".format(decimation, transition_bw / decimation),
+        "csdr bandpass_fir_fft_cc {0} {1} {2} HAMMING".format(low_cut / if_rate, high_cut / if_rate, 320 / if_rate),
+    ]
+    if mode == "nfm":
+        chain += ["csdr fmdemod_quadri_cf", "csdr limit_ff", resampler]
+        chain += ["csdr deemphasis_nfm_ff {0}".format(output_rate)]
+    elif mode == "am":
+        chain += ["csdr amdemod_cf", "csdr fastdcblock_ff", resampler, "csdr agc_ff", "csdr limit_ff"]
+    else:
+        chain += ["csdr realpart_cf", resampler, "csdr agc_ff", "csdr limit_ff"]
+    return " | ".join(chain + ["csdr convert_f_s16"])
+
+
+def runCsdr(mode):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iq")
+        getInput(mode).tofile(path)
+        output = subprocess.run(csdrCommand(mode, path), shell=True, stdout=subprocess.PIPE, check=True).stdout
+    return np.frombuffer(output, dtype="<i2").astype(np.float64)
+
+
+def runNumpy(mode):
+    from csdr.numpy_dsp import NumpyDsp
+
+    (offset, low_cut, high_cut, _) = modes[mode]
+    dsp = NumpyDsp(
+        "ssb" if mode == "usb" else mode,
+        decimation,
+        transition_bw / decimation,
+        320 / if_rate,
+        if_rate,
+        output_rate,
+    )
+    dsp.setShift(-offset / samp_rate)
+    dsp.setBandpass(low_cut / if_rate, high_cut / if_rate)
+    iq = getInput(mode)
+    output = b"".join(dsp.process(iq[i : i + 8192]) for i in range(0, len(iq), 8192))
+    return np.frombuffer(output, dtype="<i2").astype(np.float64)
+
+
+def compare(output, reference, max_lag=50):
+    """
+    signal to noise ratio in dB of output against reference, after the best lag and gain have been applied. the
+    agcs of both backends work differently, so only the shape of the audio is compared.
+    """
+    reference = reference - np.mean(reference)
+    best = -np.inf
+    for lag in range(-max_lag, max_lag + 1):
+        if start + lag < 0 or start + lag + len(reference) > len(output):
+            continue
+        segment = output[start + lag : start + lag + len(reference)]
+        segment = segment - np.mean(segment)
+        gain = np.dot(segment, reference) / np.dot(segment, segment) if np.any(segment) else 0
+        error = reference - gain * segment
+        best = max(best, 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-12)))
+    return best
+
+
+def main(args):
+    run = runNumpy if args and args[0] == "numpy" else runCsdr
+    for mode in modes:
+        output = run(mode)
+        output[start : start + length].astype("<i2").tofile(getPath(mode))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
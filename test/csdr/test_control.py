@@ -0,0 +1,92 @@
+from unittest import TestCase
+from csdr import control
+from csdr.csdr import WritingPipe, ControlSocketReader, dsp
+from unittest.mock import Mock
+import threading
+import tempfile
+import socket
+import os
+
+
+class FramingTest(TestCase):
+    def testRoundTrip(self):
+        decoder = control.FrameDecoder()
+        data = control.encode_values(control.BPF, [-0.1, 0.25]) + control.encode(control.SMETER, b"")
+        self.assertEqual(
+            decoder.feed(data),
+            [(control.BPF, control.encode_values(control.BPF, [-0.1, 0.25])[3:]), (control.SMETER, b"")],
+        )
+        self.assertEqual(control.decode_values(decoder.feed(control.encode_values(control.SHIFT, [0.5]))[0][1]), [0.5])
+
+    def testPartialFrames(self):
+        decoder = control.FrameDecoder()
+        data = control.encode_values(control.SQUELCH, [1.5]) * 2
+        frames = []
+        for i in range(len(data)):
+            frames += decoder.feed(data[i : i + 1])
+        self.assertEqual([control.decode_values(p) for (t, p) in frames], [[1.5], [1.5]])
+        self.assertEqual(len(decoder.buffer), 0)
+
+    def testSocketReader(self):
+        (a, b) = socket.socketpair()
+        reader = ControlSocketReader(a)
+        b.sendall(control.encode_values(control.SHIFT, [0.5]) + control.encode_values(control.SMETER, [0.1, 0.2]))
+        b.close()
+        while reader.fill():
+            pass
+        self.assertEqual(reader.frames(), [0.1, 0.2])
+        reader.close()
+
+
+class ControlSocketTest(TestCase):
+    def setUp(self):
+        (self.socket, self.worker) = socket.socketpair()
+        self.addCleanup(self.worker.close)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.socket.setblocking(False)
+        self.dsp = dsp(Mock())
+        self.dsp.control_socket = self.socket
+        self.addCleanup(self.socket.close)
+
+    def testFullSocketKeepsFramesIntact(self):
+        count = 0
+        while not self.dsp.control_backlog:
+            self.dsp.send_control("shift_pipe", [count])
+            count += 1
+        # nothing is dropped, and the next command goes out after the ones that are waiting
+        self.dsp.send_control("bpf_pipe", [-0.1, 0.1])
+        decoder = control.FrameDecoder()
+        frames = []
+        self.worker.setblocking(False)
+        while True:
+            try:
+                frames += decoder.feed(self.worker.recv(65536))
+            except BlockingIOError:
+                if self.dsp.flush_control() and not decoder.buffer and len(frames) == count + 1:
+                    break
+        self.assertEqual([control.decode_values(p) for (t, p) in frames[:count]], [[i] for i in range(count)])
+        self.assertEqual(frames[-1][0], control.BPF)
+        self.assertEqual(self.dsp.control_backlog, b"")
+
+    def testUnknownCommandsAreIgnored(self):
+        self.dsp.send_control("dmr_control_pipe", [1])
+        self.assertEqual(self.dsp.control_backlog, b"")
+        self.worker.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            self.worker.recv(100)
+
+
+class WritingPipeTest(TestCase):
+    def testWriteBeforeReaderIsUp(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pipe")
+            threads = threading.active_count()
+            pipe = WritingPipe(path)
+            self.assertEqual(threading.active_count(), threads)
+            pipe.write("0.1\n")
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            self.assertEqual(os.read(fd, 100), b"0.1\n")
+            os.close(fd)
+            pipe.close()
+            pipe.close()
+            self.assertFalse(os.path.exists(path))
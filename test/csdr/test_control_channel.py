@@ -0,0 +1,76 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from csdr.csdr import ControlChannel
+import threading
+import time
+
+
+class DspStub(object):
+    def __init__(self):
+        self.modification_lock = threading.Lock()
+        self.running = True
+        self.pipes = {"shift_pipe": Mock(), "bpf_pipe": Mock()}
+
+    def send_control(self, name, values):
+        self.pipes[name].write(" ".join("%g" % v for v in values) + "\n")
+
+    def get_control_period(self):
+        return 0.05
+
+    def flush_control(self):
+        return True
+
+
+class ControlChannelTest(TestCase):
+    def setUp(self):
+        self.dsp = DspStub()
+        self.channel = ControlChannel(self.dsp)
+
+    def waitForWrites(self, pipe, count):
+        deadline = time.monotonic() + 2
+        while pipe.write.call_count < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def testCoalescesToLatestValue(self):
+        for i in range(20):
+            self.channel.write("shift_pipe", i)
+        time.sleep(0.15)
+        # the first value may go out right away, everything after that waits for the control period
+        pipe = self.dsp.pipes["shift_pipe"]
+        self.assertLessEqual(pipe.write.call_count, 2)
+        pipe.write.assert_called_with("19\n")
+
+    def testKeepsValuesPerPipe(self):
+        self.channel.write("shift_pipe", 0.1)
+        self.channel.write("bpf_pipe", -0.1, 0.1)
+        self.channel.flush()
+        self.dsp.pipes["shift_pipe"].write.assert_called_once_with("0.1\n")
+        self.dsp.pipes["bpf_pipe"].write.assert_called_once_with("-0.1 0.1\n")
+
+    def testRetriesWhileRestarting(self):
+        with self.dsp.modification_lock:
+            self.channel.write("shift_pipe", 0.1)
+            self.channel.flush()
+            self.dsp.pipes["shift_pipe"].write.assert_not_called()
+        self.waitForWrites(self.dsp.pipes["shift_pipe"], 1)
+        self.dsp.pipes["shift_pipe"].write.assert_called_once_with("0.1\n")
+
+    def testDropsValuesForStoppedChain(self):
+        self.channel.write("shift_pipe", 0.1)
+        self.dsp.running = False
+        self.channel.flush()
+        self.dsp.pipes["shift_pipe"].write.assert_not_called()
+
+    def testRetriesBacklogWithoutNewWrites(self):
+        flushes = []
+        self.dsp.flush_control = lambda: flushes.append(time.monotonic()) or len(flushes) > 2
+        self.channel.write("shift_pipe", 0.1)
+        self.channel.flush()
+        deadline = time.monotonic() + 2
+        while len(flushes) < 3:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        time.sleep(0.15)
+        self.assertEqual(len(flushes), 3)
+        self.assertFalse(self.channel.backlogged)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+from csdr.decimation import DecimationPlanner, filter_length
+
+
+class DecimationPlannerTest(TestCase):
+    def testStaysCloseToIntegerDecimation(self):
+        for (input_rate, output_rate) in [(2400000, 12000), (2048000, 12000), (250000, 12000), (10000000, 48000)]:
+            plan = DecimationPlanner.plan(input_rate, output_rate)
+            decimation = DecimationPlanner.get_integer_decimation(input_rate, output_rate)
+            self.assertLessEqual(plan.get_decimation(), decimation)
+            self.assertGreaterEqual(plan.get_decimation(), decimation * (1 - DecimationPlanner.search_range))
+            self.assertGreaterEqual(plan.get_intermediate_rate(), output_rate)
+            self.assertAlmostEqual(plan.get_fraction(), plan.get_intermediate_rate() / output_rate)
+
+    def testKeepsExactDecimation(self):
+        # no resampler needed, nothing to gain from a smaller decimation
+        self.assertEqual(DecimationPlanner.plan(2400000, 12000).get_decimation(), 200)
+        self.assertEqual(DecimationPlanner.plan(250000, 12500).get_decimation(), 20)
+
+    def testPrimeDecimation(self):
+        for (input_rate, output_rate, prime) in [(1000000, 12000, 83), (10000000, 11025, 907)]:
+            self.assertEqual(DecimationPlanner.get_integer_decimation(input_rate, output_rate), prime)
+            plan = DecimationPlanner.plan(input_rate, output_rate)
+            single = DecimationPlanner.single_stage(input_rate, output_rate)
+            self.assertGreater(len(plan.stages), 1)
+            self.assertTrue(all(stage.decimation < prime for stage in plan.stages))
+            self.assertLess(plan.get_cost(), single.get_cost() / 2)
+
+    def testFactorizations(self):
+        self.assertEqual(
+            sorted(DecimationPlanner.factorizations(12, 4)),
+            sorted([[12], [2, 6], [6, 2], [3, 4], [4, 3], [2, 2, 3], [2, 3, 2], [3, 2, 2]]),
+        )
+        self.assertEqual(DecimationPlanner.factorizations(12, 1), [[12]])
+        self.assertEqual(DecimationPlanner.factorizations(1, 4), [[]])
+
+    def testCascadeIsCheaper(self):
+        plan = DecimationPlanner.plan(2400000, 12000)
+        single = DecimationPlanner.single_stage(2400000, 12000)
+        self.assertGreater(len(plan.stages), 1)
+        self.assertLess(plan.get_cost(), single.get_cost() / 2)
+
+    def testSingleStageMatchesPreviousFilter(self):
+        (stage,) = DecimationPlanner.single_stage(250000, 12000).stages
+        self.assertEqual(stage.decimation, 20)
+        self.assertAlmostEqual(stage.transition_bw, 0.15 / 20)
+
+    def testLastStageKeepsTransitionBandwidth(self):
+        plan = DecimationPlanner.plan(2400000, 12000)
+        last = plan.stages[-1]
+        self.assertAlmostEqual(last.transition_bw * last.input_rate, 0.15 * plan.get_intermediate_rate())
+
+    def testPassbandIsAliasFree(self):
+        plan = DecimationPlanner.plan(8000000, 12000)
+        passband = plan.get_intermediate_rate() * (0.5 - 0.15 / 2)
+        for stage in plan.stages:
+            # the stopband starts where the transition band ends, and its alias must not reach into the passband
+            stopband = stage.get_output_rate() / 2 + stage.transition_bw * stage.input_rate / 2
+            self.assertGreaterEqual(stage.get_output_rate() - stopband, passband - 1e-6)
+
+    def testNoDecimation(self):
+        plan = DecimationPlanner.plan(48000, 48000)
+        self.assertEqual(plan.stages, [])
+        self.assertEqual(plan.get_commands(), [])
+
+    def testCommands(self):
+        plan = DecimationPlanner.plan(240000, 12000)
+        commands = plan.get_commands()
+        self.assertEqual(len(commands), len(plan.stages))
+        for command in commands:
+            self.assertTrue(command.startswith("csdr fir_decimate_cc "))
+
+    def testFilterLength(self):
+        self.assertEqual(filter_length(0.15 / 20), 533)
+        self.assertEqual(filter_length(2), 3)
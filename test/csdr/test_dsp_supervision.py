@@ -0,0 +1,51 @@
+from unittest import TestCase
+from csdr.csdr import dsp
+import subprocess
+import threading
+
+
+class DspSupervisionTest(TestCase):
+    def setUp(self):
+        self.dsp = dsp(None)
+        self.restarted = threading.Event()
+        self.secondaryRestarted = []
+        self.dsp.restart = self.restarted.set
+        self.dsp.restart_secondary_demodulator = self.onSecondaryRestart
+        # there's nothing to stop, only the flag matters here
+        self.dsp.running = True
+
+    def onSecondaryRestart(self, process):
+        self.secondaryRestarted.append(process)
+        self.restarted.set()
+
+    def start(self, command):
+        process = subprocess.Popen(command, shell=True, start_new_session=True)
+        self.addCleanup(process.wait)
+        return process
+
+    def testRestartsOnAbnormalExit(self):
+        for command in ["exit 0", "exit 3", "kill -9 $$"]:
+            self.restarted.clear()
+            self.dsp.process = self.start(command)
+            self.dsp.watch_process(self.dsp.process, "dsp")
+            self.assertTrue(self.restarted.wait(5), command)
+        self.assertEqual(self.dsp.supervision.restarts, 3)
+
+    def testNoRestartForReplacedProcess(self):
+        process = self.start("exit 1")
+        self.dsp.watch_process(process, "dsp")
+        self.assertFalse(self.restarted.wait(0.5))
+
+    def testNoRestartWhenStopped(self):
+        self.dsp.running = False
+        self.dsp.process = self.start("exit 1")
+        self.dsp.watch_process(self.dsp.process, "dsp")
+        self.assertFalse(self.restarted.wait(0.5))
+
+    def testRestartsSecondaryDemodulator(self):
+        self.dsp.secondary_process_demod = self.start("exit 1")
+        self.dsp.watch_secondary_process(self.dsp.secondary_process_demod, "secondary")
+        self.assertTrue(self.restarted.wait(5))
+        self.assertEqual(self.secondaryRestarted, [self.dsp.secondary_process_demod])
+        self.assertEqual(self.dsp.secondary_supervision.restarts, 1)
+        self.assertEqual(self.dsp.supervision.restarts, 0)
@@ -0,0 +1,97 @@
+from unittest import TestCase, skipIf
+from owrx.source.signal_generator import JsonOption
+import subprocess
+import tempfile
+import shutil
+import wave
+import json
+import sys
+import os
+
+try:
+    import numpy as np
+    from csdr.generator import Generator
+except ImportError:
+    np = None
+
+
+def peak_offset(iq, samp_rate):
+    spectrum = np.abs(np.fft.fftshift(np.fft.fft(iq * np.hanning(len(iq)))))
+    freqs = np.fft.fftshift(np.fft.fftfreq(len(iq), 1 / samp_rate))
+    return freqs[np.argmax(spectrum)]
+
+
+@skipIf(np is None, "numpy is not available")
+class GeneratorTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testCarrierFrequencyAndLevel(self):
+        generator = Generator(48000, 1000000, [{"type": "carrier", "frequency": 1012000, "level": -20}], None)
+        block = generator.generate(4800)
+        self.assertAlmostEqual(peak_offset(block, 48000), 12000, delta=20)
+        self.assertAlmostEqual(np.abs(block).mean(), 0.1, places=3)
+
+    def testUsbAndLsbTones(self):
+        for (mod, expected) in [("usb", -9000), ("lsb", -11000)]:
+            signal = {"type": mod, "frequency": 990000, "level": -20, "tone": 1000}
+            generator = Generator(48000, 1000000, [signal], None)
+            self.assertAlmostEqual(peak_offset(generator.generate(4800), 48000), expected, delta=20)
+
+    def testPhaseIsContinuousAcrossBlocks(self):
+        signals = [{"type": "carrier", "frequency": 1003000}, {"type": "nfm", "frequency": 995000, "tone": 700}]
+        whole = Generator(48000, 1000000, signals, None).generate(3000)
+        generator = Generator(48000, 1000000, signals, None)
+        parts = np.concatenate([generator.generate(n) for n in [1000, 1, 999, 1000]])
+        np.testing.assert_allclose(parts, whole, atol=1e-4)
+
+    def testNoiseLevel(self):
+        generator = Generator(48000, 1000000, [], noise_level=-30, seed=1)
+        block = generator.generate(48000)
+        self.assertEqual(block.dtype, np.complex64)
+        self.assertEqual(len(block), 48000)
+        power = 10 * np.log10(np.mean(np.abs(block) ** 2))
+        self.assertAlmostEqual(power, -30, delta=0.2)
+
+    def testFileSignal(self):
+        file = os.path.join(self.tmpdir, "tone.wav")
+        t = np.arange(8000) / 8000
+        audio = (np.sin(2 * np.pi * 1500 * t) * 16384).astype("<i2")
+        with wave.open(file, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(8000)
+            f.writeframes(audio.tobytes())
+        signal = {"type": "file", "frequency": 1000000, "level": -20, "file": file, "mod": "usb"}
+        generator = Generator(48000, 1000000, [signal], None)
+        self.assertAlmostEqual(peak_offset(generator.generate(9600), 48000), 1500, delta=20)
+
+    def testCommandLine(self):
+        signals = json.dumps([{"type": "carrier", "frequency": 1006000, "level": -10}])
+        args = ["--samp-rate", "48000", "--center-freq", "1000000", "--signals", signals, "--noise-level", "-80"]
+        process = subprocess.Popen(
+            [sys.executable, "-m", "csdr.generator", "--no-throttle", "--block-time", "0.01"] + args,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        )
+        try:
+            data = process.stdout.read(4800 * 8)
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
+        block = np.frombuffer(data, dtype=np.complex64)
+        self.assertEqual(len(block), 4800)
+        self.assertAlmostEqual(peak_offset(block, 48000), 6000, delta=20)
+
+
+class JsonOptionTest(TestCase):
+    def testQuotesTheValueForTheShell(self):
+        mapped = JsonOption("--signals").map([{"type": "carrier", "frequency": 100, "name": "it's"}])
+        self.assertEqual(mapped, """--signals '[{"type": "carrier", "frequency": 100, "name": "it'"'"'s"}]'""")
+
+    def testSkipsMissingValues(self):
+        self.assertEqual(JsonOption("--signals").map(None), "")
@@ -0,0 +1,56 @@
+from unittest import TestCase
+from csdr.playback import Playback
+from io import BytesIO
+import tempfile
+import shutil
+import time
+import os
+
+
+class PlaybackTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmpdir, "recording.cu8")
+        # 100 samples of cu8 and half a sample that must not be played
+        self.data = bytes(i % 256 for i in range(201))
+        with open(self.file, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testPlaysCompleteSamples(self):
+        playback = Playback(self.file, "cu8", 1000, speed=0, block_time=0.03)
+        blocks = list(playback.blocks())
+        self.assertEqual(b"".join(blocks), self.data[:200])
+        self.assertEqual(len(blocks[0]), 60)
+
+    def testSeek(self):
+        playback = Playback(self.file, "cu8", 1000, seek=0.05, speed=0)
+        self.assertEqual(b"".join(playback.blocks()), self.data[100:200])
+
+    def testSeekBeyondEnd(self):
+        with self.assertRaises(ValueError):
+            Playback(self.file, "cu8", 1000, seek=1)
+        playback = Playback(self.file, "cu8", 1000, loop=True, seek=0.15, speed=0)
+        self.assertEqual(playback.offset, 100)
+
+    def testLoop(self):
+        playback = Playback(self.file, "cu8", 1000, loop=True, speed=0, block_time=0.03)
+        blocks = playback.blocks()
+        data = b"".join(next(blocks) for _ in range(8))
+        self.assertEqual(data[:200], self.data[:200])
+        self.assertEqual(data[200:400], self.data[:200])
+
+    def testUnsupportedFormat(self):
+        with self.assertRaises(ValueError):
+            Playback(self.file, "cs24", 1000)
+
+    def testPacing(self):
+        playback = Playback(self.file, "cu8", 1000, speed=2)
+        out = BytesIO()
+        start = time.monotonic()
+        playback.play(out)
+        # 100 samples at 1000 S/s take 100ms in real time, 50ms at double speed
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+        self.assertEqual(out.getvalue(), self.data[:200])
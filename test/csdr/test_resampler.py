@@ -0,0 +1,34 @@
+from unittest import TestCase
+from csdr.csdr import dsp, output
+
+
+class AudioOutput(output):
+    def supports_type(self, t):
+        return t == "audio"
+
+
+class ResamplerTest(TestCase):
+    def setUp(self):
+        self.dsp = dsp(AudioOutput())
+
+    def testReducesRatio(self):
+        self.assertEqual(self.dsp.get_resampler(48000, 12000), ["csdr rational_resampler_ff 1 4 0.0375"])
+
+    def testNoResamplingRequired(self):
+        self.assertEqual(self.dsp.get_resampler(12000, 12000), [])
+
+    def testFixedBufferSize(self):
+        self.assertEqual(
+            self.dsp.get_resampler(8000, 12000, bufsize=128),
+            ["CSDR_FIXED_BUFSIZE=128 csdr rational_resampler_ff 3 2 0.049999999999999996"],
+        )
+
+    def testRejectsComplexRatios(self):
+        self.assertIsNone(self.dsp.get_resampler(12347, 12000))
+
+    def testReplacesSox(self):
+        self.dsp.set_samp_rate(2048000)
+        self.dsp.set_output_rate(12000)
+        for demodulator in ["nfm", "ssb", "dmr"]:
+            chain = self.dsp.demodulator_chain(demodulator)
+            self.assertFalse([c for c in chain if c.startswith("sox")])
@@ -0,0 +1,194 @@
+from unittest import TestCase
+from csdr.ringbuffer import RingBufferWriter, RingBufferReader, RingBuffer, Overrun, Doorbell, DoorbellListener
+from csdr.ringbuffer import readStream
+from unittest.mock import patch
+import subprocess
+import threading
+import tempfile
+import socket
+import select
+import time
+import os
+
+
+class RingBufferTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "ring")
+        self.writer = RingBufferWriter(self.path, 64)
+
+    def tearDown(self):
+        self.writer.close()
+        self.dir.cleanup()
+
+    def testReaderStartsAtCurrentPosition(self):
+        self.writer.write(b"a" * 16)
+        reader = RingBufferReader(self.path)
+        self.assertEqual(reader.read(), b"")
+        self.writer.write(b"b" * 8)
+        self.assertEqual(reader.read(), b"b" * 8)
+
+    def testWrapAround(self):
+        reader = RingBufferReader(self.path)
+        self.writer.write(bytes(range(48)))
+        self.assertEqual(reader.read(), bytes(range(48)))
+        self.writer.write(bytes(range(100, 140)))
+        self.assertEqual(reader.read(), bytes(range(100, 140)))
+
+    def testMaxBytes(self):
+        reader = RingBufferReader(self.path)
+        self.writer.write(bytes(range(32)))
+        self.assertEqual(reader.read(8), bytes(range(8)))
+        self.assertEqual(reader.read(), bytes(range(8, 32)))
+
+    def testMultipleReaders(self):
+        first = RingBufferReader(self.path)
+        second = RingBufferReader(self.path)
+        self.writer.write(b"x" * 24)
+        self.assertEqual(first.read(), b"x" * 24)
+        self.assertEqual(second.read(), b"x" * 24)
+
+    def testOverrun(self):
+        reader = RingBufferReader(self.path)
+        self.writer.write(bytes(range(80)))
+        with self.assertRaises(Overrun):
+            reader.read()
+        self.assertEqual(reader.overruns, 1)
+        # resumes at a sample boundary with the most recent half of the buffer
+        self.assertEqual(reader.read(), bytes(range(48, 80)))
+
+    def testPositionIsNotReadDuringUpdate(self):
+        reader = RingBufferReader(self.path)
+        self.writer.write(b"a" * 8)
+        # an update in progress, as seen by a reader on another cpu
+        RingBuffer.SEQUENCE.pack_into(self.writer.mm, RingBuffer.SEQUENCE_OFFSET, self.writer.sequence + 1)
+        RingBuffer.POSITION.pack_into(self.writer.mm, RingBuffer.POSITION_OFFSET, 2 ** 32 + 8, 0)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(reader.getWritePosition()), daemon=True)
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(result, [])
+        self.writer.write(b"b" * 8)
+        thread.join(5)
+        self.assertEqual(result, [16])
+
+    def testReadStream(self):
+        received = []
+        stream = readStream(self.path)
+        thread = threading.Thread(target=lambda: received.append(next(stream)), daemon=True)
+        thread.start()
+        # give the stream time to pick up the current position
+        time.sleep(0.1)
+        self.writer.write(bytes(range(16)))
+        thread.join(5)
+        self.assertEqual(received, [bytes(range(16))])
+        stream.close()
+        self.assertEqual(os.listdir(Doorbell.getDirectory(self.path)), [])
+
+    def testRejectsForeignFile(self):
+        path = os.path.join(self.dir.name, "other")
+        with open(path, "wb") as f:
+            f.write(b"\x00" * 128)
+        with self.assertRaises(Exception):
+            RingBufferReader(path)
+
+    def testAvailableRange(self):
+        self.writer.write(bytes(40))
+        reader = RingBufferReader(self.path)
+        self.assertEqual(reader.getAvailableRange(), (0, 40))
+        self.writer.write(bytes(40))
+        self.assertEqual(reader.getAvailableRange(), (16, 80))
+
+    def testPositionAt(self):
+        self.writer.write(bytes(64))
+        reader = RingBufferReader(self.path)
+        now = reader.getLastWriteTime()
+        self.assertEqual(reader.getPositionAt(now, 8), 64)
+        # 8 bytes per second, rounded to a sample boundary
+        self.assertEqual(reader.getPositionAt(now - 3, 8), 40)
+        self.assertEqual(reader.getPositionAt(now - 2.5, 8), 40)
+
+    def testExtract(self):
+        self.writer.write(bytes(range(100)))
+        process = subprocess.run(
+            RingBuffer.getExtractCommand(self.path, 40, 32), shell=True, stdout=subprocess.PIPE, check=True
+        )
+        self.assertEqual(process.stdout, bytes(range(40, 72)))
+        # the start is no longer available, and the end hasn't been written yet
+        process = subprocess.run(
+            RingBuffer.getExtractCommand(self.path, 24, 100), shell=True, stdout=subprocess.PIPE, check=True
+        )
+        self.assertEqual(process.stdout, bytes(range(36, 100)))
+
+
+class DoorbellTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "ring")
+        self.writer = RingBufferWriter(self.path, 64)
+        self.addCleanup(self.writer.close)
+
+    def testWriteWakesUpListener(self):
+        listener = DoorbellListener(self.path)
+        self.addCleanup(listener.close)
+        # the first write picks up the listener
+        self.writer.write(b"a" * 8)
+        listener.wait(5)
+        self.assertTrue(listener.rung)
+        timer = threading.Timer(0.1, self.writer.write, args=(b"a" * 8,))
+        timer.start()
+        start = time.monotonic()
+        listener.wait(5)
+        self.assertLess(time.monotonic() - start, 1)
+        timer.join()
+
+    def testNewListenerPolls(self):
+        self.writer.write(b"a" * 8)
+        # the writer doesn't know about this one until its next scan
+        listener = DoorbellListener(self.path)
+        self.addCleanup(listener.close)
+        start = time.monotonic()
+        listener.wait(5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(listener.rung)
+
+    def testNotificationsAreNotLost(self):
+        listener = DoorbellListener(self.path)
+        self.addCleanup(listener.close)
+        # written before the listener goes to sleep
+        self.writer.write(b"a" * 8)
+        start = time.monotonic()
+        listener.wait(5)
+        self.assertLess(time.monotonic() - start, 1)
+        # and once picked up, the next wait blocks again
+        start = time.monotonic()
+        listener.wait(0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def testReadersAreNotScannedOnEveryWrite(self):
+        with patch("csdr.ringbuffer.os.listdir", wraps=os.listdir) as listdir:
+            for i in range(100):
+                self.writer.write(b"a" * 8)
+        self.assertLessEqual(listdir.call_count, 1)
+
+    def testStaleReadersAreRemoved(self):
+        stale = os.path.join(Doorbell.getDirectory(self.path), "stale")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(stale)
+        sock.close()
+        self.writer.write(b"a" * 8)
+        self.assertFalse(os.path.exists(stale))
+
+    def testReaderCommand(self):
+        process = subprocess.Popen(RingBuffer.getReaderCommand(self.path), shell=True, stdout=subprocess.PIPE)
+        self.addCleanup(process.stdout.close)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        deadline = time.monotonic() + 5
+        while not os.listdir(Doorbell.getDirectory(self.path)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.writer.write(bytes(range(16)))
+        (readable, _, _) = select.select([process.stdout], [], [], 5)
+        self.assertTrue(readable)
+        self.assertEqual(os.read(process.stdout.fileno(), 16), bytes(range(16)))
@@ -0,0 +1,258 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from owrx.property import PropertyLayer
+from owrx.dsp import DspManager, DspChainRegistry
+from owrx.source import SdrSource
+from owrx.admission import AdmissionController
+import time
+
+
+class DspChainRegistryTest(TestCase):
+    def setUp(self):
+        DspChainRegistry.sharedInstance = None
+        # the cpu of the test machine should not matter
+        self.admission = patch.object(AdmissionController, "isEnabled", return_value=False)
+        self.admission.start()
+        self.props = PropertyLayer()
+        for key, value in {
+            "audio_compression": "adpcm",
+            "fft_compression": "adpcm",
+            "digimodes_fft_size": 1024,
+            "csdr_dynamic_bufsize": False,
+            "csdr_print_bufsizes": False,
+            "csdr_through": False,
+            "digimodes_enable": True,
+            "samp_rate": 2400000,
+            "digital_voice_unvoiced_quality": 1,
+            "temporary_directory": "/tmp",
+            "center_freq": 145000000,
+        }.items():
+            self.props[key] = value
+        self.source = Mock()
+        self.source.getProps.return_value = self.props
+        # keeps the dsp chains from being started
+        self.source.isAvailable.return_value = False
+        self.source.getChannelizer.return_value = None
+
+    def tearDown(self):
+        self.admission.stop()
+        DspChainRegistry.sharedInstance = None
+
+    def createManager(self, **settings):
+        manager = DspManager(Mock(), self.source)
+        params = {
+            "offset_freq": 500000,
+            "mod": "nfm",
+            "low_cut": -4000,
+            "high_cut": 4000,
+            "squelch_level": -150,
+            "output_rate": 12000,
+        }
+        params.update(settings)
+        # like the connection does, the settings are known before the manager is started
+        for key, value in params.items():
+            manager.setProperty(key, value)
+        manager.start()
+        return manager
+
+    def getRegistry(self):
+        return DspChainRegistry.getSharedInstance()
+
+    def testSharesIdenticalSettings(self):
+        first = self.createManager()
+        second = self.createManager()
+        self.assertIs(first.chain, second.chain)
+        self.assertEqual(self.getRegistry().getChainCount(), 1)
+        self.assertEqual(self.getRegistry().getListenerCount(), 2)
+
+    def testDifferentSettings(self):
+        first = self.createManager()
+        second = self.createManager(offset_freq=600000)
+        self.assertIsNot(first.chain, second.chain)
+        self.assertEqual(self.getRegistry().getChainCount(), 2)
+
+    def testSplitsOffOnRetune(self):
+        first = self.createManager()
+        second = self.createManager()
+        chain = first.chain
+        second.setProperty("offset_freq", 600000)
+        self.assertIs(first.chain, chain)
+        self.assertIsNot(second.chain, chain)
+        self.assertEqual(chain.dsp.offset_freq, 500000)
+        self.assertEqual(second.chain.dsp.offset_freq, 600000)
+
+    def testRetunesPrivateChainInPlace(self):
+        manager = self.createManager()
+        chain = manager.chain
+        manager.setProperty("offset_freq", 600000)
+        self.assertIs(manager.chain, chain)
+        self.assertEqual(chain.dsp.offset_freq, 600000)
+        self.assertEqual(self.getRegistry().getChainCount(), 1)
+
+    def testJoinsExistingChain(self):
+        first = self.createManager()
+        second = self.createManager(offset_freq=600000)
+        second.setProperty("offset_freq", 500000)
+        self.assertIs(first.chain, second.chain)
+        self.assertEqual(self.getRegistry().getChainCount(), 1)
+
+    def testSecondaryModIsNotShared(self):
+        first = self.createManager(secondary_mod="bpsk31")
+        second = self.createManager(secondary_mod="bpsk31")
+        self.assertIsNot(first.chain, second.chain)
+
+    def testRejectedModeChange(self):
+        manager = self.createManager()
+        chain = manager.chain
+        with patch.object(AdmissionController, "admitChain", return_value=AdmissionController.REJECT):
+            manager.setProperty("mod", "dmr")
+        self.assertIs(manager.chain, chain)
+        self.assertEqual(chain.dsp.get_demodulator(), "nfm")
+        manager.handler.write_log_message.assert_called_once()
+
+    def testDegradedChainHasNoSecondaryFft(self):
+        manager = self.createManager()
+        with patch.object(AdmissionController, "admitChain", return_value=AdmissionController.DEGRADE):
+            manager.setProperty("secondary_mod", "bpsk31")
+        self.assertFalse(manager.chain.supports_type("secondary_fft"))
+        self.assertTrue(manager.chain.supports_type("audio"))
+
+    def testFansOutput(self):
+        first = self.createManager()
+        second = self.createManager()
+        for listener in first.chain.listeners:
+            listener.write("audio", b"data")
+        first.handler.write_dsp_data.assert_called_once_with(b"data")
+        second.handler.write_dsp_data.assert_called_once_with(b"data")
+
+    def testRemovesChainWithLastListener(self):
+        first = self.createManager()
+        second = self.createManager()
+        chain = first.chain
+        first.stop()
+        self.assertEqual(self.getRegistry().getChainCount(), 1)
+        second.stop()
+        self.assertEqual(self.getRegistry().getChainCount(), 0)
+        self.source.removeClient.assert_called_with(chain)
+
+
+class DspChainPoolTest(DspChainRegistryTest):
+    def setUp(self):
+        super().setUp()
+        self.props["dsp_pool_size"] = 1
+
+    def waitForPool(self, pool):
+        deadline = time.monotonic() + 5
+        while pool.getMetrics()["size"] < pool.getSize() or pool.refilling:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def testClaimsPooledChain(self):
+        pool = self.getRegistry().getPool(self.source)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+        self.assertEqual(pooled.getClientClass(), SdrSource.CLIENT_INACTIVE)
+
+        manager = self.createManager()
+        self.assertIs(manager.chain, pooled)
+        self.assertEqual(pooled.getClientClass(), SdrSource.CLIENT_USER)
+        self.assertEqual(pooled.dsp.offset_freq, 500000)
+        self.source.checkClients.assert_called()
+
+        self.waitForPool(pool)
+        metrics = pool.getMetrics()
+        self.assertEqual(metrics["size"], 1)
+        self.assertEqual(metrics["hits"], 1)
+        self.assertIsNot(pool.chains[0], pooled)
+
+    def testMiss(self):
+        pool = self.getRegistry().getPool(self.source)
+        self.props["dsp_pool_size"] = 0
+        self.createManager()
+        self.assertEqual(pool.getMetrics()["misses"], 1)
+        self.assertEqual(pool.getMetrics()["hit_rate"], 0)
+
+    def testClaimAtClientOutputRateDoesNotRestart(self):
+        pool = self.getRegistry().getPool(self.source)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+        self.assertEqual(pooled.dsp.get_output_rate(), 12000)
+        # pretend the pooled chain is up, without starting any processes
+        pooled.dsp.running = True
+        pooled.dsp.control = Mock()
+        pooled.dsp.stop = Mock()
+        pooled.dsp.start = Mock()
+
+        manager = self.createManager(output_rate=12000)
+        self.assertIs(manager.chain, pooled)
+        pooled.dsp.stop.assert_not_called()
+        self.assertEqual(pooled.dsp.restarts, 0)
+        metrics = pool.getMetrics()
+        self.assertEqual(metrics["hits"], 1)
+        self.assertEqual(metrics["misses"], 0)
+
+    def testRestartIsNotCountedAsHit(self):
+        pool = self.getRegistry().getPool(self.source)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+        pooled.dsp.running = True
+        pooled.dsp.control = Mock()
+        pooled.dsp.stop = Mock()
+        pooled.dsp.start = Mock()
+
+        # digital voice needs a different front chain
+        manager = self.createManager(mod="dmr")
+        self.assertIs(manager.chain, pooled)
+        self.assertGreater(pooled.dsp.restarts, 0)
+        metrics = pool.getMetrics()
+        self.assertEqual(metrics["hits"], 0)
+        self.assertEqual(metrics["misses"], 1)
+
+    def testFollowsRequestedOutputRate(self):
+        pool = self.getRegistry().getPool(self.source)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+
+        manager = self.createManager(output_rate=48000)
+        self.assertIsNot(manager.chain, pooled)
+        self.source.removeClient.assert_any_call(pooled)
+        self.waitForPool(pool)
+        self.assertEqual(pool.chains[0].dsp.get_output_rate(), 48000)
+        self.assertEqual(pool.getMetrics()["misses"], 1)
+
+    def testSettingsAreAppliedBeforeActivation(self):
+        pool = self.getRegistry().getPool(self.source)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+        activate = pooled.activate
+        seen = []
+
+        def recordActivation():
+            seen.append((pooled.dsp.offset_freq, pooled.dsp.get_demodulator()))
+            activate()
+
+        pooled.activate = recordActivation
+        manager = self.createManager(mod="am")
+        self.assertIs(manager.chain, pooled)
+        self.assertEqual(seen, [(500000, "am")])
+
+    def testDrainsWhenSourceStops(self):
+        pool = self.getRegistry().getPool(self.source)
+        self.source.addClient.assert_any_call(pool)
+        pool.refill()
+        self.waitForPool(pool)
+        pooled = pool.chains[0]
+        pool.onStateChange(SdrSource.STATE_STOPPING)
+        deadline = time.monotonic() + 5
+        while pool.getMetrics()["size"] > 0:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.source.removeClient.assert_any_call(pooled)
+        # nothing left to claim
+        self.props["dsp_pool_size"] = 0
+        self.assertIsNot(self.createManager().chain, pooled)
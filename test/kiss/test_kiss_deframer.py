@@ -0,0 +1,31 @@
+from unittest import TestCase
+from owrx.kiss import KissDeframer, FEND, FESC, TFEND, TFESC
+
+
+class KissDeframerTest(TestCase):
+    def testSingleFrame(self):
+        deframer = KissDeframer()
+        self.assertEqual(deframer.parse(bytes([FEND, 0x00, 1, 2, 3, FEND])), [b"\x01\x02\x03"])
+
+    def testFrameSplitAcrossCalls(self):
+        deframer = KissDeframer()
+        self.assertEqual(deframer.parse(bytes([FEND, 0x00, 1])), [])
+        self.assertEqual(deframer.parse(bytes([2, FEND, FEND, 0x00])), [b"\x01\x02"])
+        self.assertEqual(deframer.parse(bytes([3, FEND])), [b"\x03"])
+
+    def testByteByByte(self):
+        deframer = KissDeframer()
+        frames = []
+        for b in bytes([FEND, 0x00, 1, FESC, TFEND, 2, FEND]):
+            frames += deframer.parse(bytes([b]))
+        self.assertEqual(frames, [bytes([1, FEND, 2])])
+
+    def testUnescape(self):
+        deframer = KissDeframer()
+        data = bytes([FEND, 0x00, FESC, TFEND, 5, FESC, TFESC, FEND])
+        self.assertEqual(deframer.parse(data), [bytes([FEND, 5, FESC])])
+
+    def testIgnoresNonDataFrames(self):
+        deframer = KissDeframer()
+        data = bytes([FEND, 0x01, 1, 2, FEND, FEND, FEND, 0x00, 3, FEND])
+        self.assertEqual(deframer.parse(data), [b"\x03"])
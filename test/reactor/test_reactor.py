@@ -0,0 +1,146 @@
+from unittest import TestCase
+from owrx.reactor import Reactor, Registration, FixedSizeReader, LineReader, ChunkReader, BatchingReader
+import threading
+import time
+import os
+
+
+class ReaderTest(TestCase):
+    def setUp(self):
+        (self.r, self.w) = os.pipe()
+        self.file = os.fdopen(self.r, "rb")
+
+    def tearDown(self):
+        self.file.close()
+        try:
+            os.close(self.w)
+        except OSError:
+            pass
+
+    def fill(self, reader, data):
+        os.write(self.w, data)
+        self.assertTrue(reader.fill())
+        return reader.frames()
+
+    def testFixedSizeFraming(self):
+        reader = FixedSizeReader(self.file, 4)
+        self.assertEqual(self.fill(reader, b"abcdef"), [b"abcd"])
+        self.assertEqual(self.fill(reader, b"ghijklmn"), [b"efgh", b"ijkl"])
+        self.assertEqual(self.fill(reader, b"op"), [b"mnop"])
+
+    def testFixedSizeSkip(self):
+        reader = FixedSizeReader(self.file, 2, skip=3)
+        self.assertEqual(self.fill(reader, b"ab"), [])
+        self.assertEqual(self.fill(reader, b"cdef"), [b"de"])
+
+    def testLineFraming(self):
+        reader = LineReader(self.file, parse=float)
+        self.assertEqual(self.fill(reader, b"1.5\n2"), [1.5])
+        self.assertEqual(self.fill(reader, b".5\n3\n"), [2.5, 3.0])
+
+    def testLineDecoding(self):
+        reader = LineReader(self.file, encoding="cp437")
+        self.assertEqual(self.fill(reader, b"\x81\n"), ["ü\n"])
+
+    def testChunks(self):
+        reader = ChunkReader(self.file)
+        self.assertEqual(self.fill(reader, b"xyz"), [b"xyz"])
+        self.assertEqual(reader.frames(), [])
+
+    def testBatchBySize(self):
+        reader = BatchingReader(self.file, maxSize=4)
+        self.assertEqual(self.fill(reader, b"abc"), [])
+        self.assertEqual(self.fill(reader, b"defg"), [b"abcdefg"])
+        self.assertEqual(self.fill(reader, b"h"), [])
+        self.assertEqual(reader.flush(), [b"h"])
+        self.assertEqual(reader.flush(), [])
+
+    def testEndOfFile(self):
+        reader = ChunkReader(self.file)
+        os.close(self.w)
+        self.assertFalse(reader.fill())
+
+
+class ReactorTest(TestCase):
+    def testDispatchInOrderAndClose(self):
+        (r, w) = os.pipe()
+        file = os.fdopen(r, "rb")
+        received = []
+        done = threading.Event()
+
+        def handler(frame):
+            received.append(frame)
+
+        reader = FixedSizeReader(file, 2)
+        reader.close = lambda: (file.close(), done.set())
+        Reactor.getSharedInstance().register(reader, handler)
+        for i in range(100):
+            os.write(w, bytes([i, i]))
+        os.close(w)
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received, [bytes([i, i]) for i in range(100)])
+
+    def testBatchFlushedAfterDelay(self):
+        (r, w) = os.pipe()
+        file = os.fdopen(r, "rb")
+        received = []
+        event = threading.Event()
+
+        def handler(frame):
+            received.append((frame, time.monotonic()))
+            event.set()
+
+        Reactor.getSharedInstance().register(BatchingReader(file, maxSize=64, maxDelay=0.05), handler)
+        start = time.monotonic()
+        os.write(w, b"a")
+        os.write(w, b"b")
+        self.assertTrue(event.wait(5))
+        os.close(w)
+
+        self.assertEqual(received[0][0], b"ab")
+        self.assertGreaterEqual(received[0][1] - start, 0.04)
+
+    def testSlowHandlerDropsOldestFrames(self):
+        (r, w) = os.pipe()
+        file = os.fdopen(r, "rb")
+        received = []
+        unblock = threading.Event()
+        done = threading.Event()
+
+        def handler(frame):
+            unblock.wait(5)
+            received.append(frame)
+
+        reader = FixedSizeReader(file, 2)
+        reader.close = lambda: (file.close(), done.set())
+        Reactor.getSharedInstance().register(reader, handler)
+        count = Registration.maxPending * 3
+        for i in range(count):
+            os.write(w, i.to_bytes(2, "big"))
+        os.close(w)
+        # give the reactor time to read everything while the handler is stuck
+        time.sleep(0.5)
+        unblock.set()
+
+        self.assertTrue(done.wait(5))
+        self.assertLessEqual(len(received), Registration.maxPending + 1)
+        self.assertEqual(received[-1], (count - 1).to_bytes(2, "big"))
+        self.assertEqual(received, sorted(received))
+
+    def testBlockingTasksDontHoldUpFrames(self):
+        reactor = Reactor.getSharedInstance()
+        unblock = threading.Event()
+        self.addCleanup(unblock.set)
+        for i in range(Reactor.workerCount + Reactor.blockingWorkerCount):
+            reactor.submit(lambda: unblock.wait(5))
+
+        (r, w) = os.pipe()
+        file = os.fdopen(r, "rb")
+        received = threading.Event()
+        reader = ChunkReader(file)
+        reactor.register(reader, lambda frame: received.set())
+        os.write(w, b"x")
+        self.assertTrue(received.wait(2))
+        self.assertFalse(unblock.is_set())
+        os.close(w)
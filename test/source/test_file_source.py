@@ -0,0 +1,68 @@
+from unittest import TestCase
+from owrx.source.file import FileSource
+from owrx.sigmf import SigMF, SigMFException
+from owrx.property import PropertyLayer
+import tempfile
+import shutil
+import json
+import os
+
+
+class FileSourceTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmpdir, "recording")
+        with open(self.base + ".sigmf-data", "wb") as f:
+            f.write(bytes(1024))
+        self.writeMeta({"core:datatype": "ci16_le", "core:sample_rate": 250000}, [{"core:frequency": 145000000}])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def writeMeta(self, info, captures):
+        with open(self.base + ".sigmf-meta", "w") as f:
+            json.dump({"global": info, "captures": captures}, f)
+
+    def createSource(self, **props):
+        layer = PropertyLayer()
+        layer["name"] = "Recording"
+        layer["type"] = "file"
+        for (key, value) in props.items():
+            layer[key] = value
+        layer["profiles"] = {"default": {"name": "Default", "start_freq": 145000000, "start_mod": "nfm"}}
+        return FileSource("recording", layer)
+
+    def testSigMFPaths(self):
+        for path in [self.base, self.base + ".sigmf-meta", self.base + ".sigmf-data"]:
+            self.assertEqual(SigMF.getPaths(path), (self.base + ".sigmf-meta", self.base + ".sigmf-data"))
+            self.assertTrue(SigMF.isRecording(path))
+
+    def testReadSigMF(self):
+        meta = SigMF.read(self.base)
+        self.assertEqual(meta.format, "cs16")
+        self.assertEqual(meta.samp_rate, 250000)
+        self.assertEqual(meta.center_freq, 145000000)
+
+    def testUnsupportedDatatype(self):
+        self.writeMeta({"core:datatype": "ci16_be", "core:sample_rate": 250000}, [])
+        with self.assertRaises(SigMFException):
+            SigMF.read(self.base)
+
+    def testPropertiesFromMetadata(self):
+        source = self.createSource(file=self.base + ".sigmf-meta", loop=True)
+        props = source.getProps()
+        self.assertEqual(props["samp_rate"], 250000)
+        self.assertEqual(props["center_freq"], 145000000)
+        command = source.getCommand()
+        self.assertIn("--file {0}.sigmf-data".format(self.base), command[0])
+        self.assertIn("--format cs16", command[0])
+        self.assertIn("--loop", command[0])
+        self.assertEqual(command[1], "csdr convert_s16_f")
+
+    def testRawFile(self):
+        os.remove(self.base + ".sigmf-meta")
+        source = self.createSource(file=self.base + ".sigmf-data", samp_rate=48000, center_freq=7000000)
+        command = source.getCommand()
+        self.assertIn("--format cf32", command[0])
+        self.assertIn("--samp-rate 48000", command[0])
+        self.assertTrue(command[1].startswith("nmux"))
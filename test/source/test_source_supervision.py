@@ -0,0 +1,59 @@
+from unittest import TestCase
+from owrx.source import SdrSource
+from owrx.property import PropertyLayer
+import signal
+import time
+import sys
+import os
+
+
+class ListenerSource(SdrSource):
+    """
+    stands in for an sdr by just accepting connections on the source port
+    """
+
+    def onPropertyChange(self, name, value):
+        pass
+
+    def getCommand(self):
+        script = "import socket, sys, time; s = socket.socket(); s.bind(('127.0.0.1', int(sys.argv[1]))); s.listen(); "
+        script += "time.sleep(60)"
+        return ['{0} -c "{1}" {2}'.format(sys.executable, script, self.getPort())]
+
+
+class SourceSupervisionTest(TestCase):
+    def setUp(self):
+        layer = PropertyLayer()
+        layer["name"] = "Listener"
+        layer["type"] = "listener"
+        layer["iq_transport"] = "tcp"
+        layer["profiles"] = {"default": {"name": "Default", "center_freq": 145000000, "samp_rate": 250000}}
+        self.source = ListenerSource("listener", layer)
+        self.addCleanup(self.source.stop)
+
+    def waitFor(self, condition):
+        deadline = time.monotonic() + 10
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def testRestartsAfterCrash(self):
+        self.source.start()
+        self.assertEqual(self.source.getState(), SdrSource.STATE_RUNNING)
+        crashed = self.source.process
+        os.kill(crashed.pid, signal.SIGKILL)
+        self.assertTrue(
+            self.waitFor(
+                lambda: self.source.process is not crashed and self.source.getState() == SdrSource.STATE_RUNNING
+            )
+        )
+        self.assertTrue(self.source.isAvailable())
+        self.assertEqual(self.source.supervision.restarts, 1)
+
+    def testNoRestartAfterStop(self):
+        self.source.start()
+        self.source.stop()
+        time.sleep(0.2)
+        self.assertFalse(self.source.isAvailable())
+        self.assertEqual(self.source.getState(), SdrSource.STATE_STOPPED)
+        self.assertEqual(self.source.supervision.restarts, 0)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from owrx.fft import SpectrumThread
+from owrx.property import PropertyLayer
+from owrx.source import SdrSource
+from csdr import csdr
+import time
+
+
+class SpectrumThreadTest(TestCase):
+    def setUp(self):
+        self.props = PropertyLayer()
+        for key, value in {"samp_rate": 2400000, "fft_size": 4096, "fft_fps": 9}.items():
+            self.props[key] = value
+        self.source = Mock()
+        self.source.props = self.props
+        self.source.getId.return_value = "test"
+        self.source.getRingBufferPath.return_value = None
+        self.source.isAvailable.return_value = True
+        # no processes are started, the pipelines only keep track of their state
+        self.started = []
+        patches = [
+            patch.object(csdr.dsp, "start", autospec=True, side_effect=self.startDsp),
+            patch.object(csdr.dsp, "stop", autospec=True, side_effect=self.stopDsp),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.spectrum = SpectrumThread(self.source)
+        self.addCleanup(self.spectrum.stop)
+
+    def startDsp(self, dsp):
+        dsp.running = True
+        self.started.append(dsp)
+
+    def stopDsp(self, dsp):
+        dsp.running = False
+
+    def getRunning(self):
+        return [dsp for dsp in self.started if dsp.running]
+
+    def testRestartUsesCurrentSettings(self):
+        self.spectrum.start()
+        self.spectrum.onStateChange(SdrSource.STATE_STOPPING)
+        self.props["fft_size"] = 8192
+        self.spectrum.onStateChange(SdrSource.STATE_RUNNING)
+        running = self.getRunning()
+        self.assertEqual(len(running), 1)
+        self.assertEqual(running[0].fft_size, 8192)
+        # the pending reconfiguration doesn't start a second pipeline
+        time.sleep(SpectrumThread.reconfigureDelay * 3)
+        self.assertEqual(self.getRunning(), running)
+
+    def testChangesAreCoalesced(self):
+        self.spectrum.start()
+        self.props["fft_size"] = 8192
+        self.props["fft_fps"] = 20
+        deadline = time.monotonic() + 5
+        while len(self.started) < 2:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        time.sleep(SpectrumThread.reconfigureDelay * 2)
+        self.assertEqual(len(self.started), 2)
+        pending = self.started[1]
+        self.assertEqual((pending.fft_size, pending.fft_fps), (8192, 20))
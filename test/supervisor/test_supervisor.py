@@ -0,0 +1,98 @@
+from unittest import TestCase
+from unittest.mock import patch
+from owrx.supervisor import Supervisor, Supervision
+import subprocess
+import threading
+import signal
+
+
+class SupervisorTest(TestCase):
+    def setUp(self):
+        self.supervisor = Supervisor()
+
+    def startProcess(self, *cmd):
+        return subprocess.Popen(list(cmd), start_new_session=True)
+
+    def testExitCallback(self):
+        process = self.startProcess("sh", "-c", "exit 3")
+        codes = []
+        event = threading.Event()
+
+        def onExit(rc):
+            codes.append(rc)
+            event.set()
+
+        self.supervisor.watch(process).onExit(onExit)
+        self.assertTrue(event.wait(5))
+        self.assertEqual(codes, [3])
+        # reaped by the supervisor
+        self.assertEqual(process.returncode, 3)
+
+    def testCallbackAfterExit(self):
+        process = self.startProcess("true")
+        watch = self.supervisor.watch(process)
+        self.assertTrue(watch.wait(5))
+        codes = []
+        watch.onExit(codes.append)
+        self.assertEqual(codes, [0])
+        self.assertEqual(self.supervisor.getProcessCount(), 0)
+
+    def testKill(self):
+        process = self.startProcess("sleep", "30")
+        watch = self.supervisor.watch(process)
+        self.assertTrue(watch.isRunning())
+        self.assertEqual(self.supervisor.getProcessCount(), 1)
+        process.send_signal(signal.SIGTERM)
+        self.assertTrue(watch.wait(5))
+        self.assertFalse(watch.isRunning())
+        self.assertEqual(process.returncode, -signal.SIGTERM)
+
+    def testPollingFallback(self):
+        self.supervisor.usePidfd = False
+        with patch.object(Supervisor, "pollInterval", 0.01):
+            process = self.startProcess("sh", "-c", "exit 1")
+            watch = self.supervisor.watch(process)
+            self.assertTrue(watch.wait(5))
+        self.assertEqual(process.returncode, 1)
+
+    def testChainStats(self):
+        supervision = self.supervisor.supervise("dsp")
+        supervision.onStart()
+        supervision.onCrash()
+        stats = self.supervisor.getChainStats()
+        self.assertIn(supervision.name, stats)
+        self.assertEqual(stats[supervision.name]["restarts"], 1)
+        del supervision
+        self.assertEqual(self.supervisor.getChainStats(), {})
+
+
+class SupervisionTest(TestCase):
+    def testBackoff(self):
+        supervision = Supervision("test")
+        supervision.onStart()
+        delays = [supervision.onCrash() for _ in range(4)]
+        self.assertEqual(delays, [0, 0.5, 1, 2])
+        self.assertEqual(supervision.restarts, 4)
+
+    def testBackoffLimit(self):
+        supervision = Supervision("test")
+        supervision.onStart()
+        for _ in range(20):
+            delay = supervision.onCrash()
+        self.assertEqual(delay, Supervision.maxBackoff)
+
+    def testRecovery(self):
+        supervision = Supervision("test")
+        supervision.onStart()
+        supervision.onCrash()
+        supervision.onCrash()
+        supervision.startTime -= Supervision.stableAfter + 1
+        self.assertEqual(supervision.onCrash(), 0)
+
+    def testUptime(self):
+        supervision = Supervision("test")
+        self.assertEqual(supervision.getUptime(), 0)
+        supervision.onStart()
+        self.assertGreaterEqual(supervision.getUptime(), 0)
+        supervision.onStop()
+        self.assertEqual(supervision.getUptime(), 0)
@@ -0,0 +1,106 @@
+from unittest import TestCase
+from unittest.mock import patch, Mock
+from owrx.timeshift import TimeShift, TimeShiftException, Snapshot
+from owrx.property import PropertyLayer
+from owrx.sigmf import SigMF
+from csdr.ringbuffer import RingBufferWriter
+import tempfile
+import os
+
+
+class FakeSource(object):
+    def __init__(self, directory):
+        self.props = PropertyLayer()
+        self.props["samp_rate"] = 1000
+        self.props["center_freq"] = 100000
+        self.props["time_shift"] = 1
+        self.props["temporary_directory"] = directory
+
+    def getProps(self):
+        return self.props
+
+    def getId(self):
+        return "test"
+
+    def getOwner(self):
+        return "source.test"
+
+    def getIqReaderCommand(self):
+        return "cat"
+
+
+class TimeShiftTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.source = FakeSource(self.dir.name)
+        self.timeShift = TimeShift(self.source)
+        # 10 seconds of data
+        self.writer = RingBufferWriter(self.timeShift.getPath(), self.timeShift.getSize())
+        self.writer.write(bytes(80000))
+        self.timeShift.process = Mock()
+
+    def tearDown(self):
+        self.writer.close()
+        self.dir.cleanup()
+
+    def testSize(self):
+        self.assertEqual(self.timeShift.getSize(), 60 * 1000 * 8)
+
+    def testDisabled(self):
+        self.source.getProps()["time_shift"] = None
+        self.assertFalse(self.timeShift.isEnabled())
+
+    def testTimeRange(self):
+        (start, end) = self.timeShift.getTimeRange()
+        self.assertEqual(end, self.writer.getLastWriteTime())
+        self.assertAlmostEqual(end - start, 10)
+
+    @patch("owrx.timeshift.Supervisor")
+    @patch("owrx.timeshift.subprocess.Popen")
+    def testSnapshot(self, popen, supervisor):
+        end = self.writer.getLastWriteTime()
+        snapshot = self.timeShift.snapshot(end - 4, end - 2, 100100, 100)
+        # the available part of the range
+        self.assertAlmostEqual(snapshot.start, end - 4)
+        self.assertAlmostEqual(snapshot.end, end - 2)
+        self.assertEqual(snapshot.state, Snapshot.STATE_RUNNING)
+        command = popen.call_args[0][0]
+        self.assertIn("-m csdr.ringbuffer extract {0} 48000 16000 |".format(self.timeShift.getPath()), command)
+        self.assertIn("csdr shift_addition_cc -0.1 |", command)
+        self.assertIn("csdr fir_decimate_cc", command)
+        self.assertTrue(command.endswith(" > {0}.sigmf-data".format(snapshot.path)))
+        self.assertEqual(snapshot.samp_rate, 100)
+        self.assertEqual(self.timeShift.getValue()["snapshots"], [snapshot.getValue()])
+
+        snapshot.onExit(0)
+        self.assertEqual(snapshot.state, Snapshot.STATE_COMPLETE)
+        meta = SigMF.read(snapshot.path)
+        self.assertEqual(meta.format, "cf32")
+        self.assertEqual(meta.samp_rate, 100)
+        self.assertEqual(meta.center_freq, 100100)
+
+    @patch("owrx.timeshift.Supervisor")
+    @patch("owrx.timeshift.subprocess.Popen")
+    def testSnapshotIsLimitedToAvailableData(self, popen, supervisor):
+        end = self.writer.getLastWriteTime()
+        snapshot = self.timeShift.snapshot(end - 60, end + 60, 100000, 200)
+        self.assertAlmostEqual(snapshot.start, end - 10)
+        self.assertAlmostEqual(snapshot.end, end)
+
+    def testInvalidSnapshots(self):
+        end = self.writer.getLastWriteTime()
+        with self.assertRaises(TimeShiftException):
+            self.timeShift.snapshot(end - 4, end - 2, 100450, 200)
+        with self.assertRaises(TimeShiftException):
+            self.timeShift.snapshot(end - 2, end - 4, 100000, 200)
+        with self.assertRaises(TimeShiftException):
+            self.timeShift.snapshot(end - 40, end - 20, 100000, 200)
+        self.timeShift.process = None
+        with self.assertRaises(TimeShiftException):
+            self.timeShift.snapshot(end - 4, end - 2, 100000, 200)
+
+    def testFailedSnapshot(self):
+        snapshot = Snapshot(os.path.join(self.dir.name, "failed"), 0, 1, 100000, 100)
+        snapshot.onExit(1)
+        self.assertEqual(snapshot.state, Snapshot.STATE_FAILED)
+        self.assertFalse(SigMF.isRecording(snapshot.path))
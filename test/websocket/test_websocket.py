@@ -0,0 +1,168 @@
+from unittest import TestCase
+from owrx.websocket import (
+    WebSocketConnection,
+    PreparedMessage,
+    PerMessageDeflate,
+    OPCODE_TEXT_MESSAGE,
+    OPCODE_BINARY_MESSAGE,
+)
+import threading
+import socket
+import json
+import zlib
+
+
+class FakeHandler(object):
+    def __init__(self, connection, extensions=None):
+        self.connection = connection
+        self.headers = {"Upgrade": "websocket", "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ=="}
+        if extensions is not None:
+            self.headers["Sec-WebSocket-Extensions"] = extensions
+        self.wfile = connection.makefile("wb", buffering=0)
+
+
+class WebSocketSendTest(TestCase):
+    extensions = None
+
+    def setUp(self):
+        (self.server, self.client) = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+        self.connection = WebSocketConnection(FakeHandler(self.server, self.extensions), None)
+        self.addCleanup(self.connection.cancelPing)
+        self.buffer = b""
+        self.response = self.read_until(b"\r\n\r\n")
+        self.assertTrue(self.response.startswith(b"HTTP/1.1 101"))
+
+    def read_until(self, marker):
+        while marker not in self.buffer:
+            self.buffer += self.client.recv(65536)
+        (result, self.buffer) = self.buffer.split(marker, 1)
+        return result
+
+    def read_exactly(self, length):
+        while len(self.buffer) < length:
+            self.buffer += self.client.recv(65536)
+        (result, self.buffer) = (self.buffer[:length], self.buffer[length:])
+        return result
+
+    def read_frame(self):
+        header = self.read_exactly(2)
+        length = header[1] & 0x7F
+        if length == 126:
+            length = int.from_bytes(self.read_exactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(self.read_exactly(8), "big")
+        return header[0], self.read_exactly(length)
+
+    def testTextMessage(self):
+        self.connection.send({"type": "test", "value": "ä"})
+        (first, payload) = self.read_frame()
+        self.assertEqual(first, 0x80 | OPCODE_TEXT_MESSAGE)
+        self.assertEqual(json.loads(payload.decode("utf-8")), {"type": "test", "value": "ä"})
+
+    def testMediumBinaryMessage(self):
+        data = bytes(range(256)) * 4
+        self.connection.send(data)
+        self.assertEqual(self.read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, data))
+
+    def testPartialWrites(self):
+        # more than the socket buffers can take at once
+        data = bytes(range(256)) * 8192
+        sender = threading.Thread(target=self.connection.send, args=(data,))
+        sender.start()
+        self.assertEqual(self.read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, data))
+        sender.join(5)
+        self.assertTrue(self.connection.open)
+
+    def testMemoryView(self):
+        data = bytearray(b"\x01" * 300)
+        self.connection.send(memoryview(data)[100:])
+        self.assertEqual(self.read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, bytes(data[100:])))
+
+    def testPreparedMessage(self):
+        data = bytes(range(200))
+        message = PreparedMessage(b"\x01", data)
+        self.assertEqual(bytes(message.getPayload()), b"\x01" + data)
+        self.connection.send(message)
+        self.connection.send(message)
+        for _ in range(2):
+            self.assertEqual(self.read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, b"\x01" + data))
+
+    def testUncompressedWithoutOffer(self):
+        self.assertNotIn(b"Sec-WebSocket-Extensions", self.response)
+        data = b"a" * 1000
+        self.connection.send(data)
+        self.assertEqual(self.read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, data))
+
+
+class WebSocketCompressionTest(WebSocketSendTest):
+    extensions = "permessage-deflate; client_max_window_bits"
+
+    def setUp(self):
+        super().setUp()
+        self.inflater = zlib.decompressobj(-15)
+
+    def inflate(self, payload):
+        return self.inflater.decompress(payload + b"\x00\x00\xff\xff")
+
+    def read_frame(self):
+        (first, payload) = super().read_frame()
+        if first & 0x40:
+            return first & ~0x40, self.inflate(payload)
+        return first, payload
+
+    def testUncompressedWithoutOffer(self):
+        self.assertIn(b"Sec-WebSocket-Extensions: permessage-deflate\r\n", self.response)
+
+    def testMessagesAreCompressedWithContextTakeover(self):
+        message = {"type": "config", "value": "x" * 500}
+        for _ in range(2):
+            self.connection.send(message)
+            (first, payload) = super().read_frame()
+            self.assertEqual(first, 0x80 | 0x40 | OPCODE_TEXT_MESSAGE)
+            self.assertLess(len(payload), 100)
+            self.assertEqual(json.loads(self.inflate(payload).decode("utf-8")), message)
+
+    def testExcludedMessagesAreNotCompressed(self):
+        data = b"a" * 1000
+        self.connection.send(data, False)
+        self.assertEqual(super().read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, data))
+        self.connection.send(PreparedMessage(b"\x01", data), False)
+        self.assertEqual(super().read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, b"\x01" + data))
+
+    def testSmallMessagesAreNotCompressed(self):
+        self.connection.send(b"abc")
+        self.assertEqual(super().read_frame(), (0x80 | OPCODE_BINARY_MESSAGE, b"abc"))
+
+
+class PerMessageDeflateTest(TestCase):
+    def testNegotiation(self):
+        self.assertIsNone(PerMessageDeflate.negotiate("x-webkit-deflate-frame", 6))
+        (deflate, response) = PerMessageDeflate.negotiate(
+            "permessage-deflate; server_max_window_bits=8, permessage-deflate; server_no_context_takeover", 6
+        )
+        self.assertEqual(response, "permessage-deflate; server_no_context_takeover")
+        self.assertTrue(deflate.noContextTakeover)
+        (deflate, response) = PerMessageDeflate.negotiate('permessage-deflate; server_max_window_bits="10"', 6)
+        self.assertEqual(response, "permessage-deflate; server_max_window_bits=10")
+        self.assertEqual(deflate.windowBits, 10)
+
+    def testDeclinesUnknownParameters(self):
+        self.assertIsNone(PerMessageDeflate.negotiate("permessage-deflate; unknown_parameter", 6))
+        duplicate = "permessage-deflate; server_no_context_takeover; server_no_context_takeover"
+        self.assertIsNone(PerMessageDeflate.negotiate(duplicate, 6))
+
+    def testNoContextTakeover(self):
+        (deflate, _) = PerMessageDeflate.negotiate("permessage-deflate; server_no_context_takeover", 6)
+        for _ in range(2):
+            # every message can be inflated on its own
+            payload = deflate.compress(b"test" * 100) + PerMessageDeflate.tail
+            self.assertEqual(zlib.decompressobj(-15).decompress(payload), b"test" * 100)
+
+    def testDecompressesClientMessages(self):
+        deflate = PerMessageDeflate(6)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -12)
+        for message in [b"first message", b"first message again"]:
+            payload = compressor.compress(message) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.assertEqual(deflate.decompress(payload[:-4]), message)